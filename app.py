@@ -1,29 +1,53 @@
 # app.py - Flat Earth Wars Main App
-# Version: v0.014
+# Version: v0.026
 # Notes:
+# - Game page runs inside db.unit_of_work() (one DB checkout + commit per rerun)
+# - Player row loaded as db.PlayerState; save() only writes changed fields
+# - Inventory kept as an item bitmask in st.session_state.inventory
+# - Per-rerun SQL stats (query_stats); debug sidebar panel with ?debug=1 or DEBUG_SQL=1
 # - Uses EncryptedCookieManager for persistent login (works across refresh)
-# - Ordered tabs: Profile, Quests, Battles, Clan, Shop, Others
-# - Postgres-ready (no migrate_db needed)
-# - Clan War + Patch players stubs included
+# - Login/register through auth.py (scrypt on a bounded pool); the cookie carries an auth session token,
+#   a restored session is only accepted while that token is live (no KDF on refresh); a backed-up auth pool
+#   shows "try again" instead of crashing the login page
+# - SECTIONS / SECTION_READS live in sections.py (shared with benchmarks/load_test.py --prefetch)
+# - json import dropped (inventory is a bitmask in PlayerState, no items JSON decoded here)
+# - Sidebar navigation: Profile, Quests, Battles, Clan, Shop, Others
+# - Only the selected section runs its render() (st.tabs ran every tab body, and its queries, on each rerun)
+# - Quests / PvP / Boss / Shop / Market widgets are st.fragments that save st.session_state.player_state themselves
+# - quest_engine subscribes to game_events: memes, debates, PvP and boss hits advance quests
+# - Energy is derived on load (PlayerState.load); idle reruns write nothing, last_login is stamped once per login
+# - The rerun's independent reads (player, boss, the selected section's data) are prefetched in parallel
+#   (db.prefetch); the tabs' first calls get the preloaded results
+# - PvP opponents come from the in-memory matchmaking index (no leaderboard read on the Battles section)
+# - Postgres-ready; schema changes applied by migrations.run_migrations() (a failed migration stops the app)
+# - Clan War stub included
 import warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
-import streamlit as st, json
+import streamlit as st, os
 from streamlit_cookies_manager import EncryptedCookieManager
 from db import (
-    init_db, get_player, add_player, patch_old_players, update_player,
-    reset_clan_war, get_player_by_credentials,
-    get_active_boss, spawn_boss
+    init_db,
+    reset_clan_war,
+    get_active_boss, spawn_boss, unit_of_work, PlayerState, record_login, prefetch,
+    get_player
 )
-from game_logic import regenerate_energy
+from sections import SECTIONS, SECTION_READS
+from migrations import run_migrations
+import auth
+from query_stats import track_rerun
+from cache import cache_stats
+import quest_engine  # noqa: F401  (subscribes to game_events)
 
 # --- Import Tabs ---
 from tabs import (
     profile_tab, quests_tab, pvp_tab, boss_battle_tab,
     clan_wars_tab, clan_history_tab, shop_tab,
     leaderboard_tab, battle_log_tab, achievements_tab,
-    market_tab, events_tab, template_tab
+    market_tab, events_tab, template_tab, debug_tab
 )
 
+DEBUG_SQL = os.getenv("DEBUG_SQL") == "1"
+
 # --- Streamlit Page Config ---
 st.set_page_config(
     page_title="Flat Earth Wars",
@@ -43,25 +67,43 @@ if not cookies.ready():
 # --- Init DB ---
 try:
     init_db()
-    patch_old_players()
+    run_migrations()
     db_status = "✅ Connected to Postgres Database"
 except Exception as e:
     db_status = f"❌ Database connection failed: {e}"
-
-# --- Ensure Boss Table + Spawn if Missing ---
-if not get_active_boss():
-    spawn_boss("Globie Overlord 👹", hp=1000, reward_followers=200, reward_points=100)
+    # never run on a half-migrated schema
+    st.error(f"{db_status}\n\nThe database schema could not be brought up to date; the game is unavailable.")
+    st.stop()
 
 # --- Weekly Clan War Reset ---
 winner = reset_clan_war()
 if winner:
     st.success(f"🎉 Weekly reset complete! {winner} received +50 Followers and +5 Energy each!")
 
+def start_session(username):
+    """Log in a verified user: session state, last_login stamp, cookie with a fresh auth token."""
+    st.session_state.logged_in = True
+    st.session_state.username = username
+    record_login(username)
+    cookies["username"] = username  # ✅ persist cookie
+    cookies["token"] = auth.issue_token(username)
+    cookies.save()
+
+def end_session():
+    st.session_state.logged_in = False
+    st.session_state.username = None
+    auth.revoke_token(cookies.get("token"))
+    cookies["username"] = ""   # clear cookie
+    cookies["token"] = ""
+    cookies.save()
+
 # --- Restore session from cookies ---
 if "logged_in" not in st.session_state:
-    if "username" in cookies and cookies["username"]:
+    restored = cookies.get("username")
+    if restored and auth.token_user(cookies.get("token")) == restored:
         st.session_state.logged_in = True
-        st.session_state.username = cookies["username"]
+        st.session_state.username = restored
+        record_login(restored)
     else:
         st.session_state.logged_in = False
         st.session_state.username = None
@@ -78,14 +120,13 @@ if not st.session_state.logged_in:
         login_user = st.text_input("Username", key="login_user")
         login_pass = st.text_input("Password", type="password", key="login_pass")
         if st.button("Login"):
-            player = get_player_by_credentials(login_user, login_pass)
-            if player:
-                st.session_state.logged_in = True
-                st.session_state.username = login_user
-                cookies["username"] = login_user  # ✅ persist cookie
-                cookies.save()
+            verified = auth.check_credentials(login_user, login_pass)
+            if verified:
+                start_session(login_user)
                 st.success(f"✅ Welcome back, {login_user}!")
                 st.rerun()
+            elif verified is None:
+                st.error("⏳ Too many logins right now, please try again in a moment.")
             else:
                 st.error("❌ Invalid username or password.")
 
@@ -96,159 +137,123 @@ if not st.session_state.logged_in:
         reg_clan = st.radio("Choose Your Clan", ["Flat Earthers 🌐", "Globies 🌍"])
         if st.button("Register"):
             if reg_user and reg_pass:
-                add_player(reg_user, reg_pass, reg_clan)
-                st.session_state.logged_in = True
-                st.session_state.username = reg_user
-                cookies["username"] = reg_user  # ✅ persist cookie
-                cookies.save()
-                st.success(f"✅ Account created! Welcome, {reg_user}!")
-                st.rerun()
+                created = auth.register(reg_user, reg_pass, reg_clan)
+                if created:
+                    start_session(reg_user)
+                    st.success(f"✅ Account created! Welcome, {reg_user}!")
+                    st.rerun()
+                elif created is None:
+                    st.error("⏳ Too many sign-ups right now, please try again in a moment.")
+                else:
+                    st.error("❌ That username is taken.")
             else:
                 st.warning("⚠️ Please enter a username and password.")
 
 # --- Game Page ---
 else:
+    # One pooled connection + one commit for the whole rerun, with SQL stats;
+    # the rerun's reads start in parallel right away
     username = st.session_state.username
-    player = get_player(username)
+    reads = SECTION_READS[st.session_state.get("section", SECTIONS[0])](username)
+    with unit_of_work(), track_rerun(username) as sql_stats, \
+            prefetch((get_active_boss,), (get_player, username), *reads):
+        # --- Ensure Boss Table + Spawn if Missing ---
+        if not get_active_boss():
+            spawn_boss("Globie Overlord 👹", hp=1000, reward_followers=200, reward_points=100)
 
-    if not player:
-        st.error("⚠️ Player not found. Please login or register again.")
-        st.session_state.logged_in = False
-        st.session_state.username = None
-        cookies["username"] = ""   # clear cookie
-        cookies.save()
-        st.rerun()
-    else:
-        try:
-            (player_id, username, password, energy, points, level, followers,
-             items_json, last_login, wins, losses, clan) = player
-        except Exception as e:
-            st.error(f"⚠️ DB mismatch: {e}")
-            st.stop()
-
-        try:
-            items = json.loads(items_json) if isinstance(items_json, str) else []
-        except:
-            items = []
-
-        # Energy regen
-        energy, last_login = regenerate_energy(energy, level, last_login)
-
-        # --- Sync with session_state ---
-        st.session_state.energy = energy
-        st.session_state.points = points
-        st.session_state.followers = followers
-        st.session_state.level = level
-        st.session_state.wins = wins
-        st.session_state.losses = losses
-        st.session_state.items = items
-        st.session_state.clan = clan
-        st.session_state.last_login = last_login
-
-        # ✅ Ensure cookie stays updated
-        cookies["username"] = username
-        cookies.save()
-
-        # --- Tabs (Reordered) ---
-        tabs = st.tabs([
-            "📋 Profile",
-            "🎯 Quests",
-            "⚔️ Battles",
-            "🏰 Clan",
-            "🛒 Shop",
-            "📜 Others"
-        ])
-
-        # --- Profile ---
-        with tabs[0]:
-            profile_tab.render(
-                username,
-                st.session_state.energy,
-                st.session_state.points,
-                st.session_state.level,
-                st.session_state.followers,
-                st.session_state.wins,
-                st.session_state.losses,
-                st.session_state.clan,
-                st.session_state.items,
-                st.session_state.last_login
-            )
-
-        # --- Quests ---
-        with tabs[1]:
-            st.session_state.followers, st.session_state.energy, st.session_state.points = quests_tab.render(
-            st.session_state.username,
-            st.session_state.followers,
-            st.session_state.level,
-            st.session_state.energy,
-            st.session_state.points
-        )
-
-        # --- Battles (PvP + Boss + Logs) ---
-        with tabs[2]:
-            st.session_state.energy, st.session_state.points, st.session_state.followers, st.session_state.wins, st.session_state.losses = pvp_tab.render(
-                username, st.session_state.clan, st.session_state.energy,
-                st.session_state.points, st.session_state.followers,
-                st.session_state.items, st.session_state.wins, st.session_state.losses
-            )
-            st.divider()
-            st.session_state.energy, st.session_state.points, st.session_state.followers = boss_battle_tab.render(
-                username, st.session_state.energy, st.session_state.points,
-                st.session_state.followers, st.session_state.items
-            )
-            st.divider()
-            battle_log_tab.render(username)
-
-        # --- Clan (Wars + History) ---
-        with tabs[3]:
-            st.session_state.show_clan = st.radio("Clan Menu", ["⚔️ Clan Wars", "📜 History"])
-            if st.session_state.show_clan == "⚔️ Clan Wars":
-                clan_wars_tab.render()
+        player = PlayerState.load(username)
+
+        if not player:
+            st.error("⚠️ Player not found. Please login or register again.")
+            end_session()
+            st.rerun()
+        else:
+            # --- Sync with session_state ---
+            st.session_state.player_state = player
+            st.session_state.energy = player.energy
+            st.session_state.points = player.points
+            st.session_state.followers = player.followers
+            st.session_state.level = player.level
+            st.session_state.wins = player.wins
+            st.session_state.losses = player.losses
+            st.session_state.inventory = player.inventory  # item bitmask (item_registry)
+            st.session_state.clan = player.clan
+            st.session_state.last_login = player.last_login
+
+            # ✅ Ensure cookie stays updated
+            cookies["username"] = username
+            cookies.save()
+
+            # --- Navigation (only the selected section renders / queries) ---
+            section = st.sidebar.radio("🧭 Navigate", SECTIONS, key="section")
+
+            # --- Profile ---
+            if section == "📋 Profile":
+                profile_tab.render(
+                    username,
+                    st.session_state.energy,
+                    st.session_state.points,
+                    st.session_state.level,
+                    st.session_state.followers,
+                    st.session_state.wins,
+                    st.session_state.losses,
+                    st.session_state.clan,
+                    st.session_state.inventory,
+                    st.session_state.last_login
+                )
+
+            # --- Quests ---
+            elif section == "🎯 Quests":
+                quests_tab.render(username, st.session_state.level)
+
+            # --- Battles (PvP + Boss + Logs) ---
+            elif section == "⚔️ Battles":
+                pvp_tab.render(username, st.session_state.clan)
+                st.divider()
+                boss_battle_tab.render(username)
+                st.divider()
+                battle_log_tab.render(username)
+
+            # --- Clan (Wars + History) ---
+            elif section == "🏰 Clan":
+                st.session_state.show_clan = st.radio("Clan Menu", ["⚔️ Clan Wars", "📜 History"])
+                if st.session_state.show_clan == "⚔️ Clan Wars":
+                    clan_wars_tab.render()
+                else:
+                    clan_history_tab.render()
+
+            # --- Shop (Items + Market) ---
+            elif section == "🛒 Shop":
+                shop_tab.render()
+                st.divider()
+                market_tab.render(username)
+
+            # --- Others (leaderboard, achievements, events, template) ---
             else:
-                clan_history_tab.render()
-
-        # --- Shop (Items + Market) ---
-        with tabs[4]:
-            st.session_state.followers, st.session_state.items = shop_tab.render(
-                st.session_state.followers, st.session_state.items
-            )
-            st.divider()
-            st.session_state.followers, st.session_state.items = market_tab.render(
-                username, st.session_state.followers, st.session_state.items
-            )
-
-        # --- Others (leaderboard, achievements, events, template) ---
-        with tabs[5]:
-            leaderboard_tab.render()
-            st.divider()
-            achievements_tab.render(username)
-            st.divider()
-            events_tab.render()
-            st.divider()
-            st.session_state.followers = template_tab.render(
-                username=username,
-                followers=st.session_state.followers,
-                items=st.session_state.items
-            )
-
-        # --- Save Player ---
-        update_player(
-            username,
-            st.session_state.energy,
-            st.session_state.points,
-            st.session_state.level,
-            st.session_state.followers,
-            st.session_state.items,
-            st.session_state.wins,
-            st.session_state.losses
-        )
-
-        # --- Logout ---
-        with st.sidebar:
-            # st.caption(db_status)
-            if st.button("🚪 Logout"):
-                st.session_state.logged_in = False
-                st.session_state.username = None
-                cookies["username"] = ""  # clear cookie
-                cookies.save()
-                st.rerun()
+                leaderboard_tab.render(username)
+                st.divider()
+                achievements_tab.render(username)
+                st.divider()
+                events_tab.render()
+                st.divider()
+                st.session_state.followers = template_tab.render(
+                    username=username,
+                    followers=st.session_state.followers,
+                    items=st.session_state.inventory
+                )
+
+            # --- Save Player (only the fields that changed, if any) ---
+            player.update_from(st.session_state)
+            player.save()
+
+            # --- SQL debug panel ---
+            if DEBUG_SQL or st.query_params.get("debug") == "1":
+                with st.sidebar:
+                    debug_tab.render(sql_stats.summary(), cache_stats())
+
+            # --- Logout ---
+            with st.sidebar:
+                # st.caption(db_status)
+                if st.button("🚪 Logout"):
+                    end_session()
+                    st.rerun()
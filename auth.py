@@ -0,0 +1,156 @@
+# auth.py - Credentials
+# Version: v0.003
+# Notes:
+# - Passwords stored as scrypt hashes (stdlib hashlib): "scrypt$n$r$p$salt$hash", cost via AUTH_SCRYPT_N
+# - Replaces db.get_player_by_credentials (plaintext compared in SQL)
+# - Verification runs in a bounded thread pool (AUTH_WORKERS): a login storm queues instead of
+#   running one 16 MB / ~50 ms KDF per session thread at once
+# - Constant-time path: unknown users are checked against a dummy hash, legacy plaintext rows run the same
+#   KDF on a dummy salt before their (fixed-length, hmac.compare_digest) comparison
+# - Legacy plaintext rows (and hashes with an old cost) are re-hashed on the first successful login
+# - Verified logins get a session token (in-process TTL cache) that the cookie carries, so a restored
+#   session skips the KDF; unknown/expired tokens (e.g. after a restart) mean logging in again
+# - A KDF that doesn't finish within AUTH_VERIFY_TIMEOUT (pool backed up by a storm) is cancelled and
+#   check_credentials/register return None ("busy, retry") instead of raising
+
+import os, hmac, time, base64, hashlib, secrets, threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from sqlalchemy import select, update
+import db
+
+SCRYPT_N = int(os.getenv("AUTH_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = 8
+SCRYPT_P = 1
+VERIFY_TIMEOUT = float(os.getenv("AUTH_VERIFY_TIMEOUT", "10"))
+TOKEN_TTL = float(os.getenv("AUTH_TOKEN_TTL", str(12 * 3600)))
+MAX_TOKENS = 50_000
+
+_pool = ThreadPoolExecutor(max_workers=int(os.getenv("AUTH_WORKERS", "4")),
+                           thread_name_prefix="auth-kdf")
+_tokens = {}     # token -> (username, expires_at)
+_tokens_lock = threading.Lock()
+
+
+# --- Hashing ---
+def _b64(raw):
+    return base64.b64encode(raw).decode("ascii")
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r + 2 ** 20, dklen=32)
+
+
+_DUMMY_SALT = secrets.token_bytes(16)
+
+
+def hash_password(password):
+    salt = secrets.token_bytes(16)
+    digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+
+
+def is_hashed(stored):
+    return isinstance(stored, str) and stored.startswith("scrypt$")
+
+
+def verify_password(password, stored):
+    """(matches, needs_rehash). Plaintext legacy values always need a rehash."""
+    if not is_hashed(stored):
+        # same work as a hashed row (one full-cost KDF), and a fixed-length comparison
+        _scrypt(password or "", _DUMMY_SALT, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        ok = hmac.compare_digest(hashlib.sha256((password or "").encode("utf-8")).digest(),
+                                 hashlib.sha256((stored or "").encode("utf-8")).digest())
+        return ok and stored is not None, True
+    try:
+        _, n, r, p, salt, digest = stored.split("$")
+        n, r, p = int(n), int(r), int(p)
+        expected = base64.b64decode(digest)
+        actual = _scrypt(password or "", base64.b64decode(salt), n, r, p)
+    except ValueError:
+        return False, False
+    ok = hmac.compare_digest(actual, expected)
+    return ok, ok and (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+# Unknown usernames are checked against this, so they take as long as a wrong password
+_DUMMY_HASH = hash_password(secrets.token_urlsafe(16))
+
+
+# --- Login / register ---
+def _on_pool(fn, *args):
+    """fn(*args) on the auth pool, or None if it didn't finish within VERIFY_TIMEOUT
+    (still queued work is cancelled, so a backed-up pool sheds it instead of running it late)."""
+    future = _pool.submit(fn, *args)
+    try:
+        return future.result(timeout=VERIFY_TIMEOUT)
+    except FutureTimeout:
+        future.cancel()
+        return None
+
+
+def check_credentials(username, password):
+    """True if the password is right, False if not, None if the auth pool is too busy (retry).
+    Runs the KDF on the auth pool; upgrades legacy rows."""
+    p = db.players
+    with db._begin() as conn:
+        stored = conn.execute(select(p.c.password).where(p.c.username == username)).scalar()
+
+    verified = _on_pool(verify_password, password, stored if stored is not None else _DUMMY_HASH)
+    if verified is None:
+        return None
+    ok, needs_rehash = verified
+    ok = ok and stored is not None
+    if ok and needs_rehash:
+        new_hash = _on_pool(hash_password, password)
+        if new_hash is None:
+            return ok   # upgraded on a later login
+        with db._begin() as conn:
+            # conditional: a concurrent login may have upgraded it already
+            conn.execute(update(p).where(p.c.username == username, p.c.password == stored)
+                         .values(password=new_hash))
+    return ok
+
+
+def register(username, password, clan):
+    """Create a player with a hashed password. False if the username is taken,
+    None if the auth pool is too busy (retry)."""
+    hashed = _on_pool(hash_password, password)
+    if hashed is None:
+        return None
+    return db.add_player(username, hashed, clan)
+
+
+# --- Session tokens ---
+def issue_token(username):
+    """Token for a freshly verified login; put it in the cookie."""
+    token = secrets.token_urlsafe(32)
+    now = time.time()
+    with _tokens_lock:
+        if len(_tokens) >= MAX_TOKENS:
+            for key in [k for k, (_, expires) in _tokens.items() if expires <= now]:
+                del _tokens[key]
+            if len(_tokens) >= MAX_TOKENS:
+                del _tokens[next(iter(_tokens))]   # oldest issued
+        _tokens[token] = (username, now + TOKEN_TTL)
+    return token
+
+
+def token_user(token):
+    """Username a live token was issued to, or None (unknown, expired or empty)."""
+    if not token:
+        return None
+    with _tokens_lock:
+        entry = _tokens.get(token)
+        if entry is None:
+            return None
+        username, expires = entry
+        if expires <= time.time():
+            del _tokens[token]
+            return None
+    return username
+
+
+def revoke_token(token):
+    with _tokens_lock:
+        _tokens.pop(token, None)
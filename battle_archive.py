@@ -0,0 +1,216 @@
+# battle_archive.py - Battle History Archival
+# Version: v0.002
+# Notes:
+# - Keeps the hot battles table to the last BATTLE_HOT_DAYS days (get_battle_log only shows the newest 20)
+# - Each older UTC day, oldest first, in one transaction: raw rows exported to Parquet (zstd) under
+#   BATTLE_ARCHIVE_DIR/YYYY/MM/, per-player totals added to battle_daily_summaries, rows removed
+# - Re-running after a crash is safe: a day's file is named after its first battle id and rewritten,
+#   summaries and deletes commit together
+# - Postgres: battles is range-partitioned by day (migrations.py v8); archiving a day drops its partition,
+#   ensure_partitions() creates the upcoming ones, a DEFAULT partition catches anything else
+# - Needs pyarrow for the export (only the archive job imports it)
+# - Run daily: python jobs.py archive-battles
+# - Export sets yield_per per statement (Connection.execution_options() would leave the whole
+#   transaction on server-side cursors on psycopg2)
+
+import os, time, datetime
+from sqlalchemy import select, delete, func, case, literal, union_all, text
+import db
+
+HOT_DAYS = int(os.getenv("BATTLE_HOT_DAYS", "14"))
+ARCHIVE_DIR = os.getenv("BATTLE_ARCHIVE_DIR", os.path.join("archive", "battles"))
+PARTITION_DAYS_AHEAD = 7
+EXPORT_CHUNK = 50_000
+DAY = 86400
+
+COLUMNS = ("id", "attacker", "defender", "outcome", "followers_change", "points_change", "timestamp")
+
+
+# --- Days ---
+def day_start(ts):
+    """Start (epoch seconds) of the UTC day containing ts."""
+    return float(int(ts // DAY) * DAY)
+
+
+def _day_name(start):
+    return datetime.datetime.fromtimestamp(start, datetime.timezone.utc).strftime("%Y-%m-%d")
+
+
+# --- Postgres partitions ---
+def is_partitioned(conn):
+    if conn.dialect.name != "postgresql":
+        return False
+    return conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = 'battles'"
+    )).first() is not None
+
+
+def partition_name(start):
+    return "battles_p" + _day_name(start).replace("-", "")
+
+
+def _partitions(conn):
+    return set(conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = 'battles'"
+    )).scalars())
+
+
+def ensure_partitions(conn, first_day=None, days_ahead=PARTITION_DAYS_AHEAD):
+    """Daily partitions from first_day (default today) to days_ahead days out. Returns how many were made.
+
+    Days that already have rows in the DEFAULT partition are skipped (Postgres refuses
+    a new partition overlapping them); those rows are archived from there.
+    """
+    if not is_partitioned(conn):
+        return 0
+    existing = _partitions(conn)
+    start = day_start(time.time()) if first_day is None else day_start(first_day)
+    end = day_start(time.time()) + days_ahead * DAY
+    created = 0
+    while start <= end:
+        name = partition_name(start)
+        in_default = conn.execute(text(
+            'SELECT 1 FROM battles_default WHERE "timestamp" >= :lo AND "timestamp" < :hi LIMIT 1'
+        ), {"lo": start, "hi": start + DAY}).first()
+        if name not in existing and not in_default:
+            conn.execute(text(
+                f'CREATE TABLE {name} PARTITION OF battles FOR VALUES FROM ({start!r}) TO ({start + DAY!r})'
+            ))
+            created += 1
+        start += DAY
+    return created
+
+
+def partition_battles(conn):
+    """Turn battles into a table range-partitioned by day (Postgres; migrations.py v8).
+
+    The old table is renamed, a partitioned one created in its place (same columns,
+    same id sequence, PK (id, timestamp) since it must include the partition key),
+    partitions made for the hot window + the week ahead, rows copied over.
+    """
+    if conn.dialect.name != "postgresql" or is_partitioned(conn):
+        return False
+    for index in db.battles.indexes:
+        conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+    conn.execute(text("ALTER TABLE battles RENAME TO battles_unpartitioned"))
+    conn.execute(text("ALTER TABLE battles_unpartitioned RENAME CONSTRAINT battles_pkey TO battles_unpartitioned_pkey"))
+    conn.execute(text("ALTER SEQUENCE battles_id_seq OWNED BY NONE"))
+    conn.execute(text(
+        "CREATE TABLE battles ("
+        " id INTEGER NOT NULL DEFAULT nextval('battles_id_seq'),"
+        " attacker VARCHAR, defender VARCHAR, outcome VARCHAR,"
+        " followers_change INTEGER, points_change INTEGER,"
+        ' "timestamp" DOUBLE PRECISION NOT NULL DEFAULT extract(epoch FROM now()),'
+        ' PRIMARY KEY (id, "timestamp")'
+        ') PARTITION BY RANGE ("timestamp")'
+    ))
+    conn.execute(text("CREATE TABLE battles_default PARTITION OF battles DEFAULT"))
+    ensure_partitions(conn, first_day=time.time() - HOT_DAYS * DAY)
+    conn.execute(text(
+        'INSERT INTO battles (id, attacker, defender, outcome, followers_change, points_change, "timestamp") '
+        "SELECT id, attacker, defender, outcome, followers_change, points_change, "
+        'COALESCE("timestamp", 0) FROM battles_unpartitioned'
+    ))
+    conn.execute(text("DROP TABLE battles_unpartitioned"))
+    conn.execute(text("ALTER SEQUENCE battles_id_seq OWNED BY battles.id"))
+    for index in db.battles.indexes:
+        index.create(bind=conn)   # on the parent: Postgres creates it on every partition
+    return True
+
+
+# --- Archive ---
+def _export(conn, start, path):
+    """Write one day's battles to a Parquet file (atomically). Returns the row count."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    b = db.battles
+    schema = pa.schema([
+        ("id", pa.int64()), ("attacker", pa.string()), ("defender", pa.string()),
+        ("outcome", pa.string()), ("followers_change", pa.int32()), ("points_change", pa.int32()),
+        ("timestamp", pa.float64()),
+    ])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    rows = 0
+    # yield_per on this statement only: the same connection goes on to summarize, drop and delete
+    result = conn.execute(
+        select(*[b.c[name] for name in COLUMNS])
+        .where(b.c.timestamp >= start, b.c.timestamp < start + DAY).order_by(b.c.id),
+        execution_options={"yield_per": EXPORT_CHUNK},
+    )
+    with pq.ParquetWriter(tmp, schema, compression="zstd") as writer:
+        for chunk in result.partitions():
+            writer.write_table(pa.Table.from_pylist([dict(zip(COLUMNS, row)) for row in chunk], schema))
+            rows += len(chunk)
+    os.replace(tmp, path)
+    return rows
+
+
+def _summarize(conn, start):
+    """Add one day's per-player totals to battle_daily_summaries (both sides of every battle)."""
+    b, s = db.battles, db.battle_daily_summaries
+    day = (b.c.timestamp >= start) & (b.c.timestamp < start + DAY)
+    won = b.c.outcome == "win"
+    sides = union_all(
+        select(b.c.attacker.label("username"), case((won, 1), else_=0).label("wins"),
+               case((won, 0), else_=1).label("losses"),
+               func.coalesce(b.c.followers_change, 0).label("followers_change"),
+               func.coalesce(b.c.points_change, 0).label("points_change"))
+        .where(day, b.c.attacker.isnot(None)),
+        select(b.c.defender.label("username"), case((won, 0), else_=1).label("wins"),
+               case((won, 1), else_=0).label("losses"),
+               literal(0).label("followers_change"), literal(0).label("points_change"))
+        .where(day, b.c.defender.isnot(None)),
+    ).subquery()
+    totals = select(
+        sides.c.username, literal(_day_name(start)).label("day"),
+        func.sum(sides.c.wins), func.sum(sides.c.losses),
+        func.sum(sides.c.followers_change), func.sum(sides.c.points_change),
+    ).group_by(sides.c.username)
+
+    stmt = db._dialect_insert(s).from_select(
+        ["username", "day", "wins", "losses", "followers_change", "points_change"], totals)
+    conn.execute(stmt.on_conflict_do_update(
+        index_elements=["username", "day"],
+        set_={name: s.c[name] + stmt.excluded[name]
+              for name in ("wins", "losses", "followers_change", "points_change")},
+    ))
+
+
+def archive_battles(now=None, hot_days=HOT_DAYS):
+    """Archive every day older than the hot window. Returns (days, battles) archived."""
+    b = db.battles
+    cutoff = day_start(time.time() if now is None else now) - hot_days * DAY
+    days = battles_moved = 0
+    while True:
+        with db._begin() as conn:
+            oldest = conn.execute(select(func.min(b.c.timestamp)).where(b.c.timestamp < cutoff)).scalar()
+            if oldest is None:
+                break
+            start = day_start(oldest)
+            first_id = conn.execute(select(func.min(b.c.id)).where(
+                b.c.timestamp >= start, b.c.timestamp < start + DAY)).scalar()
+            name = _day_name(start)
+            path = os.path.join(ARCHIVE_DIR, name[:4], name[5:7], f"battles-{name}-{first_id}.parquet")
+
+            battles_moved += _export(conn, start, path)
+            _summarize(conn, start)
+            if is_partitioned(conn) and partition_name(start) in _partitions(conn):
+                conn.execute(text(f"DROP TABLE {partition_name(start)}"))
+            conn.execute(delete(b).where(b.c.timestamp >= start, b.c.timestamp < start + DAY))
+            days += 1
+    with db._begin() as conn:
+        ensure_partitions(conn)
+    return days, battles_moved
+
+
+def get_battle_summaries(username, days=30):
+    """A player's archived daily totals, newest first."""
+    s = db.battle_daily_summaries
+    with db._begin() as conn:
+        return conn.execute(
+            select(s).where(s.c.username == username).order_by(s.c.day.desc()).limit(days)
+        ).fetchall()
@@ -0,0 +1,82 @@
+# boss_stress.py - Concurrent boss attacks against a local database
+# Version: v0.002
+# Notes:
+# - Many threads hammer db.attack_boss until the boss falls, each attack inside a db.unit_of_work() that already
+#   holds a pooled connection (like boss_battle_tab); run with DB_POOL_SIZE=2 DB_MAX_OVERFLOW=0 to check the
+#   flush never needs a second connection from the main pool
+# - Checks: defeat finalized once, every participant paid exactly once, nobody else paid
+# - Needs DATABASE_URL pointing at a local/throwaway database
+#
+# Usage: python benchmarks/boss_stress.py [players] [threads] [boss_hp]
+
+import os, sys, time, random
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select, update
+import db
+
+REWARD_FOLLOWERS, REWARD_POINTS, DMG = 200, 100, 50
+
+def main():
+    n_players = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    n_threads = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    boss_hp = int(sys.argv[3]) if len(sys.argv) > 3 else 20_000
+
+    db.init_db()
+    names = [f"bench_boss_{i}" for i in range(n_players + 20)]
+    for name in names:
+        db.add_player(name, "bench", "Globies 🌍")
+    with db.engine.begin() as conn:
+        conn.execute(update(db.players).where(db.players.c.username.in_(names))
+                     .values(followers=0, points=0))
+    db.spawn_boss("Stress Overlord 👹", hp=boss_hp,
+                  reward_followers=REWARD_FOLLOWERS, reward_points=REWARD_POINTS)
+    boss_id = db.get_active_boss().id
+
+    attackers = names[:n_players]   # the last 20 never attack
+    rng = random.Random(7)
+    latencies = []
+
+    def attack(name):
+        t0 = time.perf_counter()
+        with db.unit_of_work():
+            db.get_player(name)         # the rerun's connection is checked out before the flush
+            result = db.attack_boss(name, DMG)
+        latencies.append(time.perf_counter() - t0)
+        return result
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n_threads) as pool:
+        # keep attacking (well past 0 hp) to prove late hits are harmless
+        jobs = [rng.choice(attackers) for _ in range(boss_hp // DMG * 2)]
+        list(pool.map(attack, jobs))
+    elapsed = time.perf_counter() - start
+
+    with db.engine.begin() as conn:
+        boss_row = conn.execute(select(db.boss).where(db.boss.c.id == boss_id)).fetchone()
+        contributors = {r.username: r for r in conn.execute(
+            select(db.boss_contributions).where(db.boss_contributions.c.boss_id == boss_id))}
+        rows = conn.execute(select(db.players.c.username, db.players.c.followers, db.players.c.points)
+                            .where(db.players.c.username.in_(names))).fetchall()
+
+    assert boss_row.active == 0 and boss_row.hp == 0, boss_row
+    assert sum(c.damage for c in contributors.values()) >= boss_hp
+    for name, followers, points in rows:
+        expected = (REWARD_FOLLOWERS, REWARD_POINTS) if name in contributors else (0, 0)
+        assert (followers, points) == expected, (name, followers, points, expected)
+
+    latencies.sort()
+    print({
+        "attacks": len(jobs),
+        "participants": len(contributors),
+        "seconds": round(elapsed, 3),
+        "attacks_per_sec": round(len(jobs) / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+        "pool": db.engine.pool.status(),
+    })
+    print("✅ boss finalized once, every participant paid exactly once")
+
+if __name__ == "__main__":
+    main()
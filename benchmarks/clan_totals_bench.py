@@ -0,0 +1,72 @@
+# clan_totals_bench.py - GROUP BY over players vs clan_totals read
+# Version: v0.001
+# Notes:
+# - Loads N synthetic players, then times the old full GROUP BY against the clan_totals read
+# - Also checks that incremental totals match the GROUP BY after the load
+# - Needs DATABASE_URL pointing at a local/throwaway database (bench rows are removed afterwards)
+#
+# Usage: python benchmarks/clan_totals_bench.py [sizes...]   (default: 100000 1000000)
+
+import os, sys, time, random
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, delete, select
+import db
+from migrations import run_migrations
+
+CLANS = ["Flat Earthers 🌐", "Globies 🌍"]
+PREFIX = "bench_clan_"
+
+def load_players(n, batch=20_000):
+    rng = random.Random(n)
+    with db.engine.begin() as conn:
+        for start in range(0, n, batch):
+            conn.execute(insert(db.players), [dict(
+                username=f"{PREFIX}{i}", password="bench", energy=10,
+                points=rng.randint(0, 5000), level=1, followers=rng.randint(0, 2000),
+                items="[]", inventory=0, last_login=0.0,
+                wins=rng.randint(0, 50), losses=rng.randint(0, 50), clan=rng.choice(CLANS),
+            ) for i in range(start, min(n, start + batch))])
+    db.rebuild_clan_totals()
+
+def time_query(stmt, repeat=5):
+    best = float("inf")
+    with db.engine.connect() as conn:
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            rows = conn.execute(stmt).fetchall()
+            best = min(best, time.perf_counter() - t0)
+    return best, rows
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [100_000, 1_000_000]
+    run_migrations()
+    for n in sizes:
+        with db.engine.begin() as conn:
+            conn.execute(delete(db.players).where(db.players.c.username.like(f"{PREFIX}%")))
+        load_players(n)
+
+        # a few incremental writes on top, then the two must still agree
+        for i in range(100):
+            state = db.PlayerState.load(f"{PREFIX}{i}")
+            state.update(points=state.points + 7, followers=state.followers - 1)
+            state.save()
+
+        group_s, group_rows = time_query(db.clan_stats_query())
+        totals_s, totals_rows = time_query(select(db.clan_totals))
+        as_dict = lambda rows: {r.clan: (r.members, r.points, r.followers) for r in rows}
+        assert as_dict(group_rows) == as_dict(totals_rows), (group_rows, totals_rows)
+
+        print({
+            "players": n,
+            "group_by_ms": round(group_s * 1000, 2),
+            "clan_totals_ms": round(totals_s * 1000, 3),
+            "speedup": round(group_s / max(totals_s, 1e-9), 1),
+        })
+
+    with db.engine.begin() as conn:
+        conn.execute(delete(db.players).where(db.players.c.username.like(f"{PREFIX}%")))
+    db.rebuild_clan_totals()
+
+if __name__ == "__main__":
+    main()
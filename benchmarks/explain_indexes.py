@@ -0,0 +1,72 @@
+# explain_indexes.py - EXPLAIN regression check for hot lookup paths
+# Version: v0.002
+# Notes:
+# - Runs EXPLAIN on the queries behind the hot db.py helpers, fails if any does a full scan
+# - Postgres: seq scans are disabled for the check, so small test tables still show index plans
+# - SQLite: EXPLAIN QUERY PLAN must say "USING INDEX" / "USING ... PRIMARY KEY"
+# - Market queries come from order_book.py (listings per item by price, open bids per item)
+# - Needs DATABASE_URL pointing at a local/throwaway database
+#
+# Usage: python benchmarks/explain_indexes.py   (exit code 1 on regression)
+
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select, text
+import db
+from migrations import run_migrations
+
+def hot_queries():
+    u = "bench_explain"
+    return {
+        "get_player": select(db.players).where(db.players.c.username == u),
+        "get_battle_log": db.battle_log_query(u),
+        "get_quests": select(db.quests).where(db.quests.c.username == u),
+        "get_achievements": select(db.achievements).where(db.achievements.c.username == u),
+        "get_listings": select(db.market)
+                        .where(db.market.c.status == "active", db.market.c.item == "Telescope 🔭")
+                        .order_by(db.market.c.price, db.market.c.id).limit(11),
+        "best_bid": select(db.buy_orders.c.id)
+                    .where(db.buy_orders.c.status == "open", db.buy_orders.c.item == "Telescope 🔭",
+                           db.buy_orders.c.max_price >= 50)
+                    .order_by(db.buy_orders.c.max_price.desc(), db.buy_orders.c.id).limit(1),
+        "get_active_event": select(db.events).where(db.events.c.active == 1).limit(1),
+    }
+
+def plan(conn, stmt):
+    sql = str(stmt.compile(db.engine, compile_kwargs={"literal_binds": True}))
+    prefix = "EXPLAIN QUERY PLAN " if db.engine.dialect.name == "sqlite" else "EXPLAIN "
+    return [" ".join(str(c) for c in row) for row in conn.execute(text(prefix + sql))]
+
+def _scanned_table(line, marker):
+    if marker not in line:
+        return None
+    return line.split(marker, 1)[1].split(" ")[0]
+
+def full_scans(lines):
+    # only real tables count; scanning a short subquery result (anon_1) is fine
+    tables = set(db.metadata.tables)
+    if db.engine.dialect.name == "sqlite":
+        # "SCAN battles" is a full scan; "SEARCH ..." / "SCAN ... USING INDEX" are not
+        return [l for l in lines if "USING" not in l and _scanned_table(l, "SCAN ") in tables]
+    return [l for l in lines if _scanned_table(l, "Seq Scan on ") in tables]
+
+def main():
+    run_migrations()
+    failures = 0
+    with db.engine.begin() as conn:
+        if db.engine.dialect.name == "postgresql":
+            conn.execute(text("SET LOCAL enable_seqscan = off"))
+        for name, stmt in hot_queries().items():
+            lines = plan(conn, stmt)
+            bad = full_scans(lines)
+            print(f"{'❌' if bad else '✅'} {name}")
+            for line in lines:
+                print(f"     {line}")
+            failures += bool(bad)
+    if failures:
+        print(f"{failures} hot quer{'y' if failures == 1 else 'ies'} fell back to a full scan")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+# load_test.py - Headless load test of the game's rerun data path
+# Version: v0.015
+# Notes:
+# - Simulates N players, each doing R Streamlit reruns (memes, PvP, boss, quests, market, idle)
+# - A rerun replays what app.py + the tabs do against the DB, inside one db.unit_of_work()
+# - Reports p50/p95/p99 rerun latency, queries per rerun (query_stats), DB connections checked out
+# - Also lists the helpers that spent the most DB time across the run
+# - Each rerun only reads the section it is on (app.py sidebar nav); --all-sections replays the old st.tabs behaviour
+# - Quest/boss clicks redraw once more (full st.rerun()); --fragments replays PvP/boss/quest/market clicks
+#   as st.fragment reruns instead (session PlayerState, only the fragment's reads, fragment-only redraw)
+# - Market traffic goes through order_book.py (browse one item, buy a listing or list an owned item)
+# - Quest progress comes from game_events (quest_engine): each action is one collect() batch; quest sets are
+#   generated once in setup (jobs.py daily-quests), a quest click with nothing left does nothing (like quests_tab)
+# - Energy regen is derived by PlayerState.load (no regen write on idle reruns)
+# - --prefetch starts each full rerun's reads in parallel (db.prefetch, like app.py); --rtt-ms adds a
+#   simulated network round trip to every statement (local DBs hide what prefetching saves)
+# - PvP opponents come from matchmaking.find_opponents (like pvp_tab); battles go through db.resolve_pvp
+# - Rankings are built once in setup (jobs.py refresh-rankings), the Others section only reads them
+# - Failed reruns are counted (first few distinct errors in the report) and make the run exit 1
+# - --prefetch uses sections.SECTION_READS, the same table app.py prefetches from
+# - Seeded: same arguments -> same action sequence, so runs are comparable between versions
+# - Needs DATABASE_URL pointing at a local/throwaway database (Postgres or SQLite)
+#
+# Usage: python benchmarks/load_test.py --players 50 --reruns 40 --threads 8 [--all-sections] [--fragments]
+#        [--prefetch] [--rtt-ms 5] [--out run.json]
+
+import os, sys, time, json, random, argparse, logging
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import update, event
+import db
+import ranking
+import order_book
+import matchmaking
+import query_stats
+import sections
+import quest_engine  # noqa: F401  (subscribes to game_events)
+from game_events import collect, emit, QuestCompleted, QuestWorked
+from migrations import run_migrations
+from game_logic import post_meme
+from item_registry import ITEMS, to_names
+
+PREFIX = "bench_load_"
+CLANS = ["Flat Earthers 🌐", "Globies 🌍"]
+
+# Share of reruns per action; the rest are idle reruns (tab switches, refreshes)
+ACTION_MIX = {"meme": 0.15, "pvp": 0.10, "boss": 0.10, "quest": 0.10, "market": 0.05}
+
+# --- One rerun ---
+def _profile(username):
+    db.get_quests(username)
+
+def _quests(username):
+    db.get_quests(username)
+
+def _battles(username):
+    # pvp_tab opponents come from the in-memory matchmaking index (no SQL)
+    db.get_active_boss()                        # boss_battle_tab
+    db.get_battle_log(username)
+
+def _clan(username):
+    db.get_clan_stats()
+    db.get_clan_history(10)
+    db.get_clan_streak()
+    db.get_longest_streaks()                    # clan_history_tab
+
+def _shop(username):
+    order_book.get_book_summary()
+    order_book.get_listings(ITEMS[0])
+    order_book.get_my_orders(username)
+
+def _others(username):
+    # player_rankings is rebuilt by jobs.py refresh-rankings, not on a rerun
+    ranking.get_ranking_page("points", None, None)
+    ranking.get_my_rank(username, "points")
+    db.get_achievements(username)
+    db.get_active_event()
+
+# The reads each app.py section issues when it is the selected one
+SECTION_READS = {
+    "profile": _profile, "quests": _quests, "battles": _battles,
+    "clan": _clan, "shop": _shop, "others": _others,
+}
+# app.py's sidebar label of each section (prefetch calls come from sections.SECTION_READS)
+SECTION_LABELS = {
+    "profile": "📋 Profile", "quests": "🎯 Quests", "battles": "⚔️ Battles",
+    "clan": "🏰 Clan", "shop": "🛒 Shop", "others": "📜 Others",
+}
+assert list(SECTION_LABELS.values()) == sections.SECTIONS, "load_test sections out of step with sections.py"
+# Section a player is on when doing each action
+ACTION_SECTION = {"meme": "profile", "pvp": "battles", "boss": "battles", "quest": "quests", "market": "shop"}
+
+# The reads of the st.fragment an action lives in (tabs/*_tab.py); meme posting has no fragment
+FRAGMENT_READS = {
+    "pvp": lambda username: None,   # matchmaking index, in memory
+    "boss": lambda username: db.get_active_boss(),
+    "quest": _quests,
+    "market": _shop,
+}
+# Clicks that redraw afterwards (st.rerun() / rerun_fragment())
+REDRAW_ACTIONS = {"quest", "boss"}
+
+
+def read_pass(username, state, section=None):
+    """The reads app.py and the tabs issue on a rerun (every section when section is None)."""
+    db.get_active_boss()
+    for name, reads in SECTION_READS.items():
+        if section is None or name == section:
+            reads(username)
+
+
+def do_action(action, username, state, rng, others):
+    with collect() as batch:
+        _do_action(action, username, state, rng, others)
+    if any(isinstance(e, QuestCompleted) for e in batch.results):
+        row = db.get_player(username)
+        state.mark_applied(followers=row.followers, points=row.points)
+
+
+def _do_action(action, username, state, rng, others):
+    if action == "meme":
+        state.energy, state.points, state.followers, _ = post_meme(
+            state.energy, state.points, state.followers, state.inventory, username=username)
+    elif action == "pvp":
+        opponents = matchmaking.find_opponents(username, state.clan, state.points)
+        defender = rng.choice(opponents)[0] if opponents else rng.choice(others)
+        battle = db.resolve_pvp(username, defender, rolls=(rng.randint(0, 20), rng.randint(0, 20)))
+        if battle is not None:
+            row = battle[2]
+            state.mark_applied(points=row.points, followers=row.followers, wins=row.wins, losses=row.losses)
+            state.energy -= 3
+    elif action == "boss":
+        state.energy -= 2
+        db.attack_boss(username, 50)
+    elif action == "quest":
+        quests = [q for q in db.get_quests(username) if not q.completed]
+        if quests:
+            state.energy -= 1
+            emit(QuestWorked(username, kind=rng.choice(quests).quest_type))
+    elif action == "market":
+        listings = [m for m in order_book.get_listings(rng.choice(ITEMS))[0] if m.seller != username]
+        items = to_names(state.inventory)
+        if listings and (rng.random() < 0.5 or not items):
+            result = order_book.buy_listing(rng.choice(listings).id, username)
+        elif items:
+            result = order_book.list_item(username, rng.choice(items), rng.randint(10, 100))
+        else:
+            return
+        if result in (order_book.BOUGHT, order_book.LISTED, order_book.SOLD):
+            row = db.get_player(username)
+            state.mark_applied(followers=row.followers, inventory=row.inventory or 0)
+
+
+def rerun(username, action, rng, others, section, prefetch=False):
+    calls = []
+    if prefetch:
+        calls = [(db.get_active_boss,), (db.get_player, username)]
+        for name in ([section] if section else SECTION_LABELS):
+            calls += sections.SECTION_READS[SECTION_LABELS[name]](username)
+    with db.unit_of_work(), query_stats.track_rerun(username) as stats, db.prefetch(*calls):
+        state = db.PlayerState.load(username)
+        read_pass(username, state, section)
+        if action:
+            do_action(action, username, state, rng, others)
+        state.save()
+        in_use = db.engine.pool.checkedout()
+    return stats, in_use, state
+
+
+def fragment_rerun(username, action, rng, others, state):
+    """A click inside an st.fragment: only its reads + the action, saved via the session PlayerState."""
+    with db.unit_of_work(), query_stats.track_rerun(username) as stats:
+        FRAGMENT_READS[action](username)
+        do_action(action, username, state, rng, others)
+        state.save()
+        in_use = db.engine.pool.checkedout()
+    return stats, in_use
+
+
+def click(username, action, rng, others, section, state, fragments, prefetch=False):
+    """One user interaction, including the redraw rerun some clicks trigger."""
+    t0 = time.perf_counter()
+    if fragments and action in FRAGMENT_READS and state is not None:
+        stats, in_use = fragment_rerun(username, action, rng, others, state)
+        queries, by_helper = stats.queries, dict(stats.by_helper)
+        if action in REDRAW_ACTIONS:
+            with query_stats.track_rerun(username) as redraw:
+                FRAGMENT_READS[action](username)
+            queries += redraw.queries
+    else:
+        stats, in_use, state = rerun(username, action, rng, others, section, prefetch)
+        queries, by_helper = stats.queries, dict(stats.by_helper)
+        if action in REDRAW_ACTIONS:
+            redraw, _, state = rerun(username, None, rng, others, section, prefetch)
+            queries += redraw.queries
+    return (time.perf_counter() - t0, queries, in_use, by_helper, action), state
+
+
+# --- Session / harness ---
+def pick_action(rng):
+    roll, acc = rng.random(), 0.0
+    for action, share in ACTION_MIX.items():
+        acc += share
+        if roll < acc:
+            return action
+    return None
+
+
+def run_session(index, args, names):
+    rng = random.Random(args.seed * 100_003 + index)
+    username = names[index]
+    others = [n for n in names if n != username]
+    samples, errors, state = [], [], None
+    for _ in range(args.reruns):
+        action = pick_action(rng)
+        section = ACTION_SECTION.get(action) or rng.choice(list(SECTION_READS))
+        try:
+            sample, state = click(username, action, rng, others,
+                                  None if args.all_sections else section, state, args.fragments,
+                                  args.prefetch)
+            samples.append(sample)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}".splitlines()[0][:200])
+    return samples, errors
+
+
+def setup(n_players):
+    run_migrations()
+    names = [f"{PREFIX}{i}" for i in range(n_players)]
+    for i, name in enumerate(names):
+        db.add_player(name, "bench", CLANS[i % 2])
+    with db.engine.begin() as conn:
+        conn.execute(update(db.players).where(db.players.c.username.like(f"{PREFIX}%"))
+                     .values(energy=1_000_000, last_login=time.time(), followers=1_000))
+        for i, name in enumerate(names):   # one item each, so there is something to sell
+            conn.execute(update(db.players).where(db.players.c.username == name)
+                         .values(inventory=1 << (i % len(ITEMS))))
+    db.rebuild_clan_totals()
+    db.spawn_boss("Load Test Overlord 👹", hp=10_000_000)
+    db.generate_all_daily_quests()
+    ranking.refresh_rankings()   # what the refresh-rankings job keeps doing
+    return names
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless load test of the rerun data path")
+    parser.add_argument("--players", type=int, default=50)
+    parser.add_argument("--reruns", type=int, default=40)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--all-sections", action="store_true",
+                        help="read every section on each rerun (the old st.tabs layout)")
+    parser.add_argument("--fragments", action="store_true",
+                        help="run action clicks as st.fragment reruns")
+    parser.add_argument("--prefetch", action="store_true",
+                        help="prefetch each full rerun's reads in parallel (db.prefetch)")
+    parser.add_argument("--rtt-ms", type=float, default=0.0,
+                        help="simulated network round trip added to every statement")
+    parser.add_argument("--out", help="write the JSON report here as well")
+    args = parser.parse_args()
+
+    names = setup(args.players)
+    if args.rtt_ms:
+        event.listen(db.engine, "before_cursor_execute", lambda *_: time.sleep(args.rtt_ms / 1000))
+    query_stats.logger.setLevel(logging.WARNING)   # no per-rerun JSON lines during the run
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = list(pool.map(lambda i: run_session(i, args, names), range(args.players)))
+    wall = time.perf_counter() - start
+
+    samples = [s for session, _ in results for s in session]
+    latencies = sorted(s[0] * 1000 for s in samples)
+    queries = [s[1] for s in samples]
+    in_use = [s[2] for s in samples]
+    clicks = [s for s in samples if s[4]]
+    click_latencies = sorted(s[0] * 1000 for s in clicks)
+    helpers = {}
+    for s in samples:
+        for name, entry in s[3].items():
+            total = helpers.setdefault(name, {"count": 0, "ms": 0.0})
+            total["count"] += entry["count"]
+            total["ms"] += entry["ms"]
+    top_helpers = sorted(helpers.items(), key=lambda kv: -kv[1]["ms"])[:8]
+    report = {
+        "backend": db.engine.dialect.name,
+        "players": args.players, "reruns_per_player": args.reruns,
+        "threads": args.threads, "seed": args.seed, "all_sections": args.all_sections,
+        "fragments": args.fragments, "prefetch": args.prefetch, "rtt_ms": args.rtt_ms,
+        "reruns": len(samples),
+        "errors": sum(len(e) for _, e in results),
+        "error_kinds": sorted({msg for _, e in results for msg in e})[:5],
+        "wall_seconds": round(wall, 3),
+        "reruns_per_sec": round(len(samples) / wall, 1),
+        "latency_ms": {p: round(percentile(latencies, int(p[1:])), 2) for p in ("p50", "p95", "p99")},
+        "action_click_ms": {p: round(percentile(click_latencies, int(p[1:])), 2) for p in ("p50", "p95")},
+        "queries_per_action_click": round(sum(s[1] for s in clicks) / max(1, len(clicks)), 2),
+        "queries_per_rerun": {
+            "mean": round(sum(queries) / max(1, len(queries)), 2),
+            "max": max(queries, default=0),
+        },
+        "connections_in_use": {
+            "mean": round(sum(in_use) / max(1, len(in_use)), 2),
+            "max": max(in_use, default=0),
+            "pool_size": db.DB_POOL_SIZE, "max_overflow": db.DB_MAX_OVERFLOW,
+        },
+        "top_helpers_ms": {name: round(v["ms"], 1) for name, v in top_helpers},
+    }
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if report["errors"]:
+        print(f"❌ {report['errors']} reruns failed")
+        sys.exit(1)
+    print(f"✅ {report['reruns']} reruns, no errors")
+
+
+if __name__ == "__main__":
+    main()
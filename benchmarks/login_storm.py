@@ -0,0 +1,93 @@
+# login_storm.py - Login storm against auth.py (e.g. everyone re-logging in after a deploy)
+# Version: v0.002
+# Notes:
+# - N players with legacy plaintext passwords; T session threads log in at once (threading.Barrier)
+# - Round 1 verifies + upgrades every row to a scrypt hash, round 2 is the steady state (hash verify only)
+# - Also times wrong passwords and unknown usernames (should cost the same as a real login)
+# - Overload round: with a tiny AUTH_VERIFY_TIMEOUT every login returns True or None ("busy, retry"), never raises
+# - KDF cost / pool size come from AUTH_SCRYPT_N / AUTH_WORKERS, so budgets can be compared
+# - Needs DATABASE_URL pointing at a local/throwaway database
+#
+# Usage: python benchmarks/login_storm.py [players] [threads]
+
+import os, sys, time, threading
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select, update
+import db
+import auth
+from migrations import run_migrations
+
+PREFIX = "bench_login_"
+
+
+def storm(names, passwords, threads):
+    barrier = threading.Barrier(threads)
+    latencies, results = [], []
+
+    def login(i):
+        if i < threads:
+            barrier.wait()
+        t0 = time.perf_counter()
+        ok = auth.check_credentials(names[i], passwords[i])
+        latencies.append(time.perf_counter() - t0)
+        return ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(login, range(len(names))))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return results, {
+        "logins": len(names), "seconds": round(elapsed, 3),
+        "logins_per_sec": round(len(names) / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 1),
+    }
+
+
+def main():
+    n_players = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    n_threads = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+
+    run_migrations()
+    names = [f"{PREFIX}{i}" for i in range(n_players)]
+    passwords = [f"pw-{i}" for i in range(n_players)]
+    for name in names:
+        db.add_player(name, "x", "Globies 🌍")
+    with db.engine.begin() as conn:   # legacy plaintext rows
+        for name, password in zip(names, passwords):
+            conn.execute(update(db.players).where(db.players.c.username == name).values(password=password))
+
+    results, upgrade = storm(names, passwords, n_threads)
+    assert all(results), "legacy plaintext login failed"
+    with db.engine.begin() as conn:
+        stored = conn.execute(select(db.players.c.password).where(db.players.c.username.in_(names))).scalars().all()
+    assert all(auth.is_hashed(s) for s in stored), "legacy rows not upgraded"
+
+    results, steady = storm(names, passwords, n_threads)
+    assert all(results), "hashed login failed"
+    results, wrong = storm(names, [p + "!" for p in passwords], n_threads)
+    assert not any(results), "wrong password accepted"
+    results, unknown = storm([f"{PREFIX}nobody_{i}" for i in range(n_players)], passwords, n_threads)
+    assert not any(results), "unknown user accepted"
+
+    timeout, auth.VERIFY_TIMEOUT = auth.VERIFY_TIMEOUT, 1e-4    # the pool can't keep up
+    try:
+        results, overload = storm(names, passwords, n_threads)
+    finally:
+        auth.VERIFY_TIMEOUT = timeout
+    assert all(r in (True, None) for r in results), "overloaded login neither verified nor busy"
+    overload["busy"] = results.count(None)
+
+    print({
+        "backend": db.engine.dialect.name,
+        "scrypt_n": auth.SCRYPT_N, "auth_workers": auth._pool._max_workers, "session_threads": n_threads,
+        "upgrade_round": upgrade, "steady_round": steady,
+        "wrong_password": wrong, "unknown_user": unknown, "overload": overload,
+    })
+    print("✅ legacy rows upgraded, hashed logins verified, wrong/unknown rejected, overload answers busy")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# market_stress.py - Concurrent market trading against a local database
+# Version: v0.001
+# Notes:
+# - Phase 1: many buyers hit the same listings at the same instant (threading.Barrier)
+#   -> exactly one purchase per listing, everyone else gets GONE
+# - Phase 2: mixed traffic, sellers listing while buyers buy listings and place buy orders
+# - Checks: followers conserved (balances + followers held by open bids), every item copy is
+#   either in one inventory or escrowed in one active listing, clan_totals still match players
+# - On SQLite concurrent writers can fail with "database is locked"; those trades are counted as
+#   db_busy and must have rolled back completely (the invariants still have to hold)
+# - Needs DATABASE_URL pointing at a local/throwaway database
+#
+# Usage: python benchmarks/market_stress.py [buyers] [threads] [rounds]
+
+import os, sys, time, random, threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select, update, func
+from sqlalchemy.exc import OperationalError
+import db
+import order_book
+from item_registry import ITEMS, to_names
+from migrations import run_migrations
+
+PREFIX = "bench_market_"
+CLANS = ["Flat Earthers 🌐", "Globies 🌍"]
+STARTING_FOLLOWERS = 500
+HOT_LISTINGS = 5
+
+
+def snapshot(names):
+    """(total followers incl. held bids, item copies incl. escrowed listings)."""
+    p, m, b = db.players, db.market, db.buy_orders
+    with db.engine.begin() as conn:
+        rows = conn.execute(select(p.c.followers, p.c.inventory).where(p.c.username.in_(names))).fetchall()
+        held = conn.execute(select(func.coalesce(func.sum(b.c.max_price), 0))
+                            .where(b.c.status == "open", b.c.buyer.in_(names))).scalar()
+        escrowed = conn.execute(select(m.c.item).where(m.c.status == "active", m.c.seller.in_(names))).scalars()
+        copies = Counter(escrowed)
+    for _, inventory in rows:
+        copies.update(to_names(inventory or 0))
+    return sum(f for f, _ in rows) + held, copies
+
+
+def main():
+    n_buyers = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    n_threads = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    rounds = int(sys.argv[3]) if len(sys.argv) > 3 else 400
+
+    run_migrations()
+    sellers = [f"{PREFIX}seller_{i}" for i in range(16)]
+    buyers = [f"{PREFIX}buyer_{i}" for i in range(n_buyers)]
+    names = sellers + buyers
+    for i, name in enumerate(names):
+        db.add_player(name, "bench", CLANS[i % 2])
+    with db.engine.begin() as conn:
+        conn.execute(update(db.market).where(db.market.c.seller.in_(names)).values(status="cancelled"))
+        conn.execute(update(db.buy_orders).where(db.buy_orders.c.buyer.in_(names)).values(status="cancelled"))
+        conn.execute(update(db.players).where(db.players.c.username.in_(sellers))
+                     .values(followers=STARTING_FOLLOWERS, inventory=(1 << len(ITEMS)) - 1))
+        conn.execute(update(db.players).where(db.players.c.username.in_(buyers))
+                     .values(followers=STARTING_FOLLOWERS, inventory=0))
+    db.rebuild_clan_totals()
+    before = snapshot(names)
+
+    # --- Phase 1: everyone rushes the same few listings ---
+    hot = [order_book.list_item(sellers[i], ITEMS[i], 10) for i in range(HOT_LISTINGS)]
+    assert all(r == order_book.LISTED for r in hot), hot
+    hot_ids = [row.id for i in range(HOT_LISTINGS) for row in order_book.get_listings(ITEMS[i])[0]]
+    barrier = threading.Barrier(min(n_threads, len(buyers)))
+
+    def attempt(fn, *args):
+        try:
+            return fn(*args)
+        except OperationalError:
+            return "db_busy"
+
+    def rush(buyer):
+        barrier.wait()
+        return [attempt(order_book.buy_listing, listing_id, buyer) for listing_id in hot_ids]
+
+    with ThreadPoolExecutor(max_workers=min(n_threads, len(buyers))) as pool:
+        results = list(pool.map(rush, buyers[:min(n_threads, len(buyers))]))
+    per_listing = [Counter(r[i] for r in results) for i in range(len(hot_ids))]
+    for counts in per_listing:
+        assert counts[order_book.BOUGHT] == 1 or (counts["db_busy"] and not counts[order_book.BOUGHT]), counts
+        assert set(counts) <= {order_book.BOUGHT, order_book.GONE, "db_busy"}, counts
+
+    # --- Phase 2: mixed traffic ---
+    rng = random.Random(11)
+    outcomes, lock = Counter(), threading.Lock()
+    latencies = []
+
+    def trade(i):
+        local = random.Random(i)
+        t0 = time.perf_counter()
+        if local.random() < 0.3:
+            seller = local.choice(sellers)
+            result = attempt(order_book.list_item, seller, local.choice(ITEMS), local.randint(5, 60))
+        elif local.random() < 0.6:
+            item = local.choice(ITEMS)
+            listings, _ = order_book.get_listings(item)
+            result = (attempt(order_book.buy_listing, local.choice(listings).id, local.choice(buyers))
+                      if listings else "no_listing")
+        else:
+            result = attempt(order_book.place_buy_order, local.choice(buyers), local.choice(ITEMS),
+                             local.randint(5, 60))
+        latencies.append(time.perf_counter() - t0)
+        with lock:
+            outcomes[result] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n_threads) as pool:
+        list(pool.map(trade, [rng.randrange(10**9) for _ in range(rounds)]))
+    elapsed = time.perf_counter() - start
+
+    # --- Invariants ---
+    after = snapshot(names)
+    assert after[0] == before[0], ("followers not conserved", before[0], after[0])
+    assert after[1] == before[1], ("item copies changed", before[1], after[1])
+    with db.engine.begin() as conn:
+        expected = {r.clan: r.followers for r in conn.execute(db.clan_stats_query())}
+        actual = {r.clan: r.followers for r in conn.execute(select(db.clan_totals))}
+    assert all(actual.get(clan) == followers for clan, followers in expected.items()), (expected, actual)
+
+    latencies.sort()
+    print({
+        "backend": db.engine.dialect.name,
+        "rush_buyers": len(results), "hot_listings": len(hot_ids),
+        "rush_outcomes": dict(sum(per_listing, Counter())),
+        "trades": rounds, "outcomes": dict(outcomes),
+        "seconds": round(elapsed, 3),
+        "trades_per_sec": round(rounds / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+    })
+    print("✅ one buyer per listing, followers and items conserved, clan_totals consistent")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# matchmaking_bench.py - Matchmaking index at 1M players
+# Version: v0.002
+# Notes:
+# - Builds a matchmaking.MatchIndex from N synthetic players in memory (no database): build time, RSS
+# - find() latency (p50/p99) over random lookups; every result must be K players of another clan
+# - Incremental upserts (points moving between bands) per second, then the same lookups again
+# - Small DB-backed check: refresh() loads everyone once, then only rows whose updated_at moved
+# - Uses the game's clan names (app.py), so no stray clan_totals row on a shared database
+# - Needs DATABASE_URL pointing at a local/throwaway database for the DB part
+#
+# Usage: python benchmarks/matchmaking_bench.py [players] [lookups] [db_players]
+
+import os, sys, time, random, resource
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, insert
+import db
+import matchmaking
+from migrations import run_migrations
+
+PREFIX = "bench_match_"
+CLANS = ["Globies 🌍", "Flat Earthers 🌐"]
+
+
+def rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def synthetic(n, rng):
+    return [(f"{PREFIX}{i}", CLANS[i % 2], int(rng.paretovariate(1.5) * 100), 0.0) for i in range(n)]
+
+
+def lookups(index, players, n, rng):
+    latencies = []
+    for _ in range(n):
+        name, clan, points, _ = players[rng.randrange(len(players))]
+        t0 = time.perf_counter()
+        found = index.find(name, clan, points, rng=rng)
+        latencies.append(time.perf_counter() - t0)
+        assert len(found) == matchmaking.K, (name, found)
+        assert all(c != clan and other != name for other, c, _ in found), found
+    latencies.sort()
+    return {"p50_us": round(latencies[len(latencies) // 2] * 1e6, 1),
+            "p99_us": round(latencies[int(len(latencies) * 0.99)] * 1e6, 1)}
+
+
+def check_db(n):
+    run_migrations()
+    p = db.players
+    now = time.time()
+    with db.engine.begin() as conn:
+        conn.execute(delete(p).where(p.c.username.like(f"{PREFIX}%")))
+        conn.execute(insert(p), [
+            {"username": f"{PREFIX}{i}", "password": "bench", "clan": CLANS[i % 2], "points": i,
+             "updated_at": now - 3600 - (n - i), "level": 1, "energy": 10, "followers": 0, "wins": 0, "losses": 0}
+            for i in range(n)
+        ])
+    index = matchmaking.MatchIndex()
+    first = matchmaking.refresh(index)
+    idle = matchmaking.refresh(index, force=True)     # nothing new (apart from the skew window)
+    db.update_player(f"{PREFIX}0", energy=10, points=10_000, level=1, followers=0, items=[], wins=0, losses=0)
+    changed = matchmaking.refresh(index, force=True)
+    found = index.find(f"{PREFIX}1", CLANS[1], 10_000)
+    with db.engine.begin() as conn:
+        conn.execute(delete(p).where(p.c.username.like(f"{PREFIX}%")))
+    assert first >= n and idle < n and changed >= 1, (first, idle, changed)
+    assert found and found[0][0] == f"{PREFIX}0", found
+    return {"first_refresh_rows": first, "idle_refresh_rows": idle, "after_update_rows": changed}
+
+
+def main():
+    n_players = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    n_lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+    db_players = int(sys.argv[3]) if len(sys.argv) > 3 else 2_000
+    rng = random.Random(23)
+
+    players = synthetic(n_players, rng)
+    rss_before = rss_mb()
+    index = matchmaking.MatchIndex()
+    t0 = time.perf_counter()
+    index.load(players)
+    build = time.perf_counter() - t0
+    rss_after = rss_mb()
+    before = lookups(index, players, n_lookups, rng)
+
+    moves = n_lookups * 10
+    t0 = time.perf_counter()
+    for _ in range(moves):
+        name, clan, points, _ = players[rng.randrange(n_players)]
+        index.load([(name, clan, points + rng.randint(-500, 500), time.time())])
+    upsert = time.perf_counter() - t0
+    after = lookups(index, players, n_lookups, rng)
+
+    print({
+        "players": len(index), "buckets": len(index._buckets),
+        "build_seconds": round(build, 2), "rss_mb_before_index": rss_before, "rss_mb_with_index": rss_after,
+        "find": before, "upserts_per_sec": round(moves / upsert), "find_after_upserts": after,
+        "db": check_db(db_players),
+    })
+    print("✅ K opponents of another clan per lookup, index kept in step with updated_at")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# pvp_batch_bench.py - Batch PvP vs one-at-a-time pvp_battle
+# Version: v0.001
+# Notes:
+# - Random population, same rolls fed to both engines; results must match exactly
+# - pvp_battle loop timed on a slice and extrapolated (a full 10^6 loop takes a while)
+# - No database needed
+#
+# Usage: python benchmarks/pvp_batch_bench.py [battles] [seed]
+
+import os, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from game_logic import pvp_battle
+import item_registry
+from pvp_batch import resolve_battles, draw_rolls, item_mask
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 42
+    rng = np.random.default_rng(seed)
+
+    atk_points = rng.integers(0, 5000, n)
+    def_points = rng.integers(0, 5000, n)
+    def_followers = rng.integers(0, 10_000, n)
+    atk_items = rng.integers(0, 16, n)   # any combination of the 3 PvP bits + Meme Book
+    def_items = rng.integers(0, 16, n)
+    rolls = draw_rolls(n, rng)
+
+    t0 = time.perf_counter()
+    batch = resolve_battles(atk_points, def_points, def_followers, atk_items, def_items, rolls=rolls)
+    batch_s = time.perf_counter() - t0
+
+    # Scalar engine on a slice, with dict/list inputs just like pvp_tab builds them
+    check = min(n, 100_000)
+    as_list = lambda mask: item_registry.to_names(int(mask))
+    mismatches = 0
+    t0 = time.perf_counter()
+    for i in range(check):
+        attacker = {"points": int(atk_points[i]), "followers": 0, "items": as_list(atk_items[i])}
+        defender = {"points": int(def_points[i]), "followers": int(def_followers[i]),
+                    "items": as_list(def_items[i])}
+        outcome, result = pvp_battle(attacker, defender, rolls=(int(rolls[0][i]), int(rolls[1][i])))
+        f_change = result.get("followers_gain", 0)
+        p_change = result["points_gain"] if outcome == "win" else -result["points_loss"]
+        if ((outcome == "win") != bool(batch["win"][i])
+                or f_change != batch["followers_change"][i]
+                or p_change != batch["points_change"][i]):
+            mismatches += 1
+    loop_s = (time.perf_counter() - t0) * n / check
+
+    assert item_mask(as_list(5)) == 5
+    print({
+        "battles": n,
+        "batch_seconds": round(batch_s, 3),
+        "loop_seconds_est": round(loop_s, 2),
+        "speedup": round(loop_s / batch_s, 1),
+        "attacker_win_rate": round(float(batch["win"].mean()), 4),
+        "checked": check,
+        "mismatches": mismatches,
+    })
+    if mismatches:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# pvp_storm.py - Many attackers hitting one defender through db.resolve_pvp
+# Version: v0.003
+# Notes:
+# - A attacker threads each fight B battles against the same defender, every battle in its own
+#   db.unit_of_work() with the attacker's PlayerState (like pvp_tab: resolve, mark_applied, spend energy, save)
+# - Checks nothing is lost under contention: followers are conserved (what attackers stole is exactly what
+#   the defender lost), every battle row exists once, each attacker's counters match their battles,
+#   the defender's recent_battles ring holds the newest RECENT_BATTLES, clan_totals equals a full GROUP BY
+# - The defender starts with few followers, so it is drained to 0 and later wins steal nothing (the clamp)
+# - Self-attacks and attacks on a missing player are rejected without bumping battle_seq
+# - Uses the game's clan names (app.py), so no stray clan_totals row on a shared database
+# - Needs DATABASE_URL pointing at a local/throwaway database
+#
+# Usage: python benchmarks/pvp_storm.py [attackers] [battles_each]
+
+import os, sys, time, random, threading
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select, update, delete
+import db
+from migrations import run_migrations
+
+PREFIX = "bench_pvp_"
+DEFENDER = f"{PREFIX}defender"
+DEFENDER_FOLLOWERS = 20
+
+
+def setup(n_attackers):
+    run_migrations()
+    p = db.players
+    names = [f"{PREFIX}{i}" for i in range(n_attackers)]
+    with db.engine.begin() as conn:
+        for table, column in ((db.battles, db.battles.c.attacker), (db.recent_battles, db.recent_battles.c.username)):
+            conn.execute(delete(table).where(column.like(f"{PREFIX}%")))
+        conn.execute(delete(p).where(p.c.username.like(f"{PREFIX}%")))
+    db.add_player(DEFENDER, "x", "Flat Earthers 🌐")
+    for name in names:
+        db.add_player(name, "x", "Globies 🌍")
+    with db.engine.begin() as conn:
+        conn.execute(update(p).where(p.c.username == DEFENDER).values(followers=DEFENDER_FOLLOWERS, points=10))
+        conn.execute(update(p).where(p.c.username.in_(names)).values(energy=10 ** 6, energy_ts=time.time()))
+    db.rebuild_clan_totals()
+    return names
+
+
+def storm(names, battles_each):
+    barrier = threading.Barrier(len(names))
+    latencies = []
+
+    def attacker(i):
+        rng = random.Random(i)
+        barrier.wait()
+        for _ in range(battles_each):
+            t0 = time.perf_counter()
+            with db.unit_of_work():
+                state = db.PlayerState.load(names[i])
+                outcome, result, row = db.resolve_pvp(names[i], DEFENDER,
+                                                      rolls=(rng.randint(0, 20), rng.randint(0, 20)))
+                state.mark_applied(points=row.points, followers=row.followers, wins=row.wins, losses=row.losses)
+                state.energy -= 3
+                state.save()
+            latencies.append(time.perf_counter() - t0)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(names)) as pool:
+        list(pool.map(attacker, range(len(names))))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "battles": len(latencies), "seconds": round(elapsed, 3),
+        "battles_per_sec": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 1),
+    }
+
+
+def check(names, battles_each):
+    p, b, r = db.players, db.battles, db.recent_battles
+    total = len(names) * battles_each
+    with db.engine.begin() as conn:
+        defender = conn.execute(select(p).where(p.c.username == DEFENDER)).fetchone()
+        attackers = conn.execute(select(p).where(p.c.username.in_(names))).fetchall()
+        rows = conn.execute(select(b).where(b.c.defender == DEFENDER)).fetchall()
+        ring = conn.execute(select(r.c.seq).where(r.c.username == DEFENDER)).scalars().all()
+        totals = {row.clan: tuple(row[1:]) for row in conn.execute(select(db.clan_totals))}
+        expected = {row.clan: tuple(row[1:]) for row in conn.execute(db.clan_stats_query())}
+
+    stolen = sum(a.followers for a in attackers)
+    assert len(rows) == total, (len(rows), total)
+    assert DEFENDER_FOLLOWERS - defender.followers == stolen == sum(row.followers_change for row in rows), \
+        (DEFENDER_FOLLOWERS - defender.followers, stolen)
+    assert defender.followers >= 0, defender.followers
+    clamped = sum(row.outcome == "win" and row.followers_change == 0 for row in rows)
+    for a in attackers:
+        mine = [row for row in rows if row.attacker == a.username]
+        wins = sum(row.outcome == "win" for row in mine)
+        assert (a.wins, a.losses) == (wins, len(mine) - wins), a
+        assert a.points == sum(row.points_change for row in mine), a
+        assert a.energy == 10 ** 6 - 3 * battles_each, a
+    assert defender.battle_seq == total, defender.battle_seq
+    assert sorted(ring) == list(range(total - min(total, db.RECENT_BATTLES) + 1, total + 1)), sorted(ring)
+    assert totals == expected, (totals, expected)
+    return {"followers_stolen": stolen, "defender_followers_lost": DEFENDER_FOLLOWERS - defender.followers,
+            "wins_with_nothing_left_to_steal": clamped}
+
+
+def check_rejected(name):
+    """A self-attack or a missing defender writes nothing, not even a battle_seq bump."""
+    p = db.players
+    seq = select(p.c.battle_seq).where(p.c.username == name)
+    with db.engine.begin() as conn:
+        before = conn.execute(seq).scalar()
+    assert db.resolve_pvp(name, name) is None
+    assert db.resolve_pvp(name, f"{PREFIX}missing") is None
+    with db.engine.begin() as conn:
+        after = conn.execute(seq).scalar()
+    assert before == after, (before, after)
+
+
+def main():
+    n_attackers = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    battles_each = int(sys.argv[2]) if len(sys.argv) > 2 else 25
+
+    names = setup(n_attackers)
+    result = storm(names, battles_each)
+    print({"backend": db.engine.dialect.name, "attackers": n_attackers, **result, **check(names, battles_each)})
+    check_rejected(names[0])
+    print("✅ no lost updates: followers conserved, every battle recorded once, clan_totals consistent, "
+          "rejected battles write nothing")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# run_local.py - Run the benchmark / check scripts offline on SQLite
+# Version: v0.001
+# Notes:
+# - Each script runs in its own process with DB_BACKEND=sqlite and a fresh SQLite file in a temp dir,
+#   so nothing needs a network, a Postgres server or a .env (DATABASE_URL is ignored in sqlite mode)
+# - Default sizes are small (a smoke run of the whole suite); --full uses each script's own defaults
+# - Prints each script's ✅ summary line (or its last output line) and fails if any script fails
+#
+# Usage: python benchmarks/run_local.py [--full] [--keep] [script ...]
+
+import os, sys, time, tempfile, argparse, subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# script -> arguments for the smoke run
+SMOKE_ARGS = {
+    "energy_model_check.py": ["2000", "500"],
+    "explain_indexes.py": [],
+    "update_count_bench.py": ["20", "20"],
+    "clan_totals_bench.py": ["20000"],
+    "boss_stress.py": ["20", "8"],
+    "market_stress.py": ["20", "8", "2"],
+    "login_storm.py": ["40", "8"],
+    "pvp_batch_bench.py": ["100000"],
+    "pvp_storm.py": ["8", "10"],
+    "matchmaking_bench.py": ["100000", "2000", "500"],
+    "load_test.py": ["--players", "20", "--reruns", "20", "--threads", "4", "--fragments"],
+}
+
+
+def run(script, args, workdir):
+    env = dict(os.environ, DB_BACKEND="sqlite", SQLITE_PATH=os.path.join(workdir, script + ".db"),
+               SQL_LOG_LEVEL=os.getenv("SQL_LOG_LEVEL", "ERROR"))
+    if script == "login_storm.py":
+        env.setdefault("AUTH_SCRYPT_N", str(2 ** 10))   # the storm measures queueing, not the KDF cost
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, os.path.join(HERE, script), *args],
+                          cwd=workdir, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return proc.returncode, time.perf_counter() - t0, (proc.stderr.strip().splitlines() or ["?"])[-1]
+    # the script's ✅ summary line if it prints one, else the last line
+    lines = proc.stdout.strip().splitlines() or ["(no output)"]
+    summary = [l for l in lines if "✅" in l] or [l for l in lines if len(l.strip()) > 3] or ["ok"]
+    return 0, time.perf_counter() - t0, summary[-1][:200]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("scripts", nargs="*", help="subset to run (default: all)")
+    parser.add_argument("--full", action="store_true", help="each script's own default sizes")
+    parser.add_argument("--keep", action="store_true", help="keep the SQLite files")
+    opts = parser.parse_args()
+
+    scripts = opts.scripts or list(SMOKE_ARGS)
+    workdir = tempfile.mkdtemp(prefix="flat_earth_bench_")
+    failed = []
+    for script in scripts:
+        code, seconds, output = run(script, [] if opts.full else SMOKE_ARGS.get(script, []), workdir)
+        print(f"{'✅' if code == 0 else '❌'} {script} ({seconds:.1f}s) {output}")
+        if code != 0:
+            failed.append(script)
+    if not opts.keep:
+        for name in os.listdir(workdir):
+            os.remove(os.path.join(workdir, name))
+        os.rmdir(workdir)
+    else:
+        print("SQLite files kept in", workdir)
+    if failed:
+        print("❌ failed:", ", ".join(failed))
+        sys.exit(1)
+    print(f"✅ {len(scripts)} scripts ran offline on SQLite")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# update_count_bench.py - UPDATE statements per simulated session
+# Version: v0.002
+# Notes:
+# - Compares the old unconditional update_player() save with PlayerState.save()
+# - Each rerun is either an action (meme post) or an idle rerun (tab switch)
+# - Reads the inventory bitmask (PlayerState has no items field since the bitmask change)
+# - Needs DATABASE_URL pointing at a local/throwaway database
+#
+# Usage: python benchmarks/update_count_bench.py [sessions] [reruns] [action_ratio]
+
+import os, sys, random, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+import db
+from game_logic import post_meme
+
+counts = {"updates": 0}
+
+def _count_updates(conn, cursor, statement, parameters, context, executemany):
+    if statement.lstrip().upper().startswith("UPDATE PLAYERS"):
+        counts["updates"] += 1
+
+def simulate(mode, usernames, reruns, action_ratio, seed=42):
+    rng = random.Random(seed)
+    random.seed(seed)
+    counts["updates"] = 0
+    start = time.perf_counter()
+    for username in usernames:
+        for _ in range(reruns):
+            with db.unit_of_work():
+                state = db.PlayerState.load(username)
+                energy, points, followers = state.energy, state.points, state.followers
+                if rng.random() < action_ratio:
+                    energy, points, followers, _msg = post_meme(energy, points, followers, state.inventory)
+
+                if mode == "legacy":
+                    db.update_player(username, energy, points, state.level, followers,
+                                     state.inventory, state.wins, state.losses)
+                else:
+                    state.update(energy=energy, points=points, followers=followers)
+                    state.save()
+    elapsed = time.perf_counter() - start
+    sessions = len(usernames)
+    return {
+        "mode": mode,
+        "updates": counts["updates"],
+        "updates_per_session": round(counts["updates"] / sessions, 2),
+        "seconds": round(elapsed, 3),
+    }
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    reruns = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    action_ratio = float(sys.argv[3]) if len(sys.argv) > 3 else 0.2
+
+    db.init_db()
+    usernames = [f"bench_upd_{i}" for i in range(sessions)]
+    for name in usernames:
+        db.add_player(name, "bench", "Flat Earthers 🌐")
+        # plenty of energy so every action actually changes state
+        db.update_player(name, 10_000, 0, 1, 0, [], 0, 0)
+
+    event.listen(db.engine, "before_cursor_execute", _count_updates)
+    print(f"{sessions} sessions x {reruns} reruns, {action_ratio:.0%} of reruns are actions")
+    for mode in ("legacy", "dirty"):
+        print(simulate(mode, usernames, reruns, action_ratio))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# cache.py - Shared Read Cache
+# Version: v0.002
+# Notes:
+# - Process-wide TTL cache for global, read-mostly queries (same data for every player)
+# - db.py write helpers call invalidate() so players see their own changes right away
+# - Hit/miss counters per group via cache_stats()
+
+import time, threading
+from functools import wraps
+
+_store = {}      # (group, function, args, kwargs) -> (expires_at, value)
+_stats = {}      # group -> {"hits": int, "misses": int, "invalidations": int}
+_lock = threading.Lock()
+
+
+def _group_stats(group):
+    return _stats.setdefault(group, {"hits": 0, "misses": 0, "invalidations": 0})
+
+
+def cached(group, ttl=5.0):
+    """Decorator: cache the function's result for `ttl` seconds, keyed by its arguments."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = (group, fn.__qualname__, args, tuple(sorted(kwargs.items())))
+            now = time.time()
+            with _lock:
+                entry = _store.get(key)
+                if entry and entry[0] > now:
+                    _group_stats(group)["hits"] += 1
+                    return entry[1]
+                _group_stats(group)["misses"] += 1
+
+            value = fn(*args, **kwargs)
+            with _lock:
+                _store[key] = (now + ttl, value)
+            return value
+        return wrapper
+    return decorator
+
+
+def invalidate(*groups):
+    """Drop every cached entry belonging to the given groups."""
+    with _lock:
+        for key in [k for k in _store if k[0] in groups]:
+            del _store[key]
+        for group in groups:
+            _group_stats(group)["invalidations"] += 1
+
+
+def clear():
+    """Drop everything (stats included)."""
+    with _lock:
+        _store.clear()
+        _stats.clear()
+
+
+def cache_stats():
+    """Snapshot of hit/miss counters per group, plus totals."""
+    with _lock:
+        groups = {g: dict(s) for g, s in _stats.items()}
+        size = len(_store)
+    hits = sum(s["hits"] for s in groups.values())
+    misses = sum(s["misses"] for s in groups.values())
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / max(1, hits + misses), 3),
+        "entries": size,
+        "groups": groups,
+    }
@@ -1,24 +1,91 @@
 # db.py - Database Manager for Flat Earth Wars
-# Version: v0.013
+# Version: v0.031
 # Notes:
 # - Postgres + SQLAlchemy (Render + Codespaces ready)
 # - Full helpers for players, battles, quests, achievements, market, events, clan, boss
 # - Includes stubs for reset/patch (for backward compatibility)
+# - unit_of_work(): one pooled connection + one commit per Streamlit rerun
+# - Pool size / overflow / recycle tunable via DB_POOL_* env vars
+# - Global reads (leaderboard, clan, event, boss, market) served from cache.py
+# - PlayerState: dirty-field tracking, writes only changed columns (or nothing)
+# - Boss engine: batched hits, per-participant contributions, one-shot defeat + bulk payout
+# - Indexes for hot lookups declared on the tables; existing DBs get them via migrations.py
+# - players.inventory: item bitmask (item_registry); players.items JSON kept in sync for old readers
+# - player_rankings: materialized leaderboard, rebuilt by the jobs.py refresh-rankings job (ranking.py)
+# - clan_totals: per-clan aggregates kept current by the write paths (rebuild_clan_totals reconciles)
+# - clan_streaks: win streaks maintained by add_clan_history, O(1) get_clan_streak
+# - Every statement is timed/attributed by query_stats (per-rerun summary, slow-query log)
+# - Market: listings indexed by (item, price) + buy_orders; trading logic lives in order_book.py
+# - PlayerState writes inventory as a bit delta (OR added / AND NOT removed), mark_applied() for server-side changes
+# - Daily quests: one set-based INSERT ... SELECT from players x quest_tiers per day (jobs.py daily-quests),
+#   idempotent via quests.quest_day + a unique (username, quest_day, quest_type) index
+# - attack_boss emits game_events.BossAttacked (quest progress, see quest_engine)
+# - Lazy energy: players.energy is the value at players.energy_ts; PlayerState.load derives the current
+#   energy (game_logic.energy_now) without writing, only spending writes; energy_columns() does the same in SQL
+# - PlayerState.refresh_energy(): re-derive energy at the current time (fragments reuse a snapshot across
+#   reruns); save() does it before writing, so spent energy is anchored at the spend time, not the load time
+# - last_login is written once per login/session (record_login), not on every rerun
+# - Credentials moved to auth.py (scrypt hashes); get_player_by_credentials removed, add_player returns
+#   whether the player was created
+# - prefetch(): a rerun's independent reads fan out over a thread pool (DB_PREFETCH_WORKERS), each on its
+#   own pooled connection; @prefetchable helpers hand the preloaded result to their first caller
+#   (only spare pool connections are used, and a read still waiting for one runs inline instead, so a
+#   rerun never blocks on the pool while holding its own connection)
+# - battle_daily_summaries: per-player daily roll-up of archived battles (battle_archive.py); on Postgres
+#   battles is range-partitioned by day (migration 8)
+# - recent_battles: per-player ring of the last RECENT_BATTLES battles (PK username, slot), written by
+#   add_battle for attacker and defender; get_battle_log is one primary-key range read
+# - players.updated_at: stamped by every writer of points/clan (matchmaking.py refreshes from it)
+# - resolve_pvp(): a PvP battle in one transaction -- both player rows locked in username order, the result
+#   applied to both (the defender loses the stolen followers), battle row, rings and clan_totals written;
+#   its game event is dispatched after commit (a subscriber's own transaction would wait on the locks);
+#   the attacker is credited only what the defender actually lost, and self-attacks / missing players are
+#   rejected before battle_seq is bumped
+# - Backend selection: Postgres from DATABASE_URL (sslmode forced, DB_SSLMODE), or DB_BACKEND=sqlite /
+#   a sqlite:// URL for offline dev, tests and benchmarks -- WAL, synchronous=NORMAL, mmap, busy timeout,
+#   pysqlite statement cache; every expression is portable (no func.greatest)
+# - flush_boss_damage runs on boss_engine (one dedicated connection, used under _flush_lock), so concurrent
+#   attackers holding their rerun's connection can't starve the pool the flush needs
+# - clan_totals deltas are queued per transaction and written just before commit in clan order
+#   (_clan_deltas / _savepoint): transactions touching both clans' rows no longer deadlock on Postgres
 
-import os, json, time
+import os, json, time, inspect, threading
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
 from sqlalchemy import (
-    create_engine, Table, Column, Integer, String, Float,
-    Text, MetaData, select, insert, update, delete, func
+    event, create_engine, Table, Column, Integer, BigInteger, String, Float,
+    Text, MetaData, Index, select, insert, update, delete, func, case,
+    literal, cast, and_, or_
 )
 from sqlalchemy.exc import IntegrityError
 from dotenv import load_dotenv
+import cache
+import item_registry
+import query_stats
+import game_events
+from game_logic import energy_now, pvp_battle, ENERGY_REGEN_SECONDS
 
 # --- Load .env for local dev ---
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-if not DATABASE_URL:
-    raise RuntimeError("❌ DATABASE_URL not set. Please add it to your .env or Render.")
+# --- Backend selection ---
+# DB_BACKEND=sqlite runs everything on a local SQLite file (SQLITE_PATH), even if a
+# Postgres DATABASE_URL is set; otherwise the backend follows DATABASE_URL's scheme.
+DB_BACKEND = os.getenv("DB_BACKEND", "").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "flat_earth.db")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 2 ** 20)))  # bytes
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "30"))        # seconds
+SQLITE_CACHED_STATEMENTS = 512
+
+if DB_BACKEND == "sqlite":
+    DATABASE_URL = f"sqlite:///{SQLITE_PATH}"
+elif DB_BACKEND not in ("", "postgres", "postgresql"):
+    raise RuntimeError(f"❌ Unknown DB_BACKEND {DB_BACKEND!r} (use postgres or sqlite).")
+elif not DATABASE_URL:
+    raise RuntimeError("❌ DATABASE_URL not set. Please add it to your .env or Render (or set DB_BACKEND=sqlite).")
 
 # Normalize for psycopg2
 if DATABASE_URL.startswith("postgres://"):
@@ -26,11 +93,49 @@ if DATABASE_URL.startswith("postgres://"):
 elif DATABASE_URL.startswith("postgresql://") and "+psycopg2" not in DATABASE_URL:
     DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+psycopg2://", 1)
 
-# Ensure sslmode
-if "sslmode" not in DATABASE_URL:
-    DATABASE_URL += "?sslmode=require"
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+# Ensure sslmode (Postgres only)
+if not IS_SQLITE and "sslmode" not in DATABASE_URL:
+    DATABASE_URL += ("&" if "?" in DATABASE_URL else "?") + "sslmode=" + os.getenv("DB_SSLMODE", "require")
+
+# --- Connection pool (tunable per deployment) ---
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+def _sqlite_pragmas(dbapi_conn, _record):
+    # WAL: readers don't block the writer (or each other); NORMAL only fsyncs at checkpoints,
+    # which WAL keeps crash-safe (a power cut can lose the last commits, not corrupt the file)
+    cursor = dbapi_conn.cursor()
+    for pragma in ("journal_mode=WAL", "synchronous=NORMAL", f"mmap_size={SQLITE_MMAP_SIZE}",
+                   "temp_store=MEMORY", f"busy_timeout={int(SQLITE_BUSY_TIMEOUT * 1000)}"):
+        cursor.execute(f"PRAGMA {pragma}")
+    cursor.close()
+
+def _create_engine(pool_size, max_overflow):
+    new_engine = create_engine(
+        DATABASE_URL,
+        pool_pre_ping=True,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_timeout=DB_POOL_TIMEOUT,
+        # pooled connections move between threads (unit_of_work, prefetch); pysqlite keeps a
+        # per-connection cache of prepared statements
+        connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT,
+                      "cached_statements": SQLITE_CACHED_STATEMENTS} if IS_SQLITE else {},
+    )
+    if IS_SQLITE:
+        event.listen(new_engine, "connect", _sqlite_pragmas)
+    query_stats.install(new_engine)
+    return new_engine
+
+engine = _create_engine(DB_POOL_SIZE, DB_MAX_OVERFLOW)
+# One connection for the boss flush, used only under _flush_lock: a flush never waits on the
+# main pool while reruns (each holding a main-pool connection) queue behind the lock
+boss_engine = _create_engine(1, 0)
 metadata = MetaData()
 
 # --- Tables ---
@@ -48,6 +153,11 @@ players = Table(
     Column("wins", Integer, default=0),
     Column("losses", Integer, default=0),
     Column("clan", String, default="Flat Earthers 🌐"),
+    Column("inventory", BigInteger, default=0),  # item bitmask, see item_registry
+    Column("energy_ts", Float, default=time.time),  # when `energy` was exact; regen is derived from it
+    Column("battle_seq", Integer, default=0),       # battles appended to recent_battles so far
+    Column("updated_at", Float, default=time.time),  # last points/clan change (matchmaking refresh)
+    Index("ix_players_updated_at", "updated_at"),
 )
 
 battles = Table(
@@ -59,6 +169,9 @@ battles = Table(
     Column("followers_change", Integer),
     Column("points_change", Integer),
     Column("timestamp", Float, default=time.time),
+    # get_battle_log reads each side separately, newest first
+    Index("ix_battles_attacker_ts", "attacker", "timestamp"),
+    Index("ix_battles_defender_ts", "defender", "timestamp"),
 )
 
 quests = Table(
@@ -71,8 +184,38 @@ quests = Table(
     Column("reward", String),
     Column("completed", Integer, default=0),
     Column("timestamp", Float, default=time.time),
+    Column("quest_day", String),   # UTC date the quest was generated for (see quest_day())
+    Index("ix_quests_username_type", "username", "quest_type"),
+    Index("ux_quests_username_day_type", "username", "quest_day", "quest_type", unique=True),
+)
+
+# Daily quest pool per level range: goal/reward = base + per_level * level.
+# Seeded from QUEST_TIERS by seed_quest_tiers(); max_level NULL = no upper bound.
+quest_tiers = Table(
+    "quest_tiers", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("min_level", Integer),
+    Column("max_level", Integer),
+    Column("quest_type", String),
+    Column("goal_base", Integer),
+    Column("goal_per_level", Integer),
+    Column("reward_base", Integer),
+    Column("reward_per_level", Integer),
 )
 
+# (min_level, max_level, quest_type, goal_base, goal_per_level, reward_base, reward_per_level)
+QUEST_TIERS = [
+    (0, 2, "battle", 3, 1, 10, 2),      # requires 3–5 battles
+    (0, 2, "meme", 2, 1, 5, 2),         # requires 2–4 memes
+    (3, 5, "battle", 4, 1, 12, 2),
+    (3, 5, "meme", 3, 1, 6, 2),
+    (3, 5, "debate", 2, 1, 8, 2),
+    (6, None, "battle", 5, 1, 15, 3),
+    (6, None, "meme", 4, 1, 10, 2),
+    (6, None, "debate", 3, 1, 12, 3),
+    (6, None, "boss", 1, 0, 25, 5),
+]
+
 achievements = Table(
     "achievements", metadata,
     Column("id", Integer, primary_key=True),
@@ -80,6 +223,7 @@ achievements = Table(
     Column("badge", String),
     Column("achieved", Integer, default=0),
     Column("timestamp", Float, default=time.time),
+    Index("ix_achievements_username", "username"),
 )
 
 market = Table(
@@ -91,6 +235,23 @@ market = Table(
     Column("status", String, default="active"),
     Column("buyer", String),
     Column("timestamp", Float, default=time.time),
+    Index("ix_market_status_ts", "status", "timestamp"),
+    Index("ix_market_item_price", "status", "item", "price", "id"),
+)
+
+# Standing bids (see order_book.py); max_price is held from the buyer's followers while open
+buy_orders = Table(
+    "buy_orders", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("buyer", String),
+    Column("item", String),
+    Column("max_price", Integer),
+    Column("status", String, default="open"),   # open / filled / cancelled
+    Column("seller", String),
+    Column("price", Integer),                    # fill price
+    Column("timestamp", Float, default=time.time),
+    Index("ix_buy_orders_match", "status", "item", "max_price"),
+    Index("ix_buy_orders_buyer", "buyer", "status"),
 )
 
 events = Table(
@@ -101,6 +262,7 @@ events = Table(
     Column("effect", String),
     Column("active", Integer, default=0),
     Column("timestamp", Float, default=time.time),
+    Index("ix_events_active", "active"),
 )
 
 clan_history = Table(
@@ -108,6 +270,7 @@ clan_history = Table(
     Column("id", Integer, primary_key=True),
     Column("clan", String),
     Column("timestamp", Float),
+    Index("ix_clan_history_ts", "timestamp"),
 )
 
 boss = Table(
@@ -121,95 +284,699 @@ boss = Table(
     Column("active", Integer, default=1),
 )
 
+# Damage dealt per player per boss; the participant list for payouts
+boss_contributions = Table(
+    "boss_contributions", metadata,
+    Column("boss_id", Integer, primary_key=True),
+    Column("username", String, primary_key=True),
+    Column("damage", Integer, default=0),
+    Column("hits", Integer, default=0),
+    Column("rewarded", Integer, default=0),
+)
+
+# Materialized leaderboard (see ranking.py): one row per player, a precomputed
+# rank per sort key, so pages and "my rank" are index lookups instead of sorts
+RANKED_STATS = ("points", "followers", "level", "wins", "losses")
+
+player_rankings = Table(
+    "player_rankings", metadata,
+    Column("username", String, primary_key=True),
+    Column("clan", String),
+    Column("level", Integer),
+    Column("points", Integer),
+    Column("followers", Integer),
+    Column("wins", Integer),
+    Column("losses", Integer),
+    Column("inventory", BigInteger),
+    *[Column(f"rank_{stat}", Integer) for stat in RANKED_STATS],
+    *[Index(f"ix_rankings_{stat}", f"rank_{stat}") for stat in RANKED_STATS],
+    *[Index(f"ix_rankings_clan_{stat}", "clan", f"rank_{stat}") for stat in RANKED_STATS],
+)
+
+# Per-clan aggregates, updated incrementally by every write that changes them.
+# members/points/followers follow the player writes; wins/losses are bumped by
+# resolve_pvp / add_battle (one battle per attacker win/loss).
+# rebuild_clan_totals() recomputes everything as SUM()s over players.
+clan_totals = Table(
+    "clan_totals", metadata,
+    Column("clan", String, primary_key=True),
+    Column("members", Integer, default=0),
+    Column("points", BigInteger, default=0),
+    Column("followers", BigInteger, default=0),
+    Column("wins", Integer, default=0),
+    Column("losses", Integer, default=0),
+)
+
+# Clan war win streaks, one row per clan that ever won; is_leader marks the
+# clan that won the most recent war. Maintained by add_clan_history().
+clan_streaks = Table(
+    "clan_streaks", metadata,
+    Column("clan", String, primary_key=True),
+    Column("current_streak", Integer, default=0),
+    Column("longest_streak", Integer, default=0),
+    Column("is_leader", Integer, default=0),
+)
+
+# Last RECENT_BATTLES battles of each player, both sides; slot = seq % RECENT_BATTLES
+RECENT_BATTLES = 20
+recent_battles = Table(
+    "recent_battles", metadata,
+    Column("username", String, primary_key=True),
+    Column("slot", Integer, primary_key=True),
+    Column("seq", Integer),                # players.battle_seq when written (newest = highest)
+    Column("opponent", String),
+    Column("role", String),                # attack / defend
+    Column("outcome", String),             # win / lose, for this player
+    Column("followers_change", Integer),   # for this player
+    Column("points_change", Integer),
+    Column("timestamp", Float),
+)
+
+# Per-player daily roll-up of battles moved out of the hot table (battle_archive.py)
+battle_daily_summaries = Table(
+    "battle_daily_summaries", metadata,
+    Column("username", String, primary_key=True),
+    Column("day", String, primary_key=True),          # UTC date, YYYY-MM-DD
+    Column("wins", Integer, default=0),                # as attacker or defender
+    Column("losses", Integer, default=0),
+    Column("followers_change", Integer, default=0),    # net, as recorded on the battle rows
+    Column("points_change", Integer, default=0),
+)
+
+# Applied migrations (see migrations.py)
+schema_version = Table(
+    "schema_version", metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String),
+    Column("applied_at", Float),
+)
+
+# --- Unit of Work ---
+# Connection shared by every helper during one rerun (None = no active unit of work)
+_current_conn = ContextVar("flat_earth_conn", default=None)
+# Cache groups written during the unit of work, invalidated again after commit
+_pending_invalidations = ContextVar("flat_earth_invalidations", default=None)
+# clan -> {column: delta} for clan_totals, written just before the transaction commits
+_pending_clan_deltas = ContextVar("flat_earth_clan_deltas", default=None)
+
+@contextmanager
+def unit_of_work():
+    """Share one connection and one transaction across all helpers in this block.
+
+    Wrap a whole Streamlit rerun in it: every db helper called inside reuses the
+    same pooled connection, and everything is committed once at the end.
+    st.rerun()/st.stop() raise control-flow exceptions (not Exception subclasses),
+    so work done before them is still committed; real errors roll back.
+    """
+    conn = _current_conn.get()
+    if conn is not None:  # nested -> join the outer unit of work
+        yield conn
+        return
+
+    conn = engine.connect()
+    trans = conn.begin()
+    token = _current_conn.set(conn)
+    pending = set()
+    pending_token = _pending_invalidations.set(pending)
+    clan_deltas = {}
+    clan_token = _pending_clan_deltas.set(clan_deltas)
+    try:
+        yield conn
+    except Exception:
+        trans.rollback()
+        raise
+    except BaseException:
+        _write_clan_deltas(conn, clan_deltas)
+        trans.commit()
+        raise
+    else:
+        _write_clan_deltas(conn, clan_deltas)
+        trans.commit()
+    finally:
+        _pending_clan_deltas.reset(clan_token)
+        _pending_invalidations.reset(pending_token)
+        _current_conn.reset(token)
+        conn.close()
+        if pending:
+            cache.invalidate(*pending)
+
+@contextmanager
+def _begin():
+    """Connection for a single helper: the active unit of work, or a fresh transaction."""
+    conn = _current_conn.get()
+    if conn is not None:
+        yield conn
+    else:
+        with engine.begin() as conn, _clan_deltas(conn):
+            yield conn
+
+@contextmanager
+def _clan_deltas(conn):
+    """Collect the block's _apply_clan_delta calls; write them, in clan order, when it ends cleanly.
+
+    clan_totals has one hot row per clan. Taking those row locks last, just
+    before commit and always in the same order, means two transactions that
+    touch both clans can't deadlock each other (or anything that locks
+    players rows), and the locks are held only for the commit.
+    """
+    pending = {}
+    token = _pending_clan_deltas.set(pending)
+    try:
+        yield
+    finally:
+        _pending_clan_deltas.reset(token)
+    _write_clan_deltas(conn, pending)
+
+@contextmanager
+def _savepoint(conn):
+    """conn.begin_nested() that also forgets the clan deltas collected inside it if it rolls back."""
+    pending = _pending_clan_deltas.get()
+    saved = {clan: dict(deltas) for clan, deltas in pending.items()} if pending is not None else None
+    try:
+        with conn.begin_nested():
+            yield
+    except BaseException:
+        if pending is not None:
+            pending.clear()
+            pending.update(saved)
+        raise
+
+def _invalidate(*groups):
+    """Drop cached reads now and, inside a unit of work, once more after commit
+    (another session may refill the cache from pre-commit data in between)."""
+    cache.invalidate(*groups)
+    pending = _pending_invalidations.get()
+    if pending is not None:
+        pending.update(groups)
+
+# --- Prefetch (parallel independent reads) ---
+PREFETCH_WORKERS = int(os.getenv("DB_PREFETCH_WORKERS", "4"))
+# pool connections prefetching always leaves to unit_of_work checkouts (other sessions' reruns)
+PREFETCH_RESERVE = int(os.getenv("DB_PREFETCH_RESERVE", "2"))
+_prefetch_pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="db-prefetch")
+# (helper, bound arguments) -> _Prefetch, for the active prefetch() block
+_prefetched = ContextVar("flat_earth_prefetched", default=None)
+_INLINE = object()   # a prefetch that gave up: the caller reads inline
+
+class _Prefetch:
+    """One prefetched read. Whoever comes first decides who runs it: the worker once it
+    has a connection, or the caller (on its own connection) while the worker is still
+    queued or waiting for the pool -- so a rerun never blocks on a pool checkout."""
+
+    def __init__(self, helper, args):
+        self.lock = threading.Lock()
+        self.state = "waiting"    # -> "running" (worker) / "abandoned" (caller)
+        self.future = _prefetch_pool.submit(copy_context().run, self._run, helper.__wrapped__, args)
+
+    def _run(self, fn, args):
+        # Own connection / transaction: a Connection must not be shared between threads
+        _pending_invalidations.set(None)
+        _prefetched.set(None)
+        try:
+            conn = engine.connect()
+        except Exception:
+            with self.lock:
+                self.state = "abandoned"
+            return _INLINE
+        with self.lock:
+            if self.state == "abandoned":
+                conn.close()
+                return _INLINE
+            self.state = "running"
+        try:
+            with conn.begin():
+                _current_conn.set(conn)
+                return fn(*args)
+        finally:
+            _current_conn.set(None)
+            conn.close()
+
+    def take(self):
+        """Claim the read for the caller if the worker hasn't started it (True)."""
+        with self.lock:
+            if self.state == "waiting":
+                self.state = "abandoned"
+                self.future.cancel()
+                return True
+            return self.state == "abandoned"
+
+    def cancel(self):
+        self.take()
+
+def _prefetch_key(helper, args, kwargs):
+    bound = inspect.signature(helper).bind(*args, **kwargs)
+    bound.apply_defaults()
+    return helper, tuple(bound.arguments.items())
+
+def _spare_connections():
+    return DB_POOL_SIZE + DB_MAX_OVERFLOW - engine.pool.checkedout() - PREFETCH_RESERVE
+
+def prefetchable(fn):
+    """Read helper prefetch() can run ahead of time. The first call with the same
+    arguments gets the preloaded result; later calls read normally (after a write
+    in the same rerun they must see it)."""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        memo = _prefetched.get()
+        if memo:
+            task = memo.pop(_prefetch_key(wrapper, args, kwargs), None)
+            if task is not None and not task.take():
+                result = task.future.result()
+                if result is not _INLINE:
+                    return result
+        return fn(*args, **kwargs)
+    return wrapper
+
+@contextmanager
+def prefetch(*calls):
+    """Start (helper, *args) reads in parallel; the block's first matching calls get the results.
+
+    Each read runs in a copy of this context (query_stats keeps counting it for the
+    rerun) on its own pooled connection, so the rerun pays for the slowest read
+    rather than the sum. Only as many reads start as the pool has spare connections
+    (minus DB_PREFETCH_RESERVE); a read whose worker hasn't got a connection by the
+    time it is needed runs inline on the rerun's connection instead. Reads nobody
+    asked for are cancelled if not started yet.
+    """
+    memo = _prefetched.get()
+    outer = memo is not None
+    if not outer:
+        memo = {}
+    spare = _spare_connections()
+    for helper, *args in calls:
+        key = _prefetch_key(helper, args, {})
+        if key not in memo and spare > 0:
+            memo[key] = _Prefetch(helper, args)
+            spare -= 1
+    if outer:   # nested -> the outer block owns the memo
+        yield
+        return
+    token = _prefetched.set(memo)
+    try:
+        yield
+    finally:
+        _prefetched.reset(token)
+        for task in memo.values():
+            task.cancel()
+
+def _dialect_insert(table):
+    """INSERT construct with ON CONFLICT support for the current backend."""
+    if IS_SQLITE:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    return dialect_insert(table)
+
 # --- Init ---
+_db_initialized = False
+
 def init_db():
+    # create_all inspects every table, so only do it once per process
+    global _db_initialized
+    if _db_initialized:
+        return
     metadata.create_all(engine)
+    _db_initialized = True
 
 # --- Player ---
+@prefetchable
 def get_player(username):
-    with engine.begin() as conn:
+    with _begin() as conn:
         return conn.execute(select(players).where(players.c.username == username)).fetchone()
 
-def get_player_by_credentials(username, password):
-    with engine.begin() as conn:
-        return conn.execute(
-            select(players).where(
-                (players.c.username == username) & (players.c.password == password)
-            )
-        ).fetchone()
+def record_login(username):
+    """Stamp last_login (once per login / restored session, not per rerun)."""
+    with _begin() as conn:
+        conn.execute(update(players).where(players.c.username == username).values(last_login=time.time()))
+
+def energy_columns(now=None):
+    """game_logic.energy_now() as SQL over players rows: (energy, energy_ts) expressions.
+
+    For bulk reads and set-based writes. Portable: CASE + CAST only (no GREATEST/FLOOR).
+    """
+    now = time.time() if now is None else now
+    p = players
+    cap = 10 + p.c.level * 5
+    ts = func.coalesce(p.c.energy_ts, p.c.last_login, now)
+    elapsed = (literal(now) - ts) / ENERGY_REGEN_SECONDS
+    # floor() of a non-negative value: CAST truncates on SQLite but rounds on Postgres
+    ticks = case((ts >= now, 0),
+                 else_=cast(elapsed, Integer) - case((cast(elapsed, Integer) > elapsed, 1), else_=0))
+    energy = case((p.c.energy >= cap, p.c.energy),
+                  (p.c.energy + ticks >= cap, cap),
+                  else_=p.c.energy + ticks)
+    energy_ts = case((p.c.energy + ticks >= cap, literal(now)),
+                     else_=ts + ticks * ENERGY_REGEN_SECONDS)
+    return energy.label("energy"), energy_ts.label("energy_ts")
 
 def add_player(username, password, clan):
-    with engine.begin() as conn:
+    """Create a player (password stored as given: pass auth.hash_password() output,
+    or use auth.register). False if the username is taken."""
+    with _begin() as conn:
         try:
-            conn.execute(insert(players).values(
-                username=username, password=password,
-                energy=10, points=0, level=1, followers=0,
-                items="[]", last_login=time.time(),
-                wins=0, losses=0, clan=clan
-            ))
+            # savepoint: a duplicate username must not abort a shared unit of work
+            with _savepoint(conn):
+                conn.execute(insert(players).values(
+                    username=username, password=password,
+                    energy=10, points=0, level=1, followers=0,
+                    items="[]", inventory=0, last_login=time.time(), energy_ts=time.time(),
+                    updated_at=time.time(),
+                    wins=0, losses=0, clan=clan
+                ))
         except IntegrityError:
-            pass
+            return False
+        else:
+            _generate_daily_quests(conn, username)
+            stmt = _dialect_insert(clan_totals)
+            conn.execute(stmt.values(
+                clan=clan, members=1, points=0, followers=0, wins=0, losses=0
+            ).on_conflict_do_update(
+                index_elements=["clan"],
+                set_={"members": clan_totals.c.members + 1},
+            ))
+    _invalidate("leaderboard", "clan_stats")
+    return True
 
-def update_player(username, energy, points, level, followers, items, wins, losses):
+def _items_json(items):
     # Ensure items is always a JSON string
     try:
         if isinstance(items, (list, dict)):
-            items = json.dumps(items)
+            return json.dumps(items)
         elif isinstance(items, str):
             # already JSON string
-            pass
-        else:
-            # fallback in case items is wrong type (e.g. method, None, int)
-            items = "[]"
+            return items
+        # fallback in case items is wrong type (e.g. method, None, int)
+        return "[]"
     except Exception:
-        items = "[]"
+        return "[]"
+
+def update_player(username, energy, points, level, followers, items, wins, losses):
+    # items: inventory mask, list of names or JSON string
+    inventory = item_registry.to_mask(items)
+    items = _items_json(item_registry.to_names(inventory))
 
-    with engine.begin() as conn:
+    with _begin() as conn:
+        old = conn.execute(
+            select(players.c.clan, players.c.points, players.c.followers)
+            .where(players.c.username == username)
+        ).fetchone()
+        if old:
+            _apply_clan_delta(conn, old.clan, points=points - old.points,
+                              followers=followers - old.followers)
         conn.execute(update(players).where(players.c.username == username).values(
             energy=energy,
+            energy_ts=time.time(),
+            updated_at=time.time(),
             points=points,
             level=level,
             followers=followers,
             items=items,
+            inventory=inventory,
             wins=wins,
             losses=losses,
             last_login=time.time()
         ))
+    _invalidate("leaderboard", "clan_stats")
+
+# --- Player State (dirty tracking) ---
+class PlayerState:
+    """Snapshot of a players row that remembers what changed since it was loaded.
+
+    save() issues one UPDATE for the changed columns only, or nothing at all.
+    Counters are written as deltas (followers = followers + n), and the
+    inventory as added/removed bits, so changes made by other sessions in the
+    meantime are not overwritten.
+
+    energy is the current (regenerated) value; loading never writes it back.
+    When it is spent, save() stores it with energy_ts, the time of the last
+    whole regen tick, so partial progress towards the next point is kept.
+    A snapshot kept across reruns is brought up to date by refresh_energy()
+    (save() calls it first, so the anchor is never older than the spend).
+    """
+    COUNTERS = ("points", "followers", "wins", "losses")
+    FIELDS = ("energy", "level", "inventory", "last_login") + COUNTERS
+
+    def __init__(self, username, clan, **values):
+        object.__setattr__(self, "username", username)
+        object.__setattr__(self, "clan", clan)
+        object.__setattr__(self, "_snapshot", {f: values[f] for f in self.FIELDS})
+        object.__setattr__(self, "_values", {f: values[f] for f in self.FIELDS})
+        object.__setattr__(self, "energy_ts", values.get("energy_ts"))
+
+    @classmethod
+    def load(cls, username):
+        """Load a player row as a PlayerState, or None if the player does not exist."""
+        row = get_player(username)
+        if not row:
+            return None
+        energy, energy_ts = energy_now(row.energy, row.level,
+                                       row.energy_ts if row.energy_ts is not None else row.last_login)
+        return cls(
+            row.username, row.clan,
+            energy=energy, energy_ts=energy_ts, level=row.level, inventory=row.inventory or 0,
+            last_login=row.last_login,
+            points=row.points, followers=row.followers, wins=row.wins, losses=row.losses,
+        )
+
+    def __getattr__(self, name):
+        if name in PlayerState.FIELDS:
+            return self._values[name]
+        raise AttributeError(name)
 
+    def __setattr__(self, name, value):
+        if name not in self.FIELDS:
+            raise AttributeError(f"PlayerState has no field {name!r}")
+        self._values[name] = value
+
+    def update(self, **values):
+        for name, value in values.items():
+            setattr(self, name, value)
+
+    def update_from(self, mapping):
+        """Pick up every tracked field present in a dict-like (e.g. st.session_state)."""
+        self.update(**{f: mapping[f] for f in self.FIELDS if f in mapping})
+
+    def mark_applied(self, **values):
+        """Record values a db helper already wrote to the row (save() won't write them again).
+
+        Changes made here and not saved yet stay pending on top: counters keep
+        their delta, the inventory its added/removed bits.
+        """
+        for name, value in values.items():
+            old, current = self._snapshot[name], self._values[name]
+            if name in self.COUNTERS:
+                current = value + (current - old)
+            elif name == "inventory":
+                current = (value | (current & ~old)) & ~(old & ~current)
+            elif current == old:
+                current = value
+            self._snapshot[name] = value
+            self._values[name] = current
+
+    def refresh_energy(self, now=None):
+        """Re-derive energy at `now` from the stored (energy, energy_ts); unsaved spending stays on top."""
+        if self.energy_ts is None:
+            return self.energy
+        stored, anchor = energy_now(self._snapshot["energy"], self._snapshot["level"], self.energy_ts, now)
+        pending = self._values["energy"] - self._snapshot["energy"]
+        self._snapshot["energy"] = stored
+        self._values["energy"] = stored + pending
+        object.__setattr__(self, "energy_ts", anchor)
+        return self.energy
+
+    def dirty(self):
+        """Fields whose value differs from the loaded snapshot -> new value."""
+        return {f: v for f, v in self._values.items() if v != self._snapshot[f]}
+
+    def save(self):
+        """Write the changed columns. Returns True if an UPDATE was issued."""
+        if self._values["energy"] != self._snapshot["energy"]:
+            self.refresh_energy()   # anchor the spend now, not at load time
+        changed = self.dirty()
+        if not changed:
+            return False
+
+        values = {}
+        for name, value in changed.items():
+            if name in self.COUNTERS:
+                values[name] = players.c[name] + (value - self._snapshot[name])
+            elif name == "inventory":
+                added, removed = value & ~self._snapshot[name], self._snapshot[name] & ~value
+                mask = func.coalesce(players.c.inventory, 0)
+                if added:
+                    mask = mask.op("|")(added)
+                if removed:
+                    mask = mask.op("&")(~removed)
+                values[name] = mask
+                values["items"] = _items_json(item_registry.to_names(value))  # legacy readers
+            else:
+                values[name] = value
+        if "energy" in changed and self.energy_ts is not None:
+            values["energy_ts"] = self.energy_ts
+        if "points" in changed:
+            values["updated_at"] = time.time()
+
+        with _begin() as conn:
+            conn.execute(update(players).where(players.c.username == self.username).values(**values))
+            _apply_clan_delta(conn, self.clan, **{
+                f: changed[f] - self._snapshot[f] for f in ("points", "followers") if f in changed
+            })
+        self._snapshot.update(changed)
+        _invalidate("leaderboard", "clan_stats")
+        return True
+
+@prefetchable
+@cache.cached("leaderboard", ttl=10)
 def get_leaderboard(order_by="points"):
     if order_by not in ["points", "followers", "level", "wins", "losses"]:
         order_by = "points"
-    with engine.begin() as conn:
+    with _begin() as conn:
         return conn.execute(
             select(players).order_by(getattr(players.c, order_by).desc()).limit(20)
         ).fetchall()
 
 # --- Battles ---
 def add_battle(attacker, defender, outcome, followers_change, points_change):
-    with engine.begin() as conn:
+    now = time.time()
+    with _begin() as conn:
         conn.execute(insert(battles).values(
             attacker=attacker, defender=defender, outcome=outcome,
             followers_change=followers_change, points_change=points_change,
-            timestamp=time.time()
+            timestamp=now
         ))
+        _append_recent(conn, [
+            (attacker, dict(opponent=defender, role="attack", outcome=outcome,
+                            followers_change=followers_change, points_change=points_change, timestamp=now)),
+            (defender, dict(opponent=attacker, role="defend", outcome="lose" if outcome == "win" else "win",
+                            followers_change=0, points_change=0, timestamp=now)),
+        ])
+        attacker_clan = conn.execute(select(players.c.clan).where(players.c.username == attacker)).scalar()
+        _apply_clan_delta(conn, attacker_clan, **{"wins" if outcome == "win" else "losses": 1})
+    _invalidate("leaderboard", "clan_stats")
+
+def resolve_pvp(attacker, defender, rolls=None):
+    """Fight one PvP battle and write it to both players in one transaction.
+
+    Both rows are locked (username order, so two players attacking each other
+    can't deadlock) and the battle is fought on their current stats: the
+    attacker gains exactly the followers the defender loses (the steal is
+    clamped to what the defender has), the attacker's points/wins/losses move,
+    and the battle row, both recent_battles rings and clan_totals are written
+    alongside.
+    Returns (outcome, result, attacker_row) -- pvp_battle's outcome and details
+    (followers_gain / message adjusted to the clamped steal) plus the attacker's
+    new (points, followers, wins, losses) for PlayerState.mark_applied -- or
+    None for a self-attack or a missing player (rejected before anything is
+    locked or written).
+    Energy stays with the caller's PlayerState. pvp_battle's PvpBattleFought is
+    dispatched after the transaction (or joins the caller's game_events batch),
+    never while the row locks are held.
+    """
+    if attacker == defender:
+        return None
+    now = time.time()
+    with game_events.collect(), _begin() as conn:
+        # checked before locking: the lock bumps battle_seq, a rejected battle must not
+        found = conn.execute(select(func.count()).select_from(players)
+                             .where(players.c.username.in_([attacker, defender]))).scalar()
+        if found != 2:
+            return None
+        locked = _lock_for_battle(conn, [attacker, defender])
+        atk, dfn = locked[attacker], locked[defender]
+        outcome, result = pvp_battle(
+            {"username": attacker, "points": atk.points or 0, "followers": atk.followers or 0,
+             "items": atk.inventory or 0},
+            {"username": defender, "points": dfn.points or 0, "followers": dfn.followers or 0,
+             "items": dfn.inventory or 0},
+            rolls=rolls,
+        )
+        if outcome == "win":
+            points_change, column = result["points_gain"], "wins"
+            taken = min(result["followers_gain"], dfn.followers or 0)
+            if taken != result["followers_gain"]:   # steal is at least 1, the defender may have less
+                result = dict(result, followers_gain=taken,
+                              message=f"🏆 Victory! You stole {taken} followers and gained {points_change} points.")
+        else:
+            taken, points_change, column = 0, -result["points_loss"], "losses"
+
+        attacker_row = conn.execute(
+            update(players).where(players.c.username == attacker).values(
+                points=func.coalesce(players.c.points, 0) + points_change,
+                followers=func.coalesce(players.c.followers, 0) + taken,
+                **{column: func.coalesce(players.c[column], 0) + 1},
+                updated_at=now,
+            ).returning(players.c.points, players.c.followers, players.c.wins, players.c.losses)
+        ).fetchone()
+        if taken:
+            conn.execute(update(players).where(players.c.username == defender)
+                         .values(followers=players.c.followers - taken))
+
+        conn.execute(insert(battles).values(
+            attacker=attacker, defender=defender, outcome=outcome,
+            followers_change=taken, points_change=points_change, timestamp=now
+        ))
+        _write_recent(conn, attacker, atk.battle_seq, dict(
+            opponent=defender, role="attack", outcome=outcome,
+            followers_change=taken, points_change=points_change, timestamp=now))
+        _write_recent(conn, defender, dfn.battle_seq, dict(
+            opponent=attacker, role="defend", outcome="lose" if outcome == "win" else "win",
+            followers_change=-taken, points_change=0, timestamp=now))
+
+        _apply_clan_delta(conn, atk.clan, points=points_change, followers=taken, **{column: 1})
+        _apply_clan_delta(conn, dfn.clan, followers=-taken)
+    _invalidate("leaderboard", "clan_stats")
+    return outcome, result, attacker_row
 
+def _lock_for_battle(conn, usernames):
+    """Bump battle_seq on each player row, in username order, and read it back.
+
+    The UPDATE takes the row lock (Postgres) or the write lock (SQLite) before
+    anything is read, so concurrent battles on the same player queue up and
+    each sees the previous one's result. Returns {username: row} with
+    battle_seq (this battle's recent_battles seq), clan, points, followers,
+    inventory; players that don't exist are left out.
+    """
+    locked = {}
+    for username in sorted({u for u in usernames if u is not None}):
+        row = conn.execute(
+            update(players).where(players.c.username == username)
+            .values(battle_seq=func.coalesce(players.c.battle_seq, 0) + 1)
+            .returning(players.c.battle_seq, players.c.clan, players.c.points,
+                       players.c.followers, players.c.inventory)
+        ).fetchone()
+        if row is not None:
+            locked[username] = row
+    return locked
+
+def _write_recent(conn, username, seq, values):
+    stmt = _dialect_insert(recent_battles).values(
+        username=username, slot=seq % RECENT_BATTLES, seq=seq, **values)
+    conn.execute(stmt.on_conflict_do_update(
+        index_elements=["username", "slot"],
+        set_={name: stmt.excluded[name] for name in ("seq", *values)},
+    ))
+
+def _append_recent(conn, entries):
+    """Write (username, values) entries into each player's recent_battles ring
+    (players that don't exist -- deleted / bots -- are skipped)."""
+    locked = _lock_for_battle(conn, [username for username, _ in entries])
+    for username, values in entries:
+        if username in locked:
+            _write_recent(conn, username, locked[username].battle_seq, values)
+
+def battle_log_query(username, limit=RECENT_BATTLES):
+    # one primary-key range read: the player's ring, newest first
+    return (select(recent_battles).where(recent_battles.c.username == username)
+            .order_by(recent_battles.c.seq.desc()).limit(limit))
+
+@prefetchable
 def get_battle_log(username):
-    with engine.begin() as conn:
-        return conn.execute(
-            select(battles).where(
-                (battles.c.attacker == username) | (battles.c.defender == username)
-            ).order_by(battles.c.timestamp.desc()).limit(20)
-        ).fetchall()
+    with _begin() as conn:
+        return conn.execute(battle_log_query(username)).fetchall()
 
 # --- Quests ---
-def get_quests(username):
-    with engine.begin() as conn:
-        return conn.execute(
-            select(quests).where(quests.c.username == username)
-        ).fetchall()
-
 def add_quest(username, quest_type, goal, reward):
-    with engine.begin() as conn:
+    with _begin() as conn:
         conn.execute(insert(quests).values(
             username=username, quest_type=quest_type,
             progress=0, goal=goal, reward=reward,
@@ -217,7 +984,7 @@ def add_quest(username, quest_type, goal, reward):
         ))
 
 def update_quest_progress(quest_id, progress, completed=0):
-    with engine.begin() as conn:
+    with _begin() as conn:
         conn.execute(
             update(quests).where(quests.c.id == quest_id).values(
                 progress=progress, completed=completed
@@ -225,163 +992,340 @@ def update_quest_progress(quest_id, progress, completed=0):
         )
 
 def complete_quest(quest_id):
-    with engine.begin() as conn:
+    with _begin() as conn:
         conn.execute(
             update(quests).where(quests.c.id == quest_id).values(completed=1)
         )
 
 # --- Achievements ---
+@prefetchable
 def get_achievements(username):
-    with engine.begin() as conn:
+    with _begin() as conn:
         return conn.execute(
             select(achievements).where(achievements.c.username == username)
         ).fetchall()
 
 def add_achievement(username, badge):
-    with engine.begin() as conn:
+    with _begin() as conn:
         conn.execute(insert(achievements).values(
             username=username, badge=badge, achieved=1, timestamp=time.time()
         ))
 
-# --- Market ---
-def get_market_items():
-    with engine.begin() as conn:
-        return conn.execute(select(market).where(market.c.status == "active")).fetchall()
-
-def add_market_item(seller, item, price):
-    with engine.begin() as conn:
-        conn.execute(insert(market).values(
-            seller=seller, item=item, price=price,
-            status="active", buyer=None, timestamp=time.time()
-        ))
-
-def buy_market_item(item_id, buyer):
-    with engine.begin() as conn:
-        conn.execute(
-            update(market).where(market.c.id == item_id).values(
-                status="sold", buyer=buyer
-            )
-        )
-
 # --- Events ---
 def get_events():
-    with engine.begin() as conn:
+    with _begin() as conn:
         return conn.execute(select(events)).fetchall()
 
 def activate_event(event_id, active=1):
-    with engine.begin() as conn:
+    with _begin() as conn:
         conn.execute(
             update(events).where(events.c.id == event_id).values(active=active)
         )
+    _invalidate("event")
 
 # --- Boss ---
+@prefetchable
+@cache.cached("boss", ttl=2)
 def get_active_boss():
-    with engine.begin() as conn:
+    with _begin() as conn:
         return conn.execute(select(boss).where(boss.c.active == 1)).fetchone()
 
 def spawn_boss(name="Globie Overlord 👹", hp=1000, reward_followers=200, reward_points=100):
-    with engine.begin() as conn:
+    with _begin() as conn:
         conn.execute(delete(boss))  # only 1 active
+        conn.execute(delete(boss_contributions))
         conn.execute(insert(boss).values(
             name=name, max_hp=hp, hp=hp,
             reward_followers=reward_followers,
             reward_points=reward_points, active=1
         ))
+    _invalidate("boss")
 
 def damage_boss(dmg):
-    with engine.begin() as conn:
+    with _begin() as conn:
         conn.execute(
             update(boss).where(boss.c.active == 1).values(
-                hp=func.greatest(boss.c.hp - dmg, 0)
+                hp=case((boss.c.hp - dmg < 0, 0), else_=boss.c.hp - dmg)
             )
         )
+    _invalidate("boss")
+
+# --- Boss Engine ---
+# Hits are queued per player and flushed in batches: whoever holds the flush
+# lock applies every hit queued so far with ONE update on the boss row, so
+# concurrent attackers in this process coalesce instead of queueing on the row lock.
+_pending_hits = {}              # username -> [damage, hits]
+_pending_lock = threading.Lock()
+_flush_lock = threading.Lock()
+
+def attack_boss(username, dmg):
+    """Queue a hit on the active boss and flush the batch.
+
+    Returns a dict {"hp", "max_hp", "defeated", "reward_followers", "reward_points"}
+    describing the boss after the flush, or None if no boss is active.
+    When the boss hits 0 hp every participant is paid once, in the same transaction.
+    """
+    with _pending_lock:
+        entry = _pending_hits.setdefault(username, [0, 0])
+        entry[0] += dmg
+        entry[1] += 1
+    result = flush_boss_damage()
+    if result is not None:
+        game_events.emit(game_events.BossAttacked(username, damage=dmg))
+    return result
+
+def flush_boss_damage():
+    """Apply all queued hits. Runs in its own short transaction (never the
+    rerun's unit of work) so the boss row is locked only for the flush itself.
+    The transaction is on boss_engine's single connection, which only the
+    holder of _flush_lock uses: the flush never waits for a main-pool connection."""
+    with _flush_lock:
+        with _pending_lock:
+            batch = dict(_pending_hits)
+            _pending_hits.clear()
+
+        with boss_engine.begin() as conn, _clan_deltas(conn):
+            current = conn.execute(select(boss).where(boss.c.active == 1)).fetchone()
+            if not current:
+                return None  # boss already gone: queued hits are dropped
+            if not batch:
+                return _boss_result(current, current.hp)
+
+            total = sum(dmg for dmg, _ in batch.values())
+            hp = conn.execute(
+                update(boss)
+                .where((boss.c.id == current.id) & (boss.c.active == 1))
+                .values(hp=case((boss.c.hp - total < 0, 0), else_=boss.c.hp - total))
+                .returning(boss.c.hp)
+            ).scalar()
+            if hp is None:
+                return None  # finalized by another process in the meantime
+
+            stmt = _dialect_insert(boss_contributions)
+            conn.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=["boss_id", "username"],
+                    set_={
+                        "damage": boss_contributions.c.damage + stmt.excluded.damage,
+                        "hits": boss_contributions.c.hits + stmt.excluded.hits,
+                    },
+                ),
+                [{"boss_id": current.id, "username": name, "damage": dmg, "hits": hits, "rewarded": 0}
+                 for name, (dmg, hits) in batch.items()],
+            )
+
+            if hp <= 0:
+                _finalize_boss(conn, current)
+    _invalidate("boss", "leaderboard", "clan_stats")
+    return _boss_result(current, hp)
+
+def _finalize_boss(conn, current):
+    # Conditional deactivate: only the transaction that flips active 1 -> 0 pays out
+    flipped = conn.execute(
+        update(boss).where((boss.c.id == current.id) & (boss.c.active == 1)).values(active=0)
+    ).rowcount
+    if flipped != 1:
+        return
+    unpaid = select(boss_contributions.c.username).where(
+        (boss_contributions.c.boss_id == current.id) & (boss_contributions.c.rewarded == 0)
+    )
+    paid_per_clan = conn.execute(
+        select(players.c.clan, func.count()).where(players.c.username.in_(unpaid)).group_by(players.c.clan)
+    ).fetchall()
+    for clan, paid in paid_per_clan:
+        _apply_clan_delta(conn, clan, points=paid * current.reward_points,
+                          followers=paid * current.reward_followers)
+    conn.execute(
+        update(players).where(players.c.username.in_(unpaid)).values(
+            followers=players.c.followers + current.reward_followers,
+            points=players.c.points + current.reward_points,
+            updated_at=time.time(),
+        )
+    )
+    conn.execute(
+        update(boss_contributions).where(boss_contributions.c.boss_id == current.id).values(rewarded=1)
+    )
+
+def _boss_result(current, hp):
+    return {
+        "hp": hp,
+        "max_hp": current.max_hp,
+        "defeated": hp <= 0,
+        "reward_followers": current.reward_followers,
+        "reward_points": current.reward_points,
+    }
+
+def get_boss_contributions(boss_id):
+    with _begin() as conn:
+        return conn.execute(
+            select(boss_contributions)
+            .where(boss_contributions.c.boss_id == boss_id)
+            .order_by(boss_contributions.c.damage.desc())
+        ).fetchall()
 
 # --- Clan ---
+@prefetchable
+@cache.cached("clan_stats", ttl=30)
 def get_clan_stats():
-    with engine.begin() as conn:
+    """Rows of (clan, members, points, followers, wins, losses) from clan_totals."""
+    with _begin() as conn:
         return conn.execute(
-            select(
-                players.c.clan,
-                func.count(players.c.id).label("members"),
-                func.sum(players.c.followers).label("followers"),
-                func.sum(players.c.wins).label("wins"),
-                func.sum(players.c.losses).label("losses"),
-            ).group_by(players.c.clan)
+            select(clan_totals).order_by(clan_totals.c.points.desc())
         ).fetchall()
 
+def clan_stats_query():
+    """Full GROUP BY over players: what clan_totals is kept equal to."""
+    return select(
+        players.c.clan,
+        func.count(players.c.id).label("members"),
+        func.coalesce(func.sum(players.c.points), 0).label("points"),
+        func.coalesce(func.sum(players.c.followers), 0).label("followers"),
+        func.coalesce(func.sum(players.c.wins), 0).label("wins"),
+        func.coalesce(func.sum(players.c.losses), 0).label("losses"),
+    ).group_by(players.c.clan)
+
+def rebuild_clan_totals():
+    """Reconciliation: recompute clan_totals from players (fixes any drift)."""
+    with _begin() as conn:
+        conn.execute(delete(clan_totals))
+        conn.execute(insert(clan_totals).from_select(
+            ["clan", "members", "points", "followers", "wins", "losses"], clan_stats_query()
+        ))
+    _invalidate("clan_stats")
+
+def _apply_clan_delta(conn, clan, **deltas):
+    # e.g. _apply_clan_delta(conn, "Globies 🌍", points=+20, followers=-3)
+    # queued until the transaction commits (see _clan_deltas); written at once outside one
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return
+    pending = _pending_clan_deltas.get()
+    if pending is None:
+        _write_clan_deltas(conn, {clan: deltas})
+        return
+    entry = pending.setdefault(clan, {})
+    for k, v in deltas.items():
+        entry[k] = entry.get(k, 0) + v
+
+def _write_clan_deltas(conn, pending):
+    # sorted: every transaction locks the clan_totals rows in the same order
+    for clan in sorted(c for c in pending if c is not None):
+        deltas = {k: v for k, v in pending[clan].items() if v}
+        if deltas:
+            conn.execute(update(clan_totals).where(clan_totals.c.clan == clan).values(
+                **{k: clan_totals.c[k] + v for k, v in deltas.items()}
+            ))
+
+@prefetchable
+@cache.cached("clan_history", ttl=60)
 def get_clan_history(limit=20):
-    with engine.begin() as conn:
+    with _begin() as conn:
         return conn.execute(
             select(clan_history).order_by(clan_history.c.timestamp.desc()).limit(limit)
         ).fetchall()
 
 def add_clan_history(clan_name):
-    with engine.begin() as conn:
+    with _begin() as conn:
         conn.execute(insert(clan_history).values(
             clan=clan_name, timestamp=time.time()
         ))
+        _record_clan_win(conn, clan_name)
+    _invalidate("clan_history", "clan_streak")
+
+def _record_clan_win(conn, clan_name):
+    # Same clan as last time -> streak + 1; otherwise the old leader's streak ends
+    leader = conn.execute(
+        select(clan_streaks.c.clan).where(clan_streaks.c.is_leader == 1).with_for_update()
+    ).scalar()
+    if leader != clan_name:
+        conn.execute(update(clan_streaks).where(clan_streaks.c.is_leader == 1)
+                     .values(is_leader=0, current_streak=0))
+    stmt = _dialect_insert(clan_streaks)
+    conn.execute(stmt.values(
+        clan=clan_name, current_streak=1, longest_streak=1, is_leader=1
+    ).on_conflict_do_update(
+        index_elements=["clan"],
+        set_={
+            "current_streak": clan_streaks.c.current_streak + 1,
+            "longest_streak": case(
+                (clan_streaks.c.current_streak + 1 > clan_streaks.c.longest_streak,
+                 clan_streaks.c.current_streak + 1),
+                else_=clan_streaks.c.longest_streak,
+            ),
+            "is_leader": 1,
+        },
+    ))
 
-def get_clan_streak(clan_name):
-    with engine.begin() as conn:
-        rows = conn.execute(
-            select(clan_history).order_by(clan_history.c.timestamp.desc())
+@prefetchable
+@cache.cached("clan_streak", ttl=60)
+def get_clan_streak(clan_name=None):
+    """Current streak of clan_name (0 unless it won the latest war).
+    Without a clan: (leading clan, its streak), or (None, 0) if no history."""
+    with _begin() as conn:
+        if clan_name is None:
+            row = conn.execute(
+                select(clan_streaks.c.clan, clan_streaks.c.current_streak)
+                .where(clan_streaks.c.is_leader == 1)
+            ).fetchone()
+            return (row.clan, row.current_streak) if row else (None, 0)
+        streak = conn.execute(
+            select(clan_streaks.c.current_streak).where(clan_streaks.c.clan == clan_name)
+        ).scalar()
+        return streak or 0
+
+@prefetchable
+@cache.cached("clan_streak", ttl=60)
+def get_longest_streaks():
+    with _begin() as conn:
+        return conn.execute(
+            select(clan_streaks).order_by(clan_streaks.c.longest_streak.desc())
         ).fetchall()
-        streak = 0
-        for row in rows:
-            if row.clan == clan_name:
-                streak += 1
-            else:
-                break
-        return streak
 
-# --- Compatibility Stubs ---
-def patch_old_players():
-    return True
+def backfill_clan_streaks():
+    """Rebuild clan_streaks with one pass over the whole clan_history."""
+    with _begin() as conn:
+        streaks = {}   # clan -> [current, longest]
+        leader = None
+        for (clan,) in conn.execute(
+            select(clan_history.c.clan).order_by(clan_history.c.timestamp, clan_history.c.id)
+        ):
+            if clan != leader and leader is not None:
+                streaks[leader][0] = 0
+            current = streaks.setdefault(clan, [0, 0])
+            current[0] += 1
+            current[1] = max(current[1], current[0])
+            leader = clan
 
+        conn.execute(delete(clan_streaks))
+        if streaks:
+            conn.execute(insert(clan_streaks), [
+                {"clan": clan, "current_streak": cur, "longest_streak": longest,
+                 "is_leader": int(clan == leader)}
+                for clan, (cur, longest) in streaks.items()
+            ])
+    _invalidate("clan_streak")
+
+# --- Compatibility Stubs ---
 def reset_clan_war():
     return None
 
 
 # --- Market ---
-def list_item(seller, item, price):
-    """List an item for sale in the market."""
-    with engine.begin() as conn:
-        conn.execute(insert(market).values(
-            seller=seller,
-            item=item,
-            price=price,
-            status="active",
-            buyer=None,
-            timestamp=time.time()
-        ))
-
-def get_market():
-    """Fetch all active items from the market."""
-    with engine.begin() as conn:
-        return conn.execute(
-            select(market).where(market.c.status == "active").order_by(market.c.timestamp.desc())
-        ).fetchall()
-
-def buy_market_item(item_id, buyer):
-    """Mark an item as bought and assign buyer."""
-    with engine.begin() as conn:
-        conn.execute(
-            update(market)
-            .where(market.c.id == item_id)
-            .values(status="sold", buyer=buyer)
-        )
+# Listing, buying and buy orders: see order_book.py
 # --- Events ---
 # --- Events ---
+@prefetchable
+@cache.cached("event", ttl=60)
 def get_active_event():
     """Return the currently active global event (if any)."""
-    with engine.begin() as conn:
+    with _begin() as conn:
         return conn.execute(
             select(events).where(events.c.active == 1).limit(1)
         ).fetchone()
 
 def add_event(name, description, effect, active=1):
     """Create a new event. Set active=1 to make it current."""
-    with engine.begin() as conn:
+    with _begin() as conn:
         if active == 1:
             # deactivate old events
             conn.execute(update(events).values(active=0))
@@ -392,64 +1336,92 @@ def add_event(name, description, effect, active=1):
             active=active,
             timestamp=time.time()
         ))
+    _invalidate("event")
 
 def deactivate_event(event_id):
     """Deactivate a specific event by ID."""
-    with engine.begin() as conn:
+    with _begin() as conn:
         conn.execute(
             update(events)
             .where(events.c.id == event_id)
             .values(active=0)
         )
+    _invalidate("event")
 
 # --- Quests ---
+@prefetchable
 def get_quests(username):
-    with engine.begin() as conn:
+    with _begin() as conn:
         return conn.execute(
             select(quests).where(quests.c.username == username)
         ).fetchall()
 
 def reset_user_quests(username):
     """Delete all quests for a user (admin reset)."""
-    with engine.begin() as conn:
+    with _begin() as conn:
         conn.execute(delete(quests).where(quests.c.username == username))
 
-def generate_daily_quests(username, level):
-    """Generate a fresh set of daily quests based on player level."""
-    with engine.begin() as conn:
-        # Always remove old quests first
-        conn.execute(delete(quests).where(quests.c.username == username))
+def quest_day(ts=None):
+    """Quest day key (UTC date) for a timestamp, default now."""
+    return time.strftime("%Y-%m-%d", time.gmtime(ts))
 
-        # Define quests pool by level
-        quest_pool = []
-        if level <= 2:
-            quest_pool = [
-                ("battle", 3 + level, 10 + level * 2),   # requires 3–5 battles
-                ("meme", 2 + level, 5 + level * 2),      # requires 2–4 memes
-            ]
-        elif level <= 5:
-            quest_pool = [
-                ("battle", 4 + level, 12 + level * 2),
-                ("meme", 3 + level, 6 + level * 2),
-                ("debate", 2 + level, 8 + level * 2),
-            ]
-        else:
-            quest_pool = [
-                ("battle", 5 + level, 15 + level * 3),
-                ("meme", 4 + level, 10 + level * 2),
-                ("debate", 3 + level, 12 + level * 3),
-                ("boss", 1, 25 + level * 5),
-            ]
-
-        # Insert new quests
-        for qtype, goal, reward in quest_pool:
-            conn.execute(insert(quests).values(
-                username=username,
-                quest_type=qtype,
-                progress=0,
-                goal=goal,
-                reward=int(reward),   # ✅ ensure numeric
-                completed=0,
-                timestamp=time.time()
-            ))
+def seed_quest_tiers(conn):
+    """Replace quest_tiers with QUEST_TIERS."""
+    conn.execute(delete(quest_tiers))
+    conn.execute(insert(quest_tiers), [
+        dict(min_level=lo, max_level=hi, quest_type=qtype, goal_base=gb, goal_per_level=gl,
+             reward_base=rb, reward_per_level=rl)
+        for lo, hi, qtype, gb, gl, rb, rl in QUEST_TIERS
+    ])
+
+def daily_quests_insert(day, username=None, level=None):
+    """INSERT ... SELECT of the day's quests for every player (or one) that has none for that day.
+
+    level overrides players.level (single-user callers that know a fresher level).
+    ON CONFLICT DO NOTHING covers the job and a signup racing on the same player.
+    """
+    t = quest_tiers
+    lvl = players.c.level if level is None else literal(level)
+    source = (
+        select(
+            players.c.username, t.c.quest_type, literal(0), t.c.goal_base + t.c.goal_per_level * lvl,
+            cast(t.c.reward_base + t.c.reward_per_level * lvl, String), literal(0),
+            literal(time.time()), literal(day),
+        )
+        .select_from(players.join(t, and_(
+            lvl >= t.c.min_level, or_(t.c.max_level.is_(None), lvl <= t.c.max_level),
+        )))
+        .where(~select(quests.c.id).where(   # a player's set for the day is fixed once created
+            quests.c.username == players.c.username, quests.c.quest_day == day,
+        ).exists())
+    )
+    if username is not None:
+        source = source.where(players.c.username == username)
+    columns = ["username", "quest_type", "progress", "goal", "reward", "completed", "timestamp", "quest_day"]
+    return (_dialect_insert(quests).from_select(columns, source)
+            .on_conflict_do_nothing(index_elements=["username", "quest_day", "quest_type"]))
+
+def generate_all_daily_quests(day=None):
+    """Daily job: drop every older quest and create today's set for all players.
+
+    Two statements whatever the player count; safe to re-run (existing quests
+    for the day are left alone). Returns the number of quests created.
+    """
+    day = day or quest_day()
+    with _begin() as conn:
+        conn.execute(delete(quests).where(or_(quests.c.quest_day.is_(None), quests.c.quest_day < day)))
+        created = conn.execute(daily_quests_insert(day)).rowcount
+    return created
+
+def generate_daily_quests(username, level=None):
+    """Today's quests for one player (same statement as the daily job), replacing older days."""
+    with _begin() as conn:
+        _generate_daily_quests(conn, username, level)
 
+def _generate_daily_quests(conn, username, level=None):
+    day = quest_day()
+    conn.execute(delete(quests).where(
+        quests.c.username == username,
+        or_(quests.c.quest_day.is_(None), quests.c.quest_day < day),
+    ))
+    conn.execute(daily_quests_insert(day, username=username, level=level))
@@ -0,0 +1,119 @@
+# game_events.py - Game Action Event Bus
+# Version: v0.001
+# Notes:
+# - Game actions emit typed events (game_logic: memes, debates, PvP; db.attack_boss: boss hits)
+# - Subscribers (quest_engine) get events in batches: one batch per collect() block,
+#   or a batch of one when nothing is collecting
+# - Subscribers may return follow-up events (e.g. QuestCompleted); they land in batch.results
+# - A collect() block that fails with an error drops its events (st.rerun()/st.stop() still dispatch)
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import ClassVar, Optional
+
+
+# --- Events ---
+@dataclass(frozen=True)
+class GameEvent:
+    username: str
+    quest_type: ClassVar[Optional[str]] = None   # quest progress this event counts toward
+
+
+@dataclass(frozen=True)
+class MemePosted(GameEvent):
+    quest_type: ClassVar[str] = "meme"
+
+
+@dataclass(frozen=True)
+class DebateFinished(GameEvent):
+    won: bool = False
+    quest_type: ClassVar[str] = "debate"
+
+
+@dataclass(frozen=True)
+class PvpBattleFought(GameEvent):
+    opponent: Optional[str] = None
+    won: bool = False
+    quest_type: ClassVar[str] = "battle"
+
+
+@dataclass(frozen=True)
+class BossAttacked(GameEvent):
+    damage: int = 0
+    quest_type: ClassVar[str] = "boss"
+
+
+@dataclass(frozen=True)
+class QuestWorked(GameEvent):
+    """A step done from the quest board itself (the per-quest buttons)."""
+    kind: str = ""
+
+    @property
+    def quest_type(self):
+        return self.kind
+
+
+@dataclass(frozen=True)
+class QuestCompleted(GameEvent):
+    """Follow-up event from quest_engine; the reward is already credited in the DB."""
+    kind: str = ""
+    followers: int = 0
+    points: int = 0
+
+
+# --- Bus ---
+_subscribers = []
+_collecting = ContextVar("flat_earth_event_batch", default=None)
+
+
+class Batch:
+    def __init__(self):
+        self.events = []
+        self.results = []   # follow-up events returned by subscribers
+
+
+def subscribe(handler):
+    """Register handler(events) -> follow-up events or None. Usable as a decorator."""
+    if handler not in _subscribers:
+        _subscribers.append(handler)
+    return handler
+
+
+def emit(event):
+    batch = _collecting.get()
+    if batch is not None:
+        batch.events.append(event)
+    else:
+        return _dispatch([event])
+
+
+@contextmanager
+def collect():
+    """Batch every event emitted in this block; dispatched once when the block ends."""
+    outer = _collecting.get()
+    if outer is not None:   # nested -> join the outer batch
+        yield outer
+        return
+    batch = Batch()
+    token = _collecting.set(batch)
+    try:
+        yield batch
+    except Exception:
+        _collecting.reset(token)
+        raise
+    except BaseException:
+        # st.rerun()/st.stop(): the actions happened (and unit_of_work commits them)
+        _collecting.reset(token)
+        batch.results.extend(_dispatch(batch.events))
+        raise
+    _collecting.reset(token)
+    batch.results.extend(_dispatch(batch.events))
+
+
+def _dispatch(events):
+    results = []
+    if events:
+        for handler in list(_subscribers):
+            results.extend(handler(events) or [])
+    return results
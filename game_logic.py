@@ -1,11 +1,19 @@
 # game_logic.py - Core Game Mechanics
-# Version: v0.002
+# Version: v0.006
 # Notes:
+# - Item checks are bit tests on the inventory mask (item_registry); lists/JSON still accepted
+# - pvp_battle() accepts pre-drawn rolls (lets pvp_batch be checked against it)
+# - Actions emit game_events (MemePosted, DebateFinished, PvpBattleFought) when given a username;
+#   quest progress follows from those (quest_engine)
+# - Lazy energy: energy_now() derives current energy from (energy, energy_ts) without writing;
+#   partial regen progress is kept (energy_ts only moves by whole ticks). regenerate_energy() is legacy
 # - Added safe_items() to fix JSON string/method issues
 # - Improved PvP battle with consistent outcomes
 # - Items always checked safely
 
 import random, time, json
+from item_registry import to_mask, has
+from game_events import emit, MemePosted, DebateFinished, PvpBattleFought
 
 # --- Helpers ---
 def safe_items(items):
@@ -21,20 +29,44 @@ def safe_items(items):
 
 
 # --- Energy ---
+ENERGY_REGEN_SECONDS = 120  # 1 energy every 120s
+
+
+def max_energy(level):
+    return 10 + level * 5
+
+
+def energy_now(energy, level, energy_ts, now=None):
+    """Current energy from the stored (energy, energy_ts). Returns (energy, energy_ts).
+
+    Pure: nothing is written. The returned energy_ts is the time the last whole
+    tick landed (or now once capped), so storing the pair after spending keeps
+    the partial progress towards the next point.
+    """
+    now = time.time() if now is None else now
+    cap = max_energy(level)
+    if energy >= cap:
+        return energy, now   # full (or over-full from a bonus): no regen banked
+    ticks = int(max(now - energy_ts, 0) // ENERGY_REGEN_SECONDS)
+    if energy + ticks >= cap:
+        return cap, now
+    return energy + ticks, energy_ts + ticks * ENERGY_REGEN_SECONDS
+
+
 def regenerate_energy(energy, level, last_login):
-    regen_rate = 120  # 1 energy every 120s
+    """Legacy regen: drops the partial tick by resetting last_login. Use energy_now()."""
     now = time.time()
     elapsed = now - last_login
-    regenerated = int(elapsed // regen_rate)
+    regenerated = int(elapsed // ENERGY_REGEN_SECONDS)
     if regenerated > 0:
-        energy = min(10 + level * 5, energy + regenerated)
+        energy = min(max_energy(level), energy + regenerated)
         last_login = now
     return energy, last_login
 
 
 # --- Actions ---
-def post_meme(energy, points, followers, items):
-    items = safe_items(items)
+def post_meme(energy, points, followers, items, username=None):
+    inventory = to_mask(items)
 
     if energy <= 0:
         return energy, points, followers, "⚠️ No energy left!"
@@ -42,25 +74,27 @@ def post_meme(energy, points, followers, items):
     gain = random.randint(5, 15)
     follower_gain = random.randint(1, 5)
 
-    if "Shades 🕶️" in items:
+    if has(inventory, "Shades 🕶️"):
         gain = int(gain * 1.1)
-    if "Rocket Poster 🚀" in items:
+    if has(inventory, "Rocket Poster 🚀"):
         gain += 50
 
     points += gain
     followers += follower_gain
     energy -= 1
+    if username:
+        emit(MemePosted(username))
     return energy, points, followers, f"📢 Meme posted! +{gain} points, +{follower_gain} followers"
 
 
-def debate_globie(energy, points, followers, items):
-    items = safe_items(items)
+def debate_globie(energy, points, followers, items, username=None):
+    inventory = to_mask(items)
 
     if energy < 2:
         return energy, points, followers, "⚠️ Not enough energy!"
 
     outcome = random.choice(["win", "lose"])
-    if "Flat Map 🧭" in items and random.random() < 0.2:
+    if has(inventory, "Flat Map 🧭") and random.random() < 0.2:
         outcome = "win"
 
     if outcome == "win":
@@ -72,6 +106,8 @@ def debate_globie(energy, points, followers, items):
         result = "💢 You lost the debate... -10 points"
 
     energy -= 2
+    if username:
+        emit(DebateFinished(username, won=outcome == "win"))
     return energy, points, followers, result
 
 
@@ -85,27 +121,34 @@ def level_up(points, level, energy):
 
 
 # --- PvP Battles ---
-def pvp_battle(attacker, defender):
+def pvp_battle(attacker, defender, rolls=None):
     """
     attacker & defender are dicts:
-    {"username": str, "points": int, "followers": int, "items": list|json}
+    {"username": str, "points": int, "followers": int, "items": mask|list|json}
+    rolls: optional (attacker_roll, defender_roll), each 0..20; drawn randomly if None
     Returns: ("win"/"lose", details dict)
+    Emits PvpBattleFought when the attacker has a username.
     """
-    attacker_items = safe_items(attacker.get("items", []))
-    defender_items = safe_items(defender.get("items", []))
+    attacker_items = to_mask(attacker.get("items", 0))
+    defender_items = to_mask(defender.get("items", 0))
 
-    atk_score = attacker["points"] + random.randint(0, 20)
-    def_score = defender["points"] + random.randint(0, 20)
+    if rolls is None:
+        rolls = (random.randint(0, 20), random.randint(0, 20))
+    atk_score = attacker["points"] + rolls[0]
+    def_score = defender["points"] + rolls[1]
 
     # --- Item boosts ---
-    if "Rocket Poster 🚀" in attacker_items:
+    if has(attacker_items, "Rocket Poster 🚀"):
         atk_score += 30
-    if "Shades 🕶️" in attacker_items:
+    if has(attacker_items, "Shades 🕶️"):
         atk_score += 10
-    if "Flat Map 🧭" in defender_items:
+    if has(defender_items, "Flat Map 🧭"):
         def_score += 15
 
     # --- Outcome ---
+    if attacker.get("username"):
+        emit(PvpBattleFought(attacker["username"], opponent=defender.get("username"),
+                             won=atk_score >= def_score))
     if atk_score >= def_score:
         steal = max(1, int(defender["followers"] * 0.1))
         return "win", {
@@ -0,0 +1,111 @@
+# item_registry.py - Item Bitmask Registry
+# Version: v0.002
+# Notes:
+# - Every item gets one bit; a player's inventory is a single int (players.inventory)
+# - Ownership checks / buys / upgrades are bit operations, no JSON on the hot path
+# - Bits are persisted: ITEM_BIT_INDEX is the explicit name -> bit table (it used to be derived from the
+#   order of BONUS_ITEMS / shop_items / upgrade targets, so adding an item could remap stored inventories);
+#   new items take the next free bit, checked at import
+# - Unknown legacy item names are logged by to_mask(); migration 2 refuses to drop them
+# - to_mask()/to_names() convert from/to the legacy JSON list in players.items
+
+import json, logging
+from shop import shop_items, upgrade_paths
+
+logger = logging.getLogger("flat_earth.items")
+
+# Stored bit of every item (players.inventory). This table IS the on-disk format:
+# add new items with the next free bit, never change or reuse an existing one.
+ITEM_BIT_INDEX = {
+    # gameplay-effect items not sold in the shop (see game_logic / pvp_batch)
+    "Rocket Poster 🚀": 0,
+    "Shades 🕶️": 1,
+    "Flat Map 🧭": 2,
+    # shop items and their upgrades
+    "Meme Book 📖": 3,
+    "Advanced Meme Book 📚": 4,
+    "Telescope 🔭": 5,
+    "Space Telescope 🛰️": 6,
+    "Laptop 💻": 7,
+    "Supercomputer 🖥️": 8,
+    "Banner 🚩": 9,
+    "War Banner 🏴": 10,
+}
+BONUS_ITEMS = ["Rocket Poster 🚀", "Shades 🕶️", "Flat Map 🧭"]
+
+
+def _check_registry():
+    """Fail at import if an item has no bit or two items share one."""
+    wanted = set(BONUS_ITEMS) | set(shop_items) | {path["target"] for path in upgrade_paths.values()}
+    missing = sorted(wanted - set(ITEM_BIT_INDEX))
+    if missing:
+        raise RuntimeError(f"item_registry: no bit for {missing}; add them to ITEM_BIT_INDEX with new bits")
+    if len(set(ITEM_BIT_INDEX.values())) != len(ITEM_BIT_INDEX):
+        raise RuntimeError("item_registry: two items share a bit in ITEM_BIT_INDEX")
+
+
+_check_registry()
+ITEMS = sorted(ITEM_BIT_INDEX, key=ITEM_BIT_INDEX.get)             # names in bit order
+ITEM_BITS = {name: 1 << i for name, i in ITEM_BIT_INDEX.items()}   # name -> bit value
+
+
+def bit(item):
+    """Bit value of an item (0 for unknown items)."""
+    return ITEM_BITS.get(item, 0)
+
+
+def has(mask, item):
+    return bool(mask & ITEM_BITS.get(item, 0))
+
+
+def add(mask, item):
+    return mask | ITEM_BITS.get(item, 0)
+
+
+def remove(mask, item):
+    return mask & ~ITEM_BITS.get(item, 0)
+
+
+def count(mask):
+    return bin(mask).count("1")
+
+
+def to_names(mask):
+    """Item names in an inventory mask, in bit order."""
+    return [name for name in ITEMS if mask & ITEM_BITS[name]]
+
+
+def unknown_items(items):
+    """Names in a list / legacy JSON string that have no bit (would be dropped by to_mask)."""
+    if isinstance(items, str):
+        try:
+            items = json.loads(items)
+        except Exception:
+            return []
+    if not isinstance(items, list):
+        return []
+    return [item for item in items if item not in ITEM_BITS]
+
+
+def to_mask(items):
+    """Inventory mask from a mask, a list of names or a legacy JSON string.
+
+    Names without a bit can't be stored in the mask; they are logged, not silently dropped.
+    """
+    if isinstance(items, int):
+        return items
+    if isinstance(items, str):
+        try:
+            items = json.loads(items)
+        except Exception:
+            logger.warning("unreadable items JSON dropped: %r", items[:200])
+            return 0
+    if not isinstance(items, list):
+        return 0
+    mask = 0
+    for item in items:
+        if item in ITEM_BITS:
+            mask |= ITEM_BITS[item]
+        else:
+            logger.warning("unknown item %r has no inventory bit (add it to ITEM_BIT_INDEX)", item)
+    return mask
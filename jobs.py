@@ -0,0 +1,58 @@
+# jobs.py - Scheduled Maintenance Jobs
+# Version: v0.004
+# Notes:
+# - Run from cron / Render cron jobs: python jobs.py <job> [<job> ...]
+# - reconcile-clans: rebuild clan_totals from players (fixes drift from the incremental updates)
+# - daily-quests: today's quests for every player in one INSERT ... SELECT (run just after 00:00 UTC;
+#   re-running the same day is a no-op)
+# - archive-battles: battles older than BATTLE_HOT_DAYS -> Parquet files + battle_daily_summaries,
+#   then pruned from the hot table (Postgres: old partitions dropped, upcoming ones created)
+# - refresh-rankings: rebuild the leaderboard's player_rankings (run every minute)
+
+import sys
+import db
+import battle_archive
+import ranking
+from migrations import run_migrations
+
+
+def reconcile_clans():
+    db.rebuild_clan_totals()
+    return "clan_totals rebuilt"
+
+
+def daily_quests():
+    return f"{db.generate_all_daily_quests()} quests created for {db.quest_day()}"
+
+
+def archive_battles():
+    days, battles = battle_archive.archive_battles()
+    return f"{battles} battles from {days} days archived to {battle_archive.ARCHIVE_DIR}"
+
+
+def refresh_rankings():
+    if not ranking.refresh_rankings():
+        return "skipped (another rebuild is running)"
+    return "player_rankings rebuilt"
+
+
+JOBS = {
+    "reconcile-clans": reconcile_clans,
+    "daily-quests": daily_quests,
+    "archive-battles": archive_battles,
+    "refresh-rankings": refresh_rankings,
+}
+
+
+def main(argv):
+    if not argv or any(name not in JOBS for name in argv):
+        print(f"Usage: python jobs.py <job> [...]  (jobs: {', '.join(JOBS)})")
+        return 1
+    run_migrations()
+    for name in argv:
+        print(f"✅ {name}: {JOBS[name]()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,150 @@
+# matchmaking.py - PvP Matchmaking Index
+# Version: v0.002
+# Notes:
+# - Replaces pvp_tab's opponent list (top 20 of get_leaderboard, filtered in Python): every player is a
+#   candidate, bucketed in memory by (clan, points // MATCH_BAND_WIDTH)
+# - find_opponents(): K players of another clan from the nearest bands, closest points first; buckets are
+#   sampled (not scanned), so a lookup costs the same with 1k or 1M players
+# - Refreshed incrementally: the first call loads every player, later ones only rows whose
+#   players.updated_at moved (every points/clan writer stamps it), at most every MATCH_REFRESH_SECONDS
+# - One index per process; candidates may be a few seconds stale, the battle itself reads the fresh row
+# - Benchmark: python benchmarks/matchmaking_bench.py
+# - yield_per is set on the refresh statement only, not on the (shared) connection
+
+import os, time, random, threading
+from sqlalchemy import select
+import db
+
+BAND_WIDTH = int(os.getenv("MATCH_BAND_WIDTH", "50"))
+REFRESH_SECONDS = float(os.getenv("MATCH_REFRESH_SECONDS", "5"))
+MAX_BAND_DISTANCE = 40       # give up widening the search after this many bands either way
+CLOCK_SKEW = 5.0             # re-read rows stamped this long before the newest seen (late commits)
+LOAD_CHUNK = 50_000
+K = 5
+
+
+class _Bucket:
+    """Usernames of one (clan, band): O(1) add / remove (swap with last), O(k) sampling."""
+
+    __slots__ = ("names", "pos")
+
+    def __init__(self):
+        self.names = []
+        self.pos = {}
+
+    def add(self, name):
+        if name not in self.pos:
+            self.pos[name] = len(self.names)
+            self.names.append(name)
+
+    def discard(self, name):
+        i = self.pos.pop(name, None)
+        if i is None:
+            return
+        last = self.names.pop()
+        if i < len(self.names):
+            self.names[i] = last
+            self.pos[last] = i
+
+    def sample(self, k, rng):
+        if len(self.names) <= k:
+            return list(self.names)
+        return rng.sample(self.names, k)
+
+    def __len__(self):
+        return len(self.names)
+
+
+class MatchIndex:
+    def __init__(self, band_width=BAND_WIDTH):
+        self.band_width = band_width
+        self._buckets = {}      # (clan, band) -> _Bucket
+        self._players = {}      # username -> (clan, points)
+        self._clans = set()
+        self._lock = threading.Lock()
+        self.synced_to = None   # newest players.updated_at loaded (None = never loaded)
+        self.refreshed_at = 0.0
+
+    def __len__(self):
+        return len(self._players)
+
+    def _band(self, points):
+        return (points or 0) // self.band_width
+
+    def _upsert(self, username, clan, points):
+        old = self._players.get(username)
+        if old == (clan, points):
+            return
+        if old is not None:
+            old_key = (old[0], self._band(old[1]))
+            if old_key != (clan, self._band(points)):
+                self._buckets[old_key].discard(username)
+        self._players[username] = (clan, points)
+        self._clans.add(clan)
+        self._buckets.setdefault((clan, self._band(points)), _Bucket()).add(username)
+
+    def load(self, rows):
+        """Apply (username, clan, points, updated_at) rows. Returns how many were applied."""
+        n = 0
+        with self._lock:
+            for username, clan, points, updated_at in rows:
+                self._upsert(username, clan, points or 0)
+                if updated_at is not None and (self.synced_to is None or updated_at > self.synced_to):
+                    self.synced_to = updated_at
+                n += 1
+            if self.synced_to is None:
+                self.synced_to = 0.0
+        return n
+
+    def find(self, username, clan, points, k=K, rng=random):
+        """Up to k (username, clan, points) of other clans, nearest points first."""
+        band = self._band(points)
+        found = []
+        with self._lock:
+            clans = self._clans - {clan}
+            for distance in range(MAX_BAND_DISTANCE + 1):
+                for b in ((band,) if distance == 0 else (band - distance, band + distance)):
+                    for other in clans:
+                        bucket = self._buckets.get((other, b))
+                        if bucket:
+                            found += [(name, other, self._players[name][1])
+                                      for name in bucket.sample(k + 1, rng) if name != username]
+                if len(found) >= k:
+                    break
+        found.sort(key=lambda row: abs(row[2] - points))
+        return found[:k]
+
+
+_index = MatchIndex()
+_refreshing = threading.Lock()
+
+
+def refresh(index=None, force=False):
+    """Pull changed players into the index (everyone on the first call). Returns rows applied."""
+    index = _index if index is None else index
+    if not force and index.synced_to is not None and time.time() - index.refreshed_at < REFRESH_SECONDS:
+        return 0
+    # one refresh at a time; others keep using the current index (except before the first load)
+    if not _refreshing.acquire(blocking=index.synced_to is None):
+        return 0
+    try:
+        if index.synced_to is not None and not force and time.time() - index.refreshed_at < REFRESH_SECONDS:
+            return 0
+        p = db.players
+        query = select(p.c.username, p.c.clan, p.c.points, p.c.updated_at)
+        if index.synced_to is not None:
+            query = query.where(p.c.updated_at >= index.synced_to - CLOCK_SKEW)
+        index.refreshed_at = time.time()
+        with db._begin() as conn:
+            # per statement: Connection.execution_options() would switch the shared rerun
+            # connection to server-side cursors for everything after it
+            result = conn.execute(query, execution_options={"yield_per": LOAD_CHUNK})
+            return sum(index.load(chunk) for chunk in result.partitions())
+    finally:
+        _refreshing.release()
+
+
+def find_opponents(username, clan, points, k=K):
+    """K near-rating opponents from the other clan(s) for the PvP arena."""
+    refresh()
+    return _index.find(username, clan, points, k)
@@ -0,0 +1,255 @@
+# migrations.py - Versioned Schema Migrations
+# Version: v0.013
+# Notes:
+# - Replaces the old db.patch_old_players() stub
+# - Applied versions are recorded in the schema_version table; each migration runs once
+# - MIGRATIONS is append-only: never renumber or edit a migration that has shipped
+# - 7: players.energy_ts (lazy energy), backfilled from last_login, the old regen anchor
+# - 8: battles range-partitioned by day on Postgres (battle_archive.py); a no-op on SQLite
+# - 9: players.battle_seq + recent_battles rings backfilled from the (hot) battles table
+# - 10: players.updated_at (+ index) for the matchmaking index's incremental refresh
+# - 11: player_rankings built once; jobs.py refresh-rankings keeps it current
+# - 2 stops on legacy item names without an inventory bit instead of dropping them
+# - Migrations create indexes by name (_create_indexes), never from the live table.indexes: migration 1
+#   tried the quest_day unique index before migration 6 added the column, failing every baseline upgrade
+# - Each migration runs inside db.unit_of_work(), so db.py helpers called from it share its transaction
+
+import time
+from sqlalchemy import select, insert, update, delete, func, text, inspect, bindparam
+from sqlalchemy.exc import IntegrityError
+import db
+import item_registry
+import battle_archive
+import ranking
+
+
+# --- Helpers ---
+def _add_column(conn, table, column_name):
+    """ALTER TABLE ... ADD COLUMN for a column declared on the db.py Table (if missing)."""
+    existing = {c["name"] for c in inspect(conn).get_columns(table.name)}
+    if column_name in existing:
+        return False
+    column = table.c[column_name]
+    ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(conn.dialect)}"
+    if column.default is not None and column.default.is_scalar:
+        ddl += f" DEFAULT {column.default.arg!r}"
+    conn.execute(text(ddl))
+    return True
+
+
+def _create_indexes(conn, table, *names):
+    """Create the named indexes declared on the db.py Table (if missing).
+
+    Migrations name their indexes explicitly: table.indexes keeps growing, and a
+    later index may use a column a later migration adds.
+    """
+    by_name = {index.name: index for index in table.indexes}
+    for name in names:
+        by_name[name].create(bind=conn, checkfirst=True)
+
+
+# --- Migrations ---
+# The indexes migration 1 shipped with; frozen (later ones belong to their own migration)
+HOT_INDEXES = (
+    (db.battles, ("ix_battles_attacker_ts", "ix_battles_defender_ts")),
+    (db.quests, ("ix_quests_username_type",)),
+    (db.achievements, ("ix_achievements_username",)),
+    (db.market, ("ix_market_status_ts",)),
+    (db.events, ("ix_events_active",)),
+    (db.clan_history, ("ix_clan_history_ts",)),
+)
+
+def _create_hot_indexes(conn):
+    """Composite indexes for the hot lookup paths (no-op on fresh databases)."""
+    for table, names in HOT_INDEXES:
+        _create_indexes(conn, table, *names)
+
+
+def _add_inventory_bitmask(conn):
+    """players.inventory bitmask, backfilled from the legacy items JSON."""
+    _add_column(conn, db.players, "inventory")
+    rows = conn.execute(select(db.players.c.id, db.players.c["items"])).fetchall()
+    unknown = sorted({item for _, items in rows for item in item_registry.unknown_items(items or "[]")})
+    if unknown:
+        # the items JSON is rewritten from the mask later: these would be lost for good
+        raise RuntimeError(f"players.items has items without an inventory bit: {unknown}; "
+                           "add them to item_registry.ITEM_BIT_INDEX first")
+    backfill = [{"pid": pid, "mask": item_registry.to_mask(items or "[]")} for pid, items in rows]
+    if backfill:
+        conn.execute(
+            update(db.players).where(db.players.c.id == bindparam("pid"))
+            .values(inventory=bindparam("mask")),
+            backfill,
+        )
+
+
+def _build_clan_totals(conn):
+    """Fill clan_totals from players (the table itself is created by init_db)."""
+    db.rebuild_clan_totals()
+
+
+def _backfill_clan_streaks(conn):
+    db.backfill_clan_streaks()
+
+
+def _market_order_book(conn):
+    """(item, price) listing index; escrow the items of listings made before escrow existed."""
+    _create_indexes(conn, db.market, "ix_market_item_price")
+    m, p = db.market, db.players
+    listings = conn.execute(
+        select(m.c.id, m.c.seller, m.c.item).where(m.c.status == "active").order_by(m.c.id)
+    ).fetchall()
+    for listing_id, seller, item in listings:
+        bit = item_registry.bit(item)
+        owns = func.coalesce(p.c.inventory, 0).op("&")(bit) != 0
+        escrowed = conn.execute(
+            update(p).where(p.c.username == seller, owns)
+            .values(inventory=func.coalesce(p.c.inventory, 0).op("&")(~bit))
+        ).rowcount
+        if not escrowed:
+            # seller no longer has the item (or listed it twice): nothing to sell
+            conn.execute(update(m).where(m.c.id == listing_id).values(status="cancelled"))
+
+
+def _daily_quest_batch(conn):
+    """quests.quest_day (+ unique per-day index) and the seeded quest_tiers table."""
+    _add_column(conn, db.quests, "quest_day")
+    q = db.quests
+    rows = conn.execute(select(q.c.id, q.c.username, q.c.quest_type, q.c.timestamp).order_by(q.c.id)).fetchall()
+    seen, backfill, duplicates = set(), [], []
+    for qid, username, qtype, ts in rows:
+        key = (username, db.quest_day(ts or 0), qtype)
+        if key in seen:
+            duplicates.append(qid)   # would break the unique index; the newer copy goes
+        else:
+            seen.add(key)
+            backfill.append({"qid": qid, "day": key[1]})
+    if duplicates:
+        conn.execute(delete(q).where(q.c.id.in_(duplicates)))
+    if backfill:
+        conn.execute(update(q).where(q.c.id == bindparam("qid")).values(quest_day=bindparam("day")), backfill)
+    _create_indexes(conn, q, "ux_quests_username_day_type")
+    db.seed_quest_tiers(conn)
+
+
+def _lazy_energy(conn):
+    """players.energy_ts, backfilled from last_login (what regenerate_energy counted from)."""
+    _add_column(conn, db.players, "energy_ts")
+    p = db.players
+    conn.execute(update(p).where(p.c.energy_ts.is_(None))
+                 .values(energy_ts=func.coalesce(p.c.last_login, time.time())))
+
+
+def _partition_battles(conn):
+    """Postgres only: battles becomes a daily range-partitioned table (battle_daily_summaries
+    itself comes from init_db's create_all)."""
+    battle_archive.partition_battles(conn)
+
+
+def _recent_battles_ring(conn):
+    """players.battle_seq and each player's recent_battles ring, from their newest battles (both sides)."""
+    _add_column(conn, db.players, "battle_seq")
+    b, p = db.battles, db.players
+    players = set(conn.execute(select(p.c.username)).scalars())
+    rings = {}
+    for row in conn.execute(select(b).order_by(b.c.timestamp, b.c.id)):
+        defender_outcome = "lose" if row.outcome == "win" else "win"
+        for username, values in (
+            (row.attacker, dict(opponent=row.defender, role="attack", outcome=row.outcome,
+                                followers_change=row.followers_change, points_change=row.points_change)),
+            (row.defender, dict(opponent=row.attacker, role="defend", outcome=defender_outcome,
+                                followers_change=0, points_change=0)),
+        ):
+            if username in players:
+                ring = rings.setdefault(username, [])
+                ring.append(dict(values, timestamp=row.timestamp))
+                del ring[:-db.RECENT_BATTLES]
+
+    conn.execute(delete(db.recent_battles))
+    conn.execute(update(p).values(battle_seq=0))
+    entries, seqs = [], []
+    for username, ring in rings.items():
+        for seq, values in enumerate(ring, start=1):
+            entries.append(dict(values, username=username, seq=seq, slot=seq % db.RECENT_BATTLES))
+        seqs.append({"name": username, "seq": len(ring)})
+    if entries:
+        conn.execute(insert(db.recent_battles), entries)
+        conn.execute(update(p).where(p.c.username == bindparam("name")).values(battle_seq=bindparam("seq")), seqs)
+
+
+def _players_updated_at(conn):
+    """players.updated_at (indexed), backfilled from last_login."""
+    _add_column(conn, db.players, "updated_at")
+    p = db.players
+    conn.execute(update(p).where(p.c.updated_at.is_(None))
+                 .values(updated_at=func.coalesce(p.c.last_login, 0)))
+    _create_indexes(conn, p, "ix_players_updated_at")
+
+
+def _initial_rankings(conn):
+    """First player_rankings build, so the leaderboard isn't empty until the job's first run."""
+    ranking.rebuild_rankings(conn)
+
+
+# (version, name, function(conn))
+MIGRATIONS = [
+    (1, "hot lookup indexes", _create_hot_indexes),
+    (2, "players.inventory item bitmask", _add_inventory_bitmask),
+    (3, "clan_totals aggregates", _build_clan_totals),
+    (4, "clan_streaks backfill", _backfill_clan_streaks),
+    (5, "market order book (price index + listing escrow)", _market_order_book),
+    (6, "daily quest batch (quest_day + quest_tiers)", _daily_quest_batch),
+    (7, "players.energy_ts (lazy energy regen)", _lazy_energy),
+    (8, "battles partitioned by day (Postgres) + battle_daily_summaries", _partition_battles),
+    (9, "recent_battles ring buffer", _recent_battles_ring),
+    (10, "players.updated_at (matchmaking refresh)", _players_updated_at),
+    (11, "initial player_rankings build (refreshed by jobs.py from now on)", _initial_rankings),
+]
+
+
+# --- Runner ---
+_migrated = False
+
+def applied_versions():
+    with db.engine.begin() as conn:
+        return {row.version for row in conn.execute(select(db.schema_version.c.version))}
+
+def run_migrations():
+    """Apply every pending migration in order, each in its own transaction.
+
+    Safe to call on every start: several app processes may race here, so on
+    Postgres an advisory lock serializes them and the schema_version primary
+    key makes sure a migration is never recorded twice.
+    """
+    global _migrated
+    if _migrated:
+        return []
+    db.init_db()
+
+    applied = []
+    done = applied_versions()
+    for version, name, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        try:
+            with db.unit_of_work() as conn:
+                if db.engine.dialect.name == "postgresql":
+                    conn.execute(text("SELECT pg_advisory_xact_lock(4242)"))
+                    already = conn.execute(
+                        select(db.schema_version.c.version).where(db.schema_version.c.version == version)
+                    ).first()
+                    if already:
+                        continue
+                migrate(conn)
+                conn.execute(insert(db.schema_version).values(
+                    version=version, name=name, applied_at=time.time()
+                ))
+            applied.append(version)
+        except IntegrityError:
+            pass  # another process recorded it first
+    _migrated = True
+    return applied
+
+def current_version():
+    done = applied_versions()
+    return max(done) if done else 0
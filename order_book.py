@@ -0,0 +1,320 @@
+# order_book.py - Market Order Book
+# Version: v0.003
+# Notes:
+# - Replaces db.list_item / get_market / buy_market_item (blind status=sold, transfer in session state only)
+# - Listing escrows the item (its bit leaves the seller's inventory until sold or cancelled)
+# - Every trade is one transaction: conditional claim (WHERE status = 'active'/'open'),
+#   followers + inventory moved in SQL, clan_totals kept in step -> no double-buys
+# - Buy orders hold max_price from the buyer's followers and match against the cheapest listing;
+#   a new listing fills the best open bid instead of resting
+# - Browsing is per item, cheapest first, keyset-paginated on (price, id)
+# - Browsing reads are db.prefetchable (app.py loads them in parallel for the Shop section)
+# - Trade savepoints are db._savepoint (a rejected trade also drops its queued clan_totals deltas)
+
+import time
+from sqlalchemy import select, insert, update, func, and_, or_
+import db
+import cache
+import item_registry
+
+PAGE_SIZE = 10
+MATCH_ATTEMPTS = 3   # candidates tried when a concurrent trade claims the one we picked
+
+# Trade results
+BOUGHT = "bought"
+LISTED = "listed"
+SOLD = "sold"            # a new listing filled a buy order right away
+FILLED = "filled"        # a new buy order filled against a listing right away
+OPEN = "open"
+CANCELLED = "cancelled"
+GONE = "gone"            # listing/order already sold, filled or cancelled
+NO_FUNDS = "no_funds"
+OWNED = "owned"          # buyer already has the item (inventories hold one of each)
+NOT_OWNED = "not_owned"  # seller does not have the item
+OWN_LISTING = "own_listing"
+DUPLICATE = "duplicate"  # buyer already has an open order for this item
+
+
+class _Rejected(Exception):
+    """Rolls back the trade's savepoint; .reason is returned to the caller."""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+# --- Player row changes (all in SQL, so concurrent sessions can't lose them) ---
+def _inventory():
+    return func.coalesce(db.players.c.inventory, 0)
+
+
+def _owns(item):
+    return _inventory().op("&")(item_registry.bit(item)) != 0
+
+
+def _move_followers(conn, username, delta, require=None):
+    """followers += delta (optionally only WHERE require). False if the row didn't match."""
+    p = db.players
+    query = update(p).where(p.c.username == username)
+    if require is not None:
+        query = query.where(require)
+    return conn.execute(query.values(followers=p.c.followers + delta)).rowcount == 1
+
+
+def _clans(conn, *usernames):
+    p = db.players
+    return dict(conn.execute(select(p.c.username, p.c.clan).where(p.c.username.in_(usernames))).all())
+
+
+def _settle(conn, buyer, seller, item, price, held=0):
+    """Pay the seller, charge the buyer (or use the `held` followers) and hand over the item.
+
+    Both player rows are updated in username order, so two players trading
+    with each other at the same time lock them in the same order.
+    """
+    p = db.players
+    bit = item_registry.bit(item)
+
+    def charge_buyer():
+        ok = conn.execute(
+            update(p).where(p.c.username == buyer, ~_owns(item),
+                            p.c.followers + held >= price)
+            .values(followers=p.c.followers + held - price, inventory=_inventory().op("|")(bit))
+        ).rowcount == 1
+        if not ok:
+            owned = conn.execute(select(_owns(item)).where(p.c.username == buyer)).scalar()
+            raise _Rejected(OWNED if owned else NO_FUNDS)
+
+    def pay_seller():
+        _move_followers(conn, seller, price)
+
+    for _, step in sorted([(buyer, charge_buyer), (seller, pay_seller)], key=lambda s: s[0]):
+        step()
+
+    clans = _clans(conn, buyer, seller)
+    db._apply_clan_delta(conn, clans.get(buyer), followers=held - price)
+    db._apply_clan_delta(conn, clans.get(seller), followers=price)
+
+
+def _trade(fn):
+    """Run fn(conn) in a savepoint; a _Rejected rolls back just this trade."""
+    with db._begin() as conn:
+        try:
+            with db._savepoint(conn):
+                result = fn(conn)
+        except _Rejected as rejected:
+            return rejected.reason
+    db._invalidate("market", "leaderboard", "clan_stats")
+    return result
+
+
+# --- Listings ---
+def list_item(seller, item, price):
+    """Put an owned item up for sale. Returns LISTED, SOLD (matched a buy order) or NOT_OWNED."""
+    p, m, b = db.players, db.market, db.buy_orders
+    bit = item_registry.bit(item)
+
+    def run(conn):
+        escrowed = conn.execute(
+            update(p).where(p.c.username == seller, _owns(item))
+            .values(inventory=_inventory().op("&")(~bit))
+        ).rowcount == 1
+        if not escrowed:
+            raise _Rejected(NOT_OWNED)
+
+        # best bid that covers the asking price fills at the bid (the resting order's price)
+        for _ in range(MATCH_ATTEMPTS):
+            best = (select(b.c.id)
+                    .where(b.c.status == "open", b.c.item == item,
+                           b.c.max_price >= price, b.c.buyer != seller)
+                    .order_by(b.c.max_price.desc(), b.c.id).limit(1).scalar_subquery())
+            order = conn.execute(
+                update(b).where(b.c.id == best, b.c.status == "open")
+                .values(status="filled", seller=seller, price=b.c.max_price)
+                .returning(b.c.id, b.c.buyer, b.c.max_price)
+            ).first()
+            if order is None:
+                break
+            try:
+                with db._savepoint(conn):
+                    _settle(conn, order.buyer, seller, item, order.max_price, held=order.max_price)
+            except _Rejected:
+                # the bidder got the item elsewhere meanwhile: cancel the bid, refund, try the next one
+                conn.execute(update(b).where(b.c.id == order.id)
+                             .values(status="cancelled", seller=None, price=None))
+                _refund(conn, order.buyer, order.max_price)
+                continue
+            conn.execute(insert(m).values(
+                seller=seller, item=item, price=order.max_price, status="sold",
+                buyer=order.buyer, timestamp=time.time(),
+            ))
+            return SOLD
+
+        conn.execute(insert(m).values(
+            seller=seller, item=item, price=price, status="active", buyer=None,
+            timestamp=time.time(),
+        ))
+        return LISTED
+
+    return _trade(run)
+
+
+def buy_listing(listing_id, buyer):
+    """Buy one listing. Returns BOUGHT, or why not (GONE, NO_FUNDS, OWNED, OWN_LISTING)."""
+    m = db.market
+
+    def run(conn):
+        listing = conn.execute(
+            update(m).where(m.c.id == listing_id, m.c.status == "active", m.c.seller != buyer)
+            .values(status="sold", buyer=buyer)
+            .returning(m.c.seller, m.c.item, m.c.price)
+        ).first()
+        if listing is None:
+            mine = conn.execute(select(m.c.id).where(m.c.id == listing_id, m.c.seller == buyer)).first()
+            raise _Rejected(OWN_LISTING if mine else GONE)
+        _settle(conn, buyer, listing.seller, listing.item, listing.price)
+        return BOUGHT
+
+    return _trade(run)
+
+
+def cancel_listing(listing_id, seller):
+    """Take an unsold listing down and give the item back. Returns CANCELLED or GONE."""
+    p, m = db.players, db.market
+
+    def run(conn):
+        listing = conn.execute(
+            update(m).where(m.c.id == listing_id, m.c.seller == seller, m.c.status == "active")
+            .values(status="cancelled").returning(m.c.item)
+        ).first()
+        if listing is None:
+            raise _Rejected(GONE)
+        conn.execute(update(p).where(p.c.username == seller)
+                     .values(inventory=_inventory().op("|")(item_registry.bit(listing.item))))
+        return CANCELLED
+
+    return _trade(run)
+
+
+# --- Buy orders ---
+def _refund(conn, username, amount):
+    _move_followers(conn, username, amount)
+    db._apply_clan_delta(conn, _clans(conn, username).get(username), followers=amount)
+
+
+def place_buy_order(buyer, item, max_price):
+    """Bid for an item. Fills right away against the cheapest listing <= max_price (FILLED),
+    otherwise holds max_price followers and rests (OPEN). Or NO_FUNDS / OWNED / DUPLICATE."""
+    p, m, b = db.players, db.market, db.buy_orders
+
+    def run(conn):
+        if conn.execute(select(b.c.id).where(b.c.buyer == buyer, b.c.item == item,
+                                             b.c.status == "open")).first():
+            raise _Rejected(DUPLICATE)
+
+        for _ in range(MATCH_ATTEMPTS):
+            cheapest = (select(m.c.id)
+                        .where(m.c.status == "active", m.c.item == item,
+                               m.c.price <= max_price, m.c.seller != buyer)
+                        .order_by(m.c.price, m.c.id).limit(1).scalar_subquery())
+            listing = conn.execute(
+                update(m).where(m.c.id == cheapest, m.c.status == "active")
+                .values(status="sold", buyer=buyer)
+                .returning(m.c.seller, m.c.price)
+            ).first()
+            if listing is None:
+                break
+            _settle(conn, buyer, listing.seller, item, listing.price)
+            conn.execute(insert(b).values(
+                buyer=buyer, item=item, max_price=max_price, status="filled",
+                seller=listing.seller, price=listing.price, timestamp=time.time(),
+            ))
+            return FILLED
+
+        # nothing to match: hold the followers and rest the order
+        if not _move_followers(conn, buyer, -max_price,
+                               require=and_(p.c.followers >= max_price, ~_owns(item))):
+            owned = conn.execute(select(_owns(item)).where(p.c.username == buyer)).scalar()
+            raise _Rejected(OWNED if owned else NO_FUNDS)
+        db._apply_clan_delta(conn, _clans(conn, buyer).get(buyer), followers=-max_price)
+        conn.execute(insert(b).values(
+            buyer=buyer, item=item, max_price=max_price, status="open", timestamp=time.time(),
+        ))
+        return OPEN
+
+    return _trade(run)
+
+
+def cancel_buy_order(order_id, buyer):
+    """Cancel an open bid and release the held followers. Returns CANCELLED or GONE."""
+    b = db.buy_orders
+
+    def run(conn):
+        order = conn.execute(
+            update(b).where(b.c.id == order_id, b.c.buyer == buyer, b.c.status == "open")
+            .values(status="cancelled").returning(b.c.max_price)
+        ).first()
+        if order is None:
+            raise _Rejected(GONE)
+        _refund(conn, buyer, order.max_price)
+        return CANCELLED
+
+    return _trade(run)
+
+
+# --- Browsing ---
+@db.prefetchable
+@cache.cached("market", ttl=5)
+def get_book_summary():
+    """Per item: active listings, best (lowest) ask and best (highest) open bid."""
+    m, b = db.market, db.buy_orders
+    with db._begin() as conn:
+        asks = conn.execute(
+            select(m.c.item, func.count(), func.min(m.c.price))
+            .where(m.c.status == "active").group_by(m.c.item)
+        ).all()
+        bids = dict(conn.execute(
+            select(b.c.item, func.max(b.c.max_price))
+            .where(b.c.status == "open").group_by(b.c.item)
+        ).all())
+    summary = {item: {"listings": n, "best_ask": ask, "best_bid": bids.pop(item, None)}
+               for item, n, ask in asks}
+    for item, bid in bids.items():
+        summary[item] = {"listings": 0, "best_ask": None, "best_bid": bid}
+    return summary
+
+
+@cache.cached("market", ttl=5)
+def get_listings(item, after=None, limit=PAGE_SIZE):
+    """Active listings for one item, cheapest first.
+
+    after: (price, id) of the last row of the previous page (keyset cursor).
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    m = db.market
+    query = select(m).where(m.c.status == "active", m.c.item == item)
+    if after is not None:
+        price, listing_id = after
+        query = query.where(or_(m.c.price > price, and_(m.c.price == price, m.c.id > listing_id)))
+    query = query.order_by(m.c.price, m.c.id).limit(limit + 1)
+
+    with db._begin() as conn:
+        rows = conn.execute(query).fetchall()
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        return rows[:limit], (last.price, last.id)
+    return rows, None
+
+
+@db.prefetchable
+def get_my_orders(username):
+    """(active listings, open buy orders) of one player."""
+    m, b = db.market, db.buy_orders
+    with db._begin() as conn:
+        listings = conn.execute(
+            select(m).where(m.c.seller == username, m.c.status == "active").order_by(m.c.id)
+        ).fetchall()
+        orders = conn.execute(
+            select(b).where(b.c.buyer == username, b.c.status == "open").order_by(b.c.id)
+        ).fetchall()
+    return listings, orders
@@ -0,0 +1,67 @@
+# pvp_batch.py - Vectorized PvP Battles
+# Version: v0.002
+# Notes:
+# - Resolves N battles in one NumPy pass (balancing runs, clan-war tournaments)
+# - Same rules as game_logic.pvp_battle; identical results for the same rolls
+# - Items passed as inventory bitmasks (item_registry), e.g. players.inventory
+
+import numpy as np
+import item_registry
+
+# --- Item bits that affect PvP ---
+ROCKET_POSTER = item_registry.bit("Rocket Poster 🚀")   # attacker +30
+SHADES = item_registry.bit("Shades 🕶️")                 # attacker +10
+FLAT_MAP = item_registry.bit("Flat Map 🧭")             # defender +15
+
+WIN_POINTS = 20
+LOSE_POINTS = 15
+
+
+def item_mask(items):
+    """Inventory bitmask from a mask, list or JSON inventory."""
+    return item_registry.to_mask(items)
+
+
+def draw_rolls(n, rng=None):
+    """Attacker and defender rolls (0..20) for n battles. rng: Generator or seed."""
+    rng = np.random.default_rng(rng)
+    return rng.integers(0, 21, size=n), rng.integers(0, 21, size=n)
+
+
+def resolve_battles(atk_points, def_points, def_followers, atk_items=0, def_items=0,
+                    rng=None, rolls=None):
+    """
+    Resolve a batch of PvP battles.
+
+    atk_points, def_points, def_followers: int arrays of length N
+    atk_items, def_items: int bitmask arrays (or scalars) of length N
+    rng: numpy Generator or seed, used when rolls is None
+    rolls: optional (atk_rolls, def_rolls) arrays, like pvp_battle(rolls=...)
+
+    Returns dict of arrays:
+      "win": bool, "followers_change": attacker follower gain (0 on loss),
+      "points_change": attacker points change (+20 / -15)
+    """
+    atk_points = np.asarray(atk_points, dtype=np.int64)
+    def_points = np.asarray(def_points, dtype=np.int64)
+    def_followers = np.asarray(def_followers, dtype=np.int64)
+    atk_items = np.asarray(atk_items, dtype=np.int64)
+    def_items = np.asarray(def_items, dtype=np.int64)
+
+    if rolls is None:
+        rolls = draw_rolls(len(atk_points), rng)
+    atk_rolls, def_rolls = (np.asarray(r, dtype=np.int64) for r in rolls)
+
+    atk_score = atk_points + atk_rolls
+    atk_score += np.where(atk_items & ROCKET_POSTER, 30, 0)
+    atk_score += np.where(atk_items & SHADES, 10, 0)
+    def_score = def_points + def_rolls + np.where(def_items & FLAT_MAP, 15, 0)
+
+    win = atk_score >= def_score
+    # int(followers * 0.1) truncates toward zero; astype does the same
+    steal = np.maximum(1, (def_followers * 0.1).astype(np.int64))
+    return {
+        "win": win,
+        "followers_change": np.where(win, steal, 0),
+        "points_change": np.where(win, WIN_POINTS, -LOSE_POINTS),
+    }
@@ -0,0 +1,137 @@
+# query_stats.py - SQL Instrumentation
+# Version: v0.004
+# Notes:
+# - before/after_cursor_execute hooks on db.engine (installed by db.py)
+# - Attributes statement count + wall time to the calling db helper and the tab that triggered it
+# - Slow queries (>= SLOW_QUERY_MS) logged right away; one JSON summary logged per rerun
+# - Summaries go to the "flat_earth.sql" logger as single-line JSON (scrapable by the metrics pipeline)
+# - SQL_LOG_LEVEL=WARNING keeps only the slow-query lines
+# - track_rerun() nests: inside an active rerun it joins it (fragments run inside full reruns too)
+# - order_book and quest_engine count as helper modules too
+# - So do matchmaking, auth and battle_archive (their SQL was reported as "unknown")
+
+import os, sys, json, time, logging, threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+logger = logging.getLogger("flat_earth.sql")
+if not logger.handlers:
+    # one JSON object per line on stderr, whatever the host app's logging setup is
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(os.getenv("SQL_LOG_LEVEL", "INFO"))
+    logger.propagate = False
+
+# Modules whose public functions count as "helpers"
+HELPER_MODULES = {"db", "ranking", "order_book", "quest_engine", "matchmaking", "auth", "battle_archive"}
+
+_current = ContextVar("flat_earth_query_stats", default=None)
+
+
+class RerunStats:
+    """Queries seen during one rerun, grouped by helper and by tab."""
+
+    def __init__(self, label=None):
+        self.label = label
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_ms = 0.0
+        self.by_helper = {}
+        self.by_tab = {}
+        self.slow = []
+        self._lock = threading.Lock()   # prefetch threads report into the same rerun
+
+    def record(self, helper, tab, ms, statement):
+        with self._lock:
+            self.queries += 1
+            self.db_ms += ms
+            for bucket, key in ((self.by_helper, helper), (self.by_tab, tab)):
+                entry = bucket.setdefault(key, {"count": 0, "ms": 0.0})
+                entry["count"] += 1
+                entry["ms"] += ms
+            if ms >= SLOW_QUERY_MS:
+                self.slow.append({"helper": helper, "tab": tab, "ms": round(ms, 2),
+                                  "sql": statement[:300]})
+
+    def summary(self):
+        with self._lock:
+            rounded = lambda bucket: {
+                k: {"count": v["count"], "ms": round(v["ms"], 2)}
+                for k, v in sorted(bucket.items(), key=lambda kv: -kv[1]["ms"])
+            }
+            return {
+                "label": self.label,
+                "queries": self.queries,
+                "db_ms": round(self.db_ms, 2),
+                "rerun_ms": round((time.perf_counter() - self.started) * 1000, 2),
+                "by_helper": rounded(self.by_helper),
+                "by_tab": rounded(self.by_tab),
+                "slow": list(self.slow),
+            }
+
+
+@contextmanager
+def track_rerun(label=None):
+    """Collect query stats for everything executed in this block; logs the JSON summary at the end."""
+    outer = _current.get()
+    if outer is not None:
+        yield outer
+        return
+    stats = RerunStats(label)
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+        logger.info(json.dumps({"event": "rerun_sql", **stats.summary()}, ensure_ascii=False))
+
+
+def current():
+    """RerunStats of the active rerun (None outside track_rerun)."""
+    return _current.get()
+
+
+# --- Attribution ---
+def _caller():
+    """(helper, tab) for the statement being executed, found by walking the stack."""
+    helper, tab = "unknown", "app"
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        name = frame.f_code.co_name
+        if helper == "unknown" and module in HELPER_MODULES and not name.startswith("_"):
+            helper = f"{module}.{getattr(frame.f_code, 'co_qualname', name)}"
+        if module.startswith("tabs."):
+            tab = module[len("tabs."):]
+            break
+        frame = frame.f_back
+    return helper, tab
+
+
+# --- Hooks ---
+def _before(conn, cursor, statement, parameters, context, executemany):
+    context._query_start = time.perf_counter()
+
+
+def _after(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_query_start", None)
+    if started is None:
+        return
+    ms = (time.perf_counter() - started) * 1000
+    stats = _current.get()
+    if stats is None and ms < SLOW_QUERY_MS:
+        return
+    helper, tab = _caller()
+    if stats is not None:
+        stats.record(helper, tab, ms, statement)
+    if ms >= SLOW_QUERY_MS:
+        logger.warning(json.dumps({"event": "slow_query", "helper": helper, "tab": tab,
+                                   "ms": round(ms, 2), "sql": statement[:300]}, ensure_ascii=False))
+
+
+def install(engine):
+    event.listen(engine, "before_cursor_execute", _before)
+    event.listen(engine, "after_cursor_execute", _after)
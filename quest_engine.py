@@ -0,0 +1,64 @@
+# quest_engine.py - Quest Progress Engine
+# Version: v0.002
+# Notes:
+# - Subscribes to game_events: every batch of events becomes one atomic increment per
+#   (username, quest_type): UPDATE quests SET progress = min(progress + n, goal) ... RETURNING
+# - Completions are settled in the same transaction: reward followers + quest points credited to
+#   the player (and clan_totals); returned as QuestCompleted events for the UI
+# - Point rewards stamp players.updated_at (matchmaking refresh)
+# - Replaces the per-row update_quest_progress/complete_quest loops in the tabs
+
+from collections import Counter
+from sqlalchemy import update, select, case
+import time
+import db
+import game_events
+from game_events import QuestCompleted
+
+# Credibility points per completed quest, on top of the followers reward
+QUEST_POINTS = {"battle": 5, "meme": 2, "debate": 3, "boss": 10}
+
+
+@game_events.subscribe
+def apply_events(events):
+    """Advance quests for a batch of events. Returns the QuestCompleted events."""
+    counts = Counter((e.username, e.quest_type) for e in events if e.username and e.quest_type)
+    if not counts:
+        return []
+
+    q = db.quests
+    completed = []
+    with db._begin() as conn:
+        for (username, quest_type), n in counts.items():
+            reached = q.c.progress + n >= q.c.goal
+            completed += conn.execute(
+                update(q)
+                .where(q.c.username == username, q.c.quest_type == quest_type, q.c.completed == 0)
+                .values(progress=case((reached, q.c.goal), else_=q.c.progress + n),
+                        completed=case((reached, 1), else_=0))
+                .returning(q.c.username, q.c.quest_type, q.c.reward, q.c.completed)
+            ).fetchall()
+
+        done = [QuestCompleted(row.username, kind=row.quest_type, followers=int(row.reward),
+                               points=QUEST_POINTS.get(row.quest_type, 1))
+                for row in completed if row.completed]
+        if done:
+            _credit(conn, done)
+    if done:
+        db._invalidate("leaderboard", "clan_stats")
+    return done
+
+
+def _credit(conn, done):
+    """Pay quest rewards: one UPDATE per player, clan_totals in step."""
+    p = db.players
+    rewards = {}
+    for event in done:
+        followers, points = rewards.get(event.username, (0, 0))
+        rewards[event.username] = (followers + event.followers, points + event.points)
+    clans = dict(conn.execute(select(p.c.username, p.c.clan).where(p.c.username.in_(rewards))).all())
+    for username, (followers, points) in sorted(rewards.items()):
+        conn.execute(update(p).where(p.c.username == username).values(
+            followers=p.c.followers + followers, points=p.c.points + points, updated_at=time.time(),
+        ))
+        db._apply_clan_delta(conn, clans.get(username), followers=followers, points=points)
@@ -0,0 +1,99 @@
+# ranking.py - Leaderboard Ranking Service
+# Version: v0.002
+# Notes:
+# - Serves the leaderboard from db.player_rankings (rebuilt every RANKING_REFRESH_SECONDS)
+# - The rebuild runs as a job (python jobs.py refresh-rankings, scheduled every minute), not inline in
+#   whichever leaderboard rerun hit the timer in each process; reads here never write
+# - Clan filter + sort happen in SQL; pages use keyset pagination on the precomputed rank
+# - "My rank" is a primary-key lookup, no matter how many players there are
+
+import os
+from sqlalchemy import select, insert, delete, func, text
+import db
+import cache
+
+RANKING_REFRESH_SECONDS = int(os.getenv("RANKING_REFRESH_SECONDS", "60"))
+PAGE_SIZE = 20
+
+
+def rebuild_rankings(conn):
+    """Replace player_rankings with a fresh ranking of every player on conn.
+
+    delete + INSERT ... SELECT with one window function per ranked stat, in the
+    caller's transaction, so readers keep seeing the previous ranking until it commits.
+    """
+    p = db.players
+    ranks = [
+        func.row_number().over(order_by=(p.c[stat].desc(), p.c.username)).label(f"rank_{stat}")
+        for stat in db.RANKED_STATS
+    ]
+    source = select(
+        p.c.username, p.c.clan, p.c.level, p.c.points, p.c.followers,
+        p.c.wins, p.c.losses, func.coalesce(p.c.inventory, 0), *ranks,
+    )
+    columns = ["username", "clan", "level", "points", "followers", "wins", "losses", "inventory"]
+    columns += [f"rank_{stat}" for stat in db.RANKED_STATS]
+    conn.execute(delete(db.player_rankings))
+    conn.execute(insert(db.player_rankings).from_select(columns, source))
+
+
+def refresh_rankings():
+    """Rebuild player_rankings (jobs.py refresh-rankings, every RANKING_REFRESH_SECONDS).
+
+    Never called on a rerun: the rebuild rewrites the whole table. Returns False
+    if another process is already rebuilding (Postgres advisory lock).
+    """
+    with db.engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            if not conn.execute(text("SELECT pg_try_advisory_xact_lock(4243)")).scalar():
+                return False
+        rebuild_rankings(conn)
+    cache.invalidate("ranking")
+    return True
+
+
+def _rank_column(order_by):
+    if order_by not in db.RANKED_STATS:
+        order_by = "points"
+    return db.player_rankings.c[f"rank_{order_by}"]
+
+
+@cache.cached("ranking", ttl=RANKING_REFRESH_SECONDS)
+def get_ranking_page(order_by="points", clan=None, after_rank=None, limit=PAGE_SIZE):
+    """One leaderboard page, best first.
+
+    after_rank: rank of the last row of the previous page (keyset cursor).
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    rank = _rank_column(order_by)
+    query = select(db.player_rankings, rank.label("rank"))
+    if clan:
+        query = query.where(db.player_rankings.c.clan == clan)
+    if after_rank is not None:
+        query = query.where(rank > after_rank)
+    query = query.order_by(rank).limit(limit + 1)
+
+    with db._begin() as conn:
+        rows = conn.execute(query).fetchall()
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1].rank
+    return rows, None
+
+
+def get_my_rank(username, order_by="points"):
+    """(rank, total ranked players) for one player, or None if not ranked yet."""
+    rank = _rank_column(order_by)
+    with db._begin() as conn:
+        mine = conn.execute(
+            select(rank).where(db.player_rankings.c.username == username)
+        ).scalar()
+    if mine is None:
+        return None
+    return mine, _ranked_total()
+
+
+@cache.cached("ranking", ttl=RANKING_REFRESH_SECONDS)
+def _ranked_total():
+    # ranks are dense 1..N, so the max rank is the player count (one index probe)
+    with db._begin() as conn:
+        return conn.execute(select(func.max(db.player_rankings.c.rank_points))).scalar() or 0
@@ -0,0 +1,33 @@
+# sections.py - Game page sections and the reads they issue
+# Version: v0.001
+# Notes:
+# - SECTIONS: the sidebar navigation of the game page (app.py), in display order
+# - SECTION_READS: the independent reads each section's tabs issue, as (helper, *args) calls for db.prefetch();
+#   app.py prefetches them at the top of the rerun, benchmarks/load_test.py --prefetch replays the same table
+# - No streamlit import, so benchmarks and jobs can use it headless
+
+from db import (
+    get_quests, get_battle_log, get_achievements, get_active_event,
+    get_clan_stats, get_clan_history, get_clan_streak, get_longest_streaks
+)
+from order_book import get_book_summary, get_my_orders
+
+SECTIONS = [
+    "📋 Profile",
+    "🎯 Quests",
+    "⚔️ Battles",
+    "🏰 Clan",
+    "🛒 Shop",
+    "📜 Others"
+]
+
+# Independent reads each section's tabs issue, prefetched in parallel at the top of the rerun
+SECTION_READS = {
+    "📋 Profile": lambda username: [(get_quests, username)],
+    "🎯 Quests": lambda username: [(get_quests, username)],
+    "⚔️ Battles": lambda username: [(get_battle_log, username)],
+    "🏰 Clan": lambda username: [(get_clan_stats,), (get_clan_history, 10), (get_clan_streak,),
+                                (get_longest_streaks,)],
+    "🛒 Shop": lambda username: [(get_book_summary,), (get_my_orders, username)],
+    "📜 Others": lambda username: [(get_achievements, username), (get_active_event,)],
+}
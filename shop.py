@@ -1,11 +1,10 @@
 # shop.py - Item Shop & Upgrades
-# Version: v0.002
+# Version: v0.003
 # Notes:
 # - Fixed bug: items always treated as list
 # - Safe JSON handling
 # - Upgrade paths supported
-
-import json
+# - Inventory is an item_registry bitmask: buy/upgrade are bit operations
 
 # --- Shop Items ---
 shop_items = {
@@ -25,54 +24,47 @@ upgrade_paths = {
 
 
 # --- Buy Item ---
-def buy_item(item, followers, items):
-    # Normalize items
-    if isinstance(items, str):
-        try:
-            items = json.loads(items)
-        except:
-            items = []
-    elif not isinstance(items, list):
-        items = []
+def buy_item(item, followers, inventory):
+    # Normalize (mask, list or legacy JSON) -> mask
+    # (imported here: item_registry builds its bit table from this module)
+    import item_registry as reg
+    inventory = reg.to_mask(inventory)
 
     cost = shop_items[item]["cost"]
     if followers < cost:
-        return followers, items, f"⚠️ Not enough followers to buy {item}."
+        return followers, inventory, f"⚠️ Not enough followers to buy {item}."
 
-    if item in items:
-        return followers, items, f"⚠️ You already own {item}."
+    if reg.has(inventory, item):
+        return followers, inventory, f"⚠️ You already own {item}."
 
     followers -= cost
-    items.append(item)
-    return followers, items, f"✅ Bought {item}!"
+    inventory = reg.add(inventory, item)
+    return followers, inventory, f"✅ Bought {item}!"
 
 
 # --- Upgrade Item ---
-def upgrade_item(item, followers, items):
-    # Normalize items
-    if isinstance(items, str):
-        try:
-            items = json.loads(items)
-        except:
-            items = []
-    elif not isinstance(items, list):
-        items = []
+def upgrade_item(item, followers, inventory):
+    # Normalize (mask, list or legacy JSON) -> mask
+    import item_registry as reg
+    inventory = reg.to_mask(inventory)
 
     if item not in upgrade_paths:
-        return followers, items, f"⚠️ {item} cannot be upgraded."
+        return followers, inventory, f"⚠️ {item} cannot be upgraded."
+
+    if not reg.has(inventory, item):
+        return followers, inventory, f"⚠️ You don't own {item}."
 
     path = upgrade_paths[item]
     target, cost = path["target"], path["cost"]
 
     if followers < cost:
-        return followers, items, f"⚠️ Not enough followers to upgrade {item}."
+        return followers, inventory, f"⚠️ Not enough followers to upgrade {item}."
 
-    if target in items:
-        return followers, items, f"⚠️ You already upgraded to {target}."
+    if reg.has(inventory, target):
+        return followers, inventory, f"⚠️ You already upgraded to {target}."
 
     # Perform upgrade
     followers -= cost
-    items.remove(item)
-    items.append(target)
+    inventory = reg.add(reg.remove(inventory, item), target)
 
-    return followers, items, f"✨ {item} upgraded → {target}!"
+    return followers, inventory, f"✨ {item} upgraded → {target}!"
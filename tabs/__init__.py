@@ -12,3 +12,4 @@ from . import quests_tab
 from . import achievements_tab
 from . import market_tab
 from . import events_tab
+from . import debug_tab
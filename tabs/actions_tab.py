@@ -1,14 +1,18 @@
 # actions_tab.py - Player Actions
-# Version: v0.002
+# Version: v0.004
 # Notes:
+# - DB save goes through session PlayerState (skipped when nothing changed)
+# - Inventory is an item bitmask (item_registry)
 # - Updates both session_state and DB instantly
 # - Fix: profile tab shows updated stats right away
+# - Memes/debates emit game_events; quest_engine advances quests in one UPDATE (no per-row loops)
 
 import streamlit as st
-from db import get_quests, update_quest_progress, complete_quest, update_player
 from game_logic import post_meme, debate_globie, level_up
+from game_events import collect
+from .fragment_utils import apply_quest_rewards
 
-def render(username, energy, points, followers, level, items):
+def render(username, energy, points, followers, level, inventory):
     st.subheader("🎯 Actions")
 
     # Load from session_state if available
@@ -16,35 +20,26 @@ def render(username, energy, points, followers, level, items):
     points = st.session_state.get("points", points)
     followers = st.session_state.get("followers", followers)
     level = st.session_state.get("level", level)
-    items = st.session_state.get("items", items)
+    inventory = st.session_state.get("inventory", inventory)
     wins = st.session_state.get("wins", 0)
     losses = st.session_state.get("losses", 0)
 
-    if st.button("📢 Post a Meme"):
-        energy, points, followers, msg = post_meme(energy, points, followers, items)
-        if "⚠️" in msg:
-            st.warning(msg)
-        else:
-            st.success(msg)
-        for q in get_quests(username):
-            if q[1] == "meme" and not q[5]:
-                update_quest_progress(q[0], 1)
-                if q[2]+1 >= q[3]:
-                    complete_quest(q[0])
+    with collect() as batch:
+        if st.button("📢 Post a Meme"):
+            energy, points, followers, msg = post_meme(energy, points, followers, inventory, username=username)
+            if "⚠️" in msg:
+                st.warning(msg)
+            else:
+                st.success(msg)
 
-    if st.button("⚔️ Debate a Globie"):
-        energy, points, followers, msg = debate_globie(energy, points, followers, items)
-        if "WON" in msg:
-            st.success(msg)
-        elif "⚠️" in msg:
-            st.warning(msg)
-        else:
-            st.error(msg)
-        for q in get_quests(username):
-            if q[1] == "debate" and not q[5]:
-                update_quest_progress(q[0], 1)
-                if q[2]+1 >= q[3]:
-                    complete_quest(q[0])
+        if st.button("⚔️ Debate a Globie"):
+            energy, points, followers, msg = debate_globie(energy, points, followers, inventory, username=username)
+            if "WON" in msg:
+                st.success(msg)
+            elif "⚠️" in msg:
+                st.warning(msg)
+            else:
+                st.error(msg)
 
     # Level up check
     level, energy, lvl_msg = level_up(points, level, energy)
@@ -57,11 +52,15 @@ def render(username, energy, points, followers, level, items):
     st.session_state.points = points
     st.session_state.followers = followers
     st.session_state.level = level
-    st.session_state.items = items
+    st.session_state.inventory = inventory
     st.session_state.wins = wins
     st.session_state.losses = losses
 
-    # ✅ Save to DB immediately
-    update_player(username, energy, points, level, followers, items, wins, losses)
+    # ✅ Save to DB immediately (only the fields that changed)
+    player = st.session_state.player_state
+    player.update_from(st.session_state)
+    if apply_quest_rewards(player, batch):   # rewards are already in the DB
+        followers, points = player.followers, player.points
+    player.save()
 
     return energy, points, followers, level
@@ -1,6 +1,9 @@
 # battle_log_tab.py - Battle History
-# Version: v0.001
+# Version: v0.002
 # Notes: Shows logs of fights.
+# - Reads the player's recent_battles ring (one primary-key read), newest first
+# - Incoming attacks are shown too (role "defend")
+# - Fix: rows are read by column name (the old 6-value unpack broke on the battles id column)
 
 import streamlit as st, time
 from db import get_battle_log
@@ -10,11 +13,14 @@ def render(username):
     logs = get_battle_log(username)
     if logs:
         for log in logs:
-            attacker, defender, outcome, f_change, p_change, ts = log
-            ts_fmt = time.strftime("%Y-%m-%d %H:%M", time.localtime(ts))
-            if outcome == "win" and attacker == username:
-                st.success(f"[{ts_fmt}] You beat {defender} ➜ +{f_change} followers, +{p_change} points")
-            elif outcome == "lose" and attacker == username:
-                st.error(f"[{ts_fmt}] You lost vs {defender} ➜ {p_change} points")
+            ts_fmt = time.strftime("%Y-%m-%d %H:%M", time.localtime(log.timestamp))
+            if log.role == "attack" and log.outcome == "win":
+                st.success(f"[{ts_fmt}] You beat {log.opponent} ➜ +{log.followers_change} followers, +{log.points_change} points")
+            elif log.role == "attack":
+                st.error(f"[{ts_fmt}] You lost vs {log.opponent} ➜ {log.points_change} points")
+            elif log.outcome == "win":
+                st.info(f"[{ts_fmt}] 🛡️ You fended off an attack by {log.opponent}")
+            else:
+                st.warning(f"[{ts_fmt}] 🛡️ {log.opponent} attacked you and won")
     else:
         st.info("No battles yet.")
@@ -1,15 +1,34 @@
 # boss_battle_tab.py - Boss Battle Feature
-# Version: v0.002
+# Version: v0.007
 # Notes:
 # - Fixed unpacking error (boss table has 7 columns)
 # - Now supports boss.active flag
+# - Saves through session PlayerState (no more level/wins/losses reset on attack)
+# - Attacks go through db.attack_boss: defeat + rewards are settled once, server-side
+# - Boss panel is an st.fragment: an attack reruns only this panel (no full-app st.rerun())
+# - Hits emit game_events.BossAttacked (from db.attack_boss) -> boss quests advance
+# - Energy re-derived on every panel rerun (PlayerState.refresh_energy), not frozen at the last full rerun
 
 import streamlit as st
-from db import get_active_boss, damage_boss, spawn_boss, update_player
+from db import get_active_boss, attack_boss, spawn_boss, unit_of_work
+from query_stats import track_rerun
+from game_events import collect
+from .fragment_utils import rerun_fragment, save_player, apply_quest_rewards
 
-def render(username, energy, points, followers, items):
+def render(username):
     st.subheader("👹 Boss Battle")
+    boss_panel(username)
 
+
+@st.fragment
+def boss_panel(username):
+    player = st.session_state.player_state
+    player.refresh_energy()
+    with unit_of_work(), track_rerun(f"{username}:boss"):
+        _boss_panel(username, player)
+
+
+def _boss_panel(username, player):
     # Fetch current boss
     boss = get_active_boss()
 
@@ -18,8 +37,8 @@ def render(username, energy, points, followers, items):
         if st.button("⚡ Spawn New Boss (Admin Only)"):
             spawn_boss()
             st.success("A new boss has spawned! 👹")
-            st.rerun()
-        return energy, points, followers
+            rerun_fragment()
+        return
 
     # ✅ Unpack all 7 fields
     boss_id, name, max_hp, hp, reward_followers, reward_points, active = boss
@@ -27,28 +46,33 @@ def render(username, energy, points, followers, items):
     # Boss status
     st.write(f"**{name}** - HP: {hp}/{max_hp}")
     st.progress(hp / max_hp)
+    st.caption(f"⚡ Energy: {player.energy}")
 
     if hp <= 0:
-        st.success(f"🎉 {name} has been defeated! Every participant earns "
+        # Rewards were already paid to every participant when the boss fell
+        st.success(f"🎉 {name} has been defeated! Every participant earned "
                    f"{reward_followers} Followers and {reward_points} Points!")
-        # Reward current player (simple distribution)
-        followers += reward_followers
-        points += reward_points
-        update_player(username, energy, points, 1, followers, items, 0, 0)
-        return energy, points, followers
+        return
 
     # Attack button
     if st.button("⚔️ Attack Boss (-2 Energy)"):
-        if energy < 2:
+        if player.energy < 2:
             st.warning("⚠️ Not enough energy to attack!")
         else:
             dmg = 50  # flat damage for now, can be scaled later
-            energy -= 2
-            st.success(f"💥 You hit {name} for {dmg} damage!")
-            damage_boss(dmg)
-
-            # Save after attack
-            update_player(username, energy, points, 1, followers, items, 0, 0)
-            st.rerun()
+            player.energy -= 2
+            with collect() as batch:
+                result = attack_boss(username, dmg)
+            if result is None:
+                st.toast(f"{name} was already defeated!")
+            else:
+                st.toast(f"💥 You hit {name} for {dmg} damage!")
+                if result["defeated"]:
+                    st.balloons()
+                    st.toast(f"🎉 {name} has been defeated! Every participant earns "
+                             f"{reward_followers} Followers and {reward_points} Points!")
 
-    return energy, points, followers
+            # The payouts are already in the DB; the panel redraws with the new HP
+            apply_quest_rewards(player, batch)
+            save_player(player)
+            rerun_fragment()
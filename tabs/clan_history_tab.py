@@ -1,19 +1,26 @@
 # clan_history_tab.py - Clan War History
-# Version: v0.001
-# Notes: Shows history of winning clans.
+# Version: v0.002
+# Notes:
+# - Shows history of winning clans
+# - Streaks come from db.clan_streaks (constant-time read, no history scan)
 
 import streamlit as st, time
-from db import get_clan_history, get_clan_streak
+from db import get_clan_history, get_clan_streak, get_longest_streaks
 
 def render():
     st.subheader("📜 Clan War History")
     history = get_clan_history(10)
     if history:
-        for clan,ts in history:
-            ts_fmt = time.strftime("%Y-%m-%d %H:%M", time.localtime(ts))
-            st.write(f"🏆 {clan} won on {ts_fmt}")
-        streak_clan,streak_count=get_clan_streak()
-        if streak_count>1:
+        for row in history:
+            ts_fmt = time.strftime("%Y-%m-%d %H:%M", time.localtime(row.timestamp))
+            st.write(f"🏆 {row.clan} won on {ts_fmt}")
+        streak_clan, streak_count = get_clan_streak()
+        if streak_count > 1:
             st.success(f"🔥 {streak_clan} are on a {streak_count}-week streak!")
+        best = get_longest_streaks()
+        if best:
+            st.caption("Longest streaks: " + ", ".join(
+                f"{row.clan} {row.longest_streak}w" for row in best
+            ))
     else:
         st.info("No history yet.")
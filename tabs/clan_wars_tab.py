@@ -1,6 +1,8 @@
 # clan_wars_tab.py - Clan Stats
-# Version: v0.001
-# Notes: Displays clan war progress.
+# Version: v0.002
+# Notes:
+# - Displays clan war progress
+# - Reads db.clan_totals (kept current incrementally), no GROUP BY over players
 
 import streamlit as st
 from db import get_clan_stats
@@ -10,11 +12,11 @@ def render():
     stats = get_clan_stats()
     if stats:
         table = []
-        for clan_name, total_points, members, total_wins, total_losses in stats:
-            avg_points = round(total_points / max(1,members),2)
-            table.append({"Clan": clan_name,"Total Points": total_points,
-                          "Members": members,"Avg Points": avg_points,
-                          "Wins": total_wins,"Losses": total_losses})
+        for row in stats:
+            avg_points = round(row.points / max(1, row.members), 2)
+            table.append({"Clan": row.clan, "Total Points": row.points,
+                          "Members": row.members, "Avg Points": avg_points,
+                          "Wins": row.wins, "Losses": row.losses})
         st.table(table)
     else:
         st.info("No clans yet.")
@@ -0,0 +1,24 @@
+# debug_tab.py - SQL Debug Panel
+# Version: v0.001
+# Notes:
+# - Sidebar panel with this rerun's query count / DB time per helper and per tab
+# - Shown with ?debug=1 in the URL or DEBUG_SQL=1 in the environment
+
+import streamlit as st
+
+def render(summary, cache_summary=None):
+    with st.expander(f"🐞 SQL: {summary['queries']} queries, {summary['db_ms']} ms", expanded=False):
+        st.caption(f"Rerun so far: {summary['rerun_ms']} ms")
+        st.write("**By helper**")
+        st.table([{"Helper": k, "Queries": v["count"], "ms": v["ms"]}
+                  for k, v in summary["by_helper"].items()])
+        st.write("**By tab**")
+        st.table([{"Tab": k, "Queries": v["count"], "ms": v["ms"]}
+                  for k, v in summary["by_tab"].items()])
+        if summary["slow"]:
+            st.write("**Slow queries**")
+            for q in summary["slow"]:
+                st.code(f"[{q['ms']} ms] {q['helper']} ({q['tab']})\n{q['sql']}", language="sql")
+        if cache_summary:
+            st.caption(f"Cache hit rate: {cache_summary['hit_rate']:.0%} "
+                       f"({cache_summary['hits']} hits / {cache_summary['misses']} misses)")
@@ -0,0 +1,46 @@
+# fragment_utils.py - Helpers for st.fragment tabs
+# Version: v0.003
+# Notes:
+# - rerun_fragment(): redraw only the current fragment after an action
+# - Falls back to a full rerun when the click is processed in a full-script run
+#   (scope="fragment" is only allowed during fragment reruns)
+# - save_player()/sync_session(): keep the session keys app.py saves from in step with the
+#   fragment's PlayerState, so app.py's end-of-run save can't write stale values back
+# - apply_quest_rewards(): pick up quest rewards quest_engine already credited in the DB
+
+import streamlit as st
+from streamlit.errors import StreamlitAPIException
+from db import get_player
+from game_events import QuestCompleted
+
+
+def rerun_fragment():
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+
+def sync_session(player):
+    """Copy the PlayerState fields into the matching st.session_state keys."""
+    for field in player.FIELDS:
+        st.session_state[field] = getattr(player, field)
+
+
+def save_player(player):
+    """Save the fragment's PlayerState and mirror it into the session."""
+    saved = player.save()
+    sync_session(player)
+    return saved
+
+
+def apply_quest_rewards(player, batch):
+    """Mark the rewards of quests completed in a game_events batch as applied; toast each one."""
+    done = [e for e in batch.results if isinstance(e, QuestCompleted) and e.username == player.username]
+    if done:
+        row = get_player(player.username)
+        player.mark_applied(followers=row.followers, points=row.points)
+        sync_session(player)
+        for event in done:
+            st.toast(f"🎉 {event.kind.capitalize()} Quest Completed! +{event.followers} Followers, +{event.points} Points")
+    return done
@@ -1,31 +1,56 @@
 # leaderboard_tab.py - Rankings
-# Version: v0.001
-# Notes: Displays leaderboard with filters.
+# Version: v0.004
+# Notes:
+# - Displays leaderboard with filters
+# - Item count from the inventory bitmask (no JSON decode per row)
+# - Served by ranking.py: clan filter + sort in SQL, keyset pages, "my rank"
+# - Read-only: player_rankings is rebuilt by jobs.py refresh-rankings
 
-import streamlit as st, json
-from db import get_leaderboard
+import streamlit as st
+from item_registry import count
+from ranking import get_ranking_page, get_my_rank
 
-def render():
+def render(username=None):
     st.subheader("🏆 Leaderboard")
     clan_filter = st.radio("Filter by:", ["All", "Flat Earthers 🌐", "Globies 🌍"])
     sort_choice = st.radio("Sort by:", ["Points", "Followers", "Level", "Wins", "Losses"])
-    leaders = get_leaderboard(sort_choice.lower())
+    order_by = sort_choice.lower()
+    clan = None if clan_filter == "All" else clan_filter
 
-    if clan_filter != "All":
-        leaders = [row for row in leaders if row[11] == clan_filter]
+    # --- Keyset pagination (cursor stack, reset when filter/sort change) ---
+    view = (order_by, clan)
+    if st.session_state.get("lb_view") != view:
+        st.session_state.lb_view = view
+        st.session_state.lb_cursors = [None]
+    cursors = st.session_state.lb_cursors
+
+    leaders, next_cursor = get_ranking_page(order_by, clan, cursors[-1])
+
+    if username:
+        mine = get_my_rank(username, order_by)
+        if mine:
+            st.caption(f"📍 You are #{mine[0]} of {mine[1]} by {sort_choice}")
 
     if leaders:
         st.table([{
-            "Username": row[1],
-            "Level": row[5],
-            "Points": row[4],
-            "Followers": row[6],
-            "Clan": row[11],
-            "Items": len(json.loads(row[7])) if row[7] else 0,
-            "Wins": row[9],
-            "Losses": row[10],
-            "W/L": round(row[9] / max(1, row[10]), 2) if row[10] > 0 else row[9]
+            "Rank": row.rank,
+            "Username": row.username,
+            "Level": row.level,
+            "Points": row.points,
+            "Followers": row.followers,
+            "Clan": row.clan,
+            "Items": count(row.inventory or 0),
+            "Wins": row.wins,
+            "Losses": row.losses,
+            "W/L": round(row.wins / max(1, row.losses), 2) if row.losses > 0 else row.wins
         } for row in leaders])
     else:
         st.info("No players yet.")
 
+    col_prev, col_next = st.columns(2)
+    if len(cursors) > 1 and col_prev.button("⬅️ Previous", key="lb_prev"):
+        cursors.pop()
+        st.rerun()
+    if next_cursor is not None and col_next.button("Next ➡️", key="lb_next"):
+        cursors.append(next_cursor)
+        st.rerun()
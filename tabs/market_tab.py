@@ -1,25 +1,121 @@
+# market_tab.py - Player Market
+# Version: v0.002
+# Notes:
+# - Listings + buy buttons live in an st.fragment: listing/buying reruns only the market
+# - State comes from / is saved through st.session_state.player_state
+# - Backed by order_book.py: trades settle in the DB (escrowed items, conditional purchase),
+#   the PlayerState only picks up the result via mark_applied()
+# - Browse one item at a time, cheapest first, with Previous/Next pages (keyset cursors)
+# - Buy orders: bid a max price, filled right away or as soon as someone lists at/below it
+
 import streamlit as st
-from db import list_item, get_market, buy_market_item
+from db import get_player, unit_of_work
+from order_book import (
+    list_item, buy_listing, cancel_listing, place_buy_order, cancel_buy_order,
+    get_book_summary, get_listings, get_my_orders,
+    BOUGHT, LISTED, SOLD, FILLED, OPEN, CANCELLED, GONE, NO_FUNDS, OWNED, NOT_OWNED, OWN_LISTING, DUPLICATE,
+)
+from item_registry import ITEMS, to_names
+from query_stats import track_rerun
+from .fragment_utils import rerun_fragment, sync_session
+
+MESSAGES = {
+    BOUGHT: "✅ Bought!",
+    LISTED: "✅ Listed for sale.",
+    SOLD: "💰 Sold right away to a waiting buy order!",
+    FILLED: "✅ Buy order filled right away!",
+    OPEN: "📌 Buy order placed; your followers are held until it fills or you cancel.",
+    CANCELLED: "🗑️ Cancelled.",
+    GONE: "⚠️ Too late, someone else got there first.",
+    NO_FUNDS: "⚠️ Not enough followers!",
+    OWNED: "⚠️ You already own that item.",
+    NOT_OWNED: "⚠️ You don't have that item anymore.",
+    OWN_LISTING: "⚠️ That's your own listing.",
+    DUPLICATE: "⚠️ You already have an open buy order for that item.",
+}
 
-def render(username, followers, items):
+def render(username):
     st.subheader("💱 Market")
+    market_board(username)
+
+
+@st.fragment
+def market_board(username):
+    player = st.session_state.player_state
+    with unit_of_work(), track_rerun(f"{username}:market"):
+        _market_board(username, player)
+
+
+def _after_trade(player, result, ok_results):
+    """Show the result; on success pull the DB-settled followers/inventory into the PlayerState."""
+    if result in ok_results:
+        row = get_player(player.username)
+        player.mark_applied(followers=row.followers, inventory=row.inventory or 0)
+        sync_session(player)
+        st.toast(MESSAGES[result])
+        rerun_fragment()
+    st.warning(MESSAGES[result])
+
+
+def _market_board(username, player):
+    summary = get_book_summary()
+    st.caption(f"👥 Followers: {player.followers}")
+
+    # --- Sell ---
+    items = to_names(player.inventory)
     if items:
-        sell_item = st.selectbox("Item to sell", items)
-        price = st.number_input("Price (followers)",1,1000,50)
+        sell_item = st.selectbox("Item to sell", items, key="mk_sell_item")
+        price = st.number_input("Price (followers)", 1, 1000, 50, key="mk_sell_price")
         if st.button("List for Sale"):
-            list_item(username,sell_item,price)
-            st.success(f"Listed {sell_item} for {price} followers.")
+            _after_trade(player, list_item(username, sell_item, price), (LISTED, SOLD))
 
     st.divider()
-    st.write("Active Listings:")
-    for mid,seller,item,price,status,buyer in get_market():
-        if seller!=username:
-            if st.button(f"Buy {item} from {seller} ({price} followers)", key=f"buy{mid}"):
-                if followers>=price:
-                    followers-=price; items.append(item)
-                    buy_market_item(mid,username)
-                    st.success(f"Bought {item} for {price} followers!")
-                else:
-                    st.warning("Not enough followers!")
-
-    return followers, items
+
+    # --- Browse one item, cheapest first ---
+    def label(item):
+        book = summary.get(item)
+        if not book:
+            return item
+        ask = f"from {book['best_ask']}" if book["best_ask"] is not None else "none listed"
+        bid = f", best bid {book['best_bid']}" if book["best_bid"] is not None else ""
+        return f"{item} ({book['listings']} {ask}{bid})"
+
+    item = st.selectbox("Browse", ITEMS, format_func=label, key="mk_item")
+    if st.session_state.get("mk_view") != item:
+        st.session_state.mk_view = item
+        st.session_state.mk_cursors = [None]   # cursor stack: one entry per page visited
+    cursors = st.session_state.mk_cursors
+
+    listings, next_cursor = get_listings(item, cursors[-1])
+    if not listings:
+        st.info("No active listings for this item.")
+    for listing in listings:
+        if listing.seller == username:
+            st.write(f"{listing.price} followers, your listing")
+        elif st.button(f"Buy from {listing.seller} ({listing.price} followers)", key=f"buy{listing.id}"):
+            _after_trade(player, buy_listing(listing.id, username), (BOUGHT,))
+
+    col_prev, col_next = st.columns(2)
+    if len(cursors) > 1 and col_prev.button("⬅️ Cheaper", key="mk_prev"):
+        cursors.pop()
+        rerun_fragment()
+    if next_cursor is not None and col_next.button("Pricier ➡️", key="mk_next"):
+        cursors.append(next_cursor)
+        rerun_fragment()
+
+    # --- Buy order ---
+    max_price = st.number_input("Max price (followers)", 1, 1000, 50, key="mk_bid_price")
+    if st.button(f"Place Buy Order for {item}"):
+        _after_trade(player, place_buy_order(username, item, max_price), (FILLED, OPEN))
+
+    # --- My open orders ---
+    my_listings, my_orders = get_my_orders(username)
+    if my_listings or my_orders:
+        st.divider()
+        st.write("Your open orders:")
+    for listing in my_listings:
+        if st.button(f"Cancel listing: {listing.item} ({listing.price})", key=f"mk_cancel_l{listing.id}"):
+            _after_trade(player, cancel_listing(listing.id, username), (CANCELLED,))
+    for order in my_orders:
+        if st.button(f"Cancel bid: {order.item} (up to {order.max_price})", key=f"mk_cancel_b{order.id}"):
+            _after_trade(player, cancel_buy_order(order.id, username), (CANCELLED,))
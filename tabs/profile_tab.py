@@ -1,14 +1,16 @@
 # profile_tab.py - Profile Display
-# Version: v0.003
+# Version: v0.004
 # Notes:
+# - Inventory is an item bitmask (item_registry)
 # - Fixed unpacking issue (quests has 8 columns now)
 # - Uses object-style access for clarity
 
 import streamlit as st
 import time
 from db import get_quests
+from item_registry import to_names
 
-def render(username, energy, points, level, followers, wins, losses, clan, items, last_login):
+def render(username, energy, points, level, followers, wins, losses, clan, inventory, last_login):
     # ✅ Override with live session values if available
     energy = st.session_state.get("energy", energy)
     points = st.session_state.get("points", points)
@@ -16,7 +18,7 @@ def render(username, energy, points, level, followers, wins, losses, clan, items
     level = st.session_state.get("level", level)
     wins = st.session_state.get("wins", wins)
     losses = st.session_state.get("losses", losses)
-    items = st.session_state.get("items", items)
+    inventory = st.session_state.get("inventory", inventory)
     clan = st.session_state.get("clan", clan)
     last_login = st.session_state.get("last_login", last_login)
 
@@ -35,6 +37,7 @@ def render(username, energy, points, level, followers, wins, losses, clan, items
     total_battles = wins + losses
     win_rate = round((wins / total_battles) * 100, 1) if total_battles > 0 else 0
     st.write(f"**Clan:** {clan}")
+    items = to_names(inventory)
     st.write(f"**Inventory:** {', '.join(items) if items else 'No items'}")
     st.write(f"**Battles Fought:** {total_battles} (Win Rate: {win_rate}%)")
 
@@ -1,65 +1,73 @@
 # pvp_tab.py - PvP Battles
-# Version: v0.002
+# Version: v0.008
 # Notes:
 # - Updated to handle structured PvP results from game_logic
 # - Displays battle messages cleanly
 # - Updates energy, points, followers, wins, losses
+# - Items passed as inventory bitmasks; opponent rows read by column name
+# - Arena is an st.fragment: picking an enemy / attacking reruns only the arena;
+#   state comes from / is saved through st.session_state.player_state
+# - Battles emit game_events.PvpBattleFought -> battle quests advance (quest_engine)
+# - Opponents come from matchmaking.py (other clan, nearest points) instead of the top-20 leaderboard;
+#   the chosen opponent's row is read fresh when attacking
+# - Attacks go through db.resolve_pvp: both rows locked, the defender really loses the stolen followers,
+#   the attacker's counters come back from the DB (mark_applied) instead of being saved as session deltas
+# - Energy re-derived on every arena rerun (PlayerState.refresh_energy), not frozen at the last full rerun
 
-import streamlit as st, json
-from db import get_leaderboard, add_battle
-from game_logic import pvp_battle, safe_items
+import streamlit as st
+from db import resolve_pvp, unit_of_work
+from matchmaking import find_opponents
+from query_stats import track_rerun
+from game_events import collect
+from .fragment_utils import save_player, apply_quest_rewards
 
-def render(username, clan, energy, points, followers, items, wins, losses):
+def render(username, clan):
     st.subheader("🥊 PvP Battles")
+    arena(username, clan)
 
-    # --- Get possible opponents ---
-    all_players = get_leaderboard("points")
-    # st.write("DEBUG: Players in DB →", all_players)
 
-    opponents = [p for p in all_players if p[0] != username and p[-1] != clan]
+@st.fragment
+def arena(username, clan):
+    player = st.session_state.player_state
+    player.refresh_energy()
+    with unit_of_work(), track_rerun(f"{username}:pvp"):
+        _arena(username, clan, player)
 
-    if opponents:
-        opponent_choice = st.selectbox("Choose an enemy:", [p[0] for p in opponents])
-
-        if st.button("⚔️ Attack! (Cost: 3 Energy)"):
-            if energy >= 3:
-                # Load opponent stats
-                opp_row = [p for p in all_players if p[0] == opponent_choice][0]
-                opponent = {
-                    "username": opp_row[0],
-                    "points": opp_row[2],
-                    "followers": opp_row[3],
-                    "items": safe_items(opp_row[4]),
-                }
-                attacker = {
-                    "username": username,
-                    "points": points,
-                    "followers": followers,
-                    "items": safe_items(items),
-                }
 
-                # Run battle
-                outcome, result = pvp_battle(attacker, opponent)
-                energy -= 3
+def _arena(username, clan, player):
+    # --- Get possible opponents (other clan, close in points) ---
+    # kept until asked for new ones, so the selectbox choice survives the attack rerun
+    if st.button("🔄 Find new enemies") or "pvp_opponents" not in st.session_state:
+        st.session_state.pvp_opponents = find_opponents(username, clan, player.points)
+    opponents = st.session_state.pvp_opponents
 
-                if outcome == "win":
-                    followers += result["followers_gain"]
-                    points += result["points_gain"]
-                    wins += 1
-                    add_battle(username, opponent_choice, "win",
-                               result["followers_gain"], result["points_gain"])
-                    st.success(result["message"])
+    if opponents:
+        points_of = {name: points for name, _, points in opponents}
+        opponent_choice = st.selectbox("Choose an enemy:", list(points_of),
+                                       format_func=lambda name: f"{name} ({points_of[name]} pts)")
+        st.caption(f"⚡ Energy: {player.energy} | 🏆 {player.wins}W / {player.losses}L")
 
-                else:  # lose
-                    points -= result["points_loss"]
-                    losses += 1
-                    add_battle(username, opponent_choice, "lose", 0, -result["points_loss"])
-                    st.error(result["message"])
+        if st.button("⚔️ Attack! (Cost: 3 Energy)"):
+            if player.energy >= 3:
+                # fought on both players' current rows, written to both in one transaction
+                with collect() as batch:
+                    battle = resolve_pvp(username, opponent_choice)
+                if battle is None:
+                    st.warning("⚠️ That player is gone, pick another enemy.")
+                else:
+                    outcome, result, row = battle
+                    player.mark_applied(points=row.points, followers=row.followers,
+                                        wins=row.wins, losses=row.losses)
+                    player.energy -= 3
+                    if outcome == "win":
+                        st.success(result["message"])
+                    else:
+                        st.error(result["message"])
+                    apply_quest_rewards(player, batch)
+                    save_player(player)
 
             else:
                 st.warning("⚠️ Not enough energy for PvP!")
 
     else:
         st.info("No enemies available!")
-
-    return energy, points, followers, wins, losses
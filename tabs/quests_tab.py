@@ -1,19 +1,41 @@
 # quests_tab.py - Daily Quests System
-# Version: v0.005
+# Version: v0.011
 # Notes:
+# - Saves through session PlayerState (only changed fields, keeps items/wins intact)
 # - Quests vary by level (Battle, Meme, Debate, Boss)
 # - Banner shows how many quests left to unlock next level
 # - Rewards = Followers (scales by level) + Credibility Points (per quest type)
+# - Quest board is an st.fragment: a quest click reruns only the board, not the whole app
+#   (state comes from / is saved through st.session_state.player_state)
+# - Read-only for quest sets: jobs.py daily-quests generates them for everyone (new players get theirs on signup)
+# - Rows read by column name (quests gained quest_day); reward column is text, cast before adding
+# - Quest buttons emit game_events.QuestWorked; quest_engine advances + pays out in the DB
+#   (memes, debates, PvP and boss hits count automatically wherever they happen)
+# - Energy re-derived on every board rerun (PlayerState.refresh_energy), not frozen at the last full rerun
+# - Unused quest-generation imports dropped (the board only reads)
 
 import streamlit as st
-from db import (
-    get_quests, update_quest_progress, complete_quest, 
-    generate_daily_quests, reset_user_quests, update_player
-)
-import time
+from db import get_quests, unit_of_work
+from query_stats import track_rerun
+from game_events import collect, emit, QuestWorked
+from quest_engine import QUEST_POINTS
+from .fragment_utils import rerun_fragment, save_player, apply_quest_rewards
 
-def render(username, followers, level, energy, points):
+def render(username, level):
     st.header("🎯 Daily Quests")
+    quest_board(username, level)
+
+
+@st.fragment
+def quest_board(username, level):
+    player = st.session_state.player_state
+    player.refresh_energy()
+    with unit_of_work(), track_rerun(f"{username}:quests"):
+        _quest_board(username, level, player)
+
+
+def _quest_board(username, level, player):
+    st.caption(f"⚡ Energy: {player.energy} | 👥 Followers: {player.followers} | ⭐ Points: {player.points}")
 
     # --- Admin Reset Button ---
     # if st.button("🔄 Reset My Quests (Admin Only)"):
@@ -22,11 +44,10 @@ def render(username, followers, level, energy, points):
     #     st.success("✅ Quests have been reset!")
     #     st.rerun()
 
-    # --- Ensure quests exist ---
     quests = get_quests(username)
     if not quests:
-        generate_daily_quests(username, level)
-        quests = get_quests(username)
+        st.info("🕛 Today's quests are being prepared, check back in a moment!")
+        return
 
     # --- Banner: how many quests left ---
     incomplete = sum(1 for q in quests if not q.completed)
@@ -35,7 +56,8 @@ def render(username, followers, level, energy, points):
 
     # --- Quest loop ---
     for q in quests:
-        qid, q_username, qtype, prog, goal, reward, completed, ts = q
+        qid, qtype, prog, goal, completed = q.id, q.quest_type, q.progress, q.goal, q.completed
+        reward = int(q.reward)
 
         # Display progress
         st.markdown(f"**{qtype.capitalize()} Quest** — {prog}/{goal} complete")
@@ -48,46 +70,32 @@ def render(username, followers, level, energy, points):
             if qtype == "battle":
                 btn_label = f"⚔️ Battle Quest (-3 Energy)"
                 cost = 3
-                points_gain = 5
             elif qtype == "meme":
                 btn_label = f"📢 Post Meme (-1 Energy)"
                 cost = 1
-                points_gain = 2
             elif qtype == "debate":
                 btn_label = f"🗣️ Debate Globie (-2 Energy)"
                 cost = 2
-                points_gain = 3
             elif qtype == "boss":
                 btn_label = f"👹 Boss Fight (-5 Energy)"
                 cost = 5
-                points_gain = 10
             else:
                 btn_label = f"🌀 Do Quest"
                 cost = 1
-                points_gain = 1
+            st.caption(f"Reward: {reward} Followers + {QUEST_POINTS.get(qtype, 1)} Points")
 
             # Quest button
             if st.button(btn_label, key=f"quest_{qid}"):
-                if energy < cost:
+                if player.energy < cost:
                     st.warning("⚠️ Not enough energy!")
                 else:
-                    # Deduct energy & progress
-                    energy -= cost
-                    prog += 1
-
-                    if prog >= goal:
-                        complete_quest(qid)
-                        followers += reward
-                        points += points_gain
-                        st.success(f"🎉 Quest Completed! +{reward} Followers, +{points_gain} Points")
-                    else:
-                        update_quest_progress(qid, prog, 0)
-                        st.info(f"Progress updated: {prog}/{goal}")
-
-                    # Save stats
-                    update_player(username, energy, points, level, followers, "[]", 0, 0)
-
-                    # Force refresh so UI updates without double click
-                    st.rerun()
+                    # Deduct energy; progress (and any reward) is settled by quest_engine
+                    player.energy -= cost
+                    with collect() as batch:
+                        emit(QuestWorked(username, kind=qtype))
+                    if not apply_quest_rewards(player, batch):
+                        st.toast(f"Progress updated: {min(prog + 1, goal)}/{goal}")
 
-    return followers, energy, points
+                    save_player(player)
+                    # Redraw just the board with the new progress
+                    rerun_fragment()
@@ -1,31 +1,42 @@
 # tabs/shop_tab.py - Shop Tab UI
-# Version: v0.002
+# Version: v0.004
 # Notes:
 # - Safe handling of items list
 # - Integrated with shop.py
+# - Inventory is an item bitmask (item_registry); buys/upgrades are bit operations
+# - Shop is an st.fragment (no queries on a buy, just the PlayerState save)
 
 import streamlit as st
 from shop import shop_items, buy_item, upgrade_item, upgrade_paths
-import json
+from item_registry import to_mask, to_names
+from db import unit_of_work
+from query_stats import track_rerun
+from .fragment_utils import rerun_fragment, save_player
 
-def render(followers, items):
+def render():
     st.subheader("🛒 Item Shop")
+    shop_counter()
 
-    # Normalize items
-    if isinstance(items, str):
-        try:
-            items = json.loads(items)
-        except:
-            items = []
-    elif not isinstance(items, list):
-        items = []
+
+@st.fragment
+def shop_counter():
+    player = st.session_state.player_state
+    with unit_of_work(), track_rerun(f"{player.username}:shop"):
+        _shop_counter(player)
+
+
+def _shop_counter(player):
+    st.caption(f"👥 Followers: {player.followers}")
 
     # --- Buy Section ---
     for item, data in shop_items.items():
         if st.button(f"Buy {item} ({data['cost']} followers)", key=f"buy_{item}"):
-            followers, items, msg = buy_item(item, followers, items)
+            followers, inventory, msg = buy_item(item, player.followers, to_mask(player.inventory))
             if "✅" in msg:
-                st.success(msg)
+                player.update(followers=followers, inventory=inventory)
+                save_player(player)
+                st.toast(msg)
+                rerun_fragment()
             else:
                 st.warning(msg)
 
@@ -33,6 +44,7 @@ def render(followers, items):
     st.subheader("🔧 Upgrade Items")
 
     # --- Upgrade Section ---
+    items = to_names(player.inventory)
     if items:
         upgrade_choice = st.selectbox("Choose item to upgrade", items, key="upgrade_choice")
         if upgrade_choice in upgrade_paths:
@@ -40,14 +52,15 @@ def render(followers, items):
             cost = upgrade_paths[upgrade_choice]["cost"]
             st.write(f"➡️ Upgrade {upgrade_choice} → {target} ({cost} followers)")
             if st.button(f"Upgrade {upgrade_choice}", key=f"upgrade_{upgrade_choice}"):
-                followers, items, msg = upgrade_item(upgrade_choice, followers, items)
+                followers, inventory, msg = upgrade_item(upgrade_choice, player.followers, to_mask(player.inventory))
                 if "✨" in msg:
-                    st.success(msg)
+                    player.update(followers=followers, inventory=inventory)
+                    save_player(player)
+                    st.toast(msg)
+                    rerun_fragment()
                 else:
                     st.warning(msg)
         else:
             st.info("This item cannot be upgraded.")
     else:
         st.info("No items available to upgrade.")
-
-    return followers, items
@@ -18,8 +18,8 @@ def render(username=None, energy=None, points=None, followers=None, items=None,
         Current points value (if needed).
     followers : int
         Current follower count (if needed).
-    items : list
-        Player's inventory (if needed).
+    items : int
+        Player's inventory bitmask (if needed, see item_registry).
     kwargs : dict
         Any other arguments you want to pass.
 